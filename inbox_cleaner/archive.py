@@ -0,0 +1,138 @@
+import hashlib
+import mmap
+import re
+from collections.abc import Iterator
+from pathlib import Path
+
+_SEPARATOR_RE = re.compile(rb"\n\r?\n(From )")
+_QUOTED_FROM_RE = re.compile(rb"^>(>*From )", re.MULTILINE)
+
+# Maildir flags follow ":2," (or "!2," where ":" is not allowed in file names)
+_MAILDIR_INFO_RE = re.compile(r"[:!]2,.*$")
+
+
+def maildir_key(name: str) -> int:
+    """Stable key for a Maildir file: a 56-bit hash of its unique name part.
+
+    Flags after ":2," change as mail is read or moved from new/ to cur/, so
+    they are left out.
+    """
+    unique = _MAILDIR_INFO_RE.sub("", name)
+    return int.from_bytes(hashlib.blake2b(unique.encode(), digest_size=7).digest(), "big")
+
+
+def index_mbox(buf: bytes | mmap.mmap) -> list[tuple[int, int]]:
+    """(start, end) byte spans of each message in an mbox, without its "From " line.
+
+    A separator is a "From " line after a blank line (or at the start of the
+    file), so unescaped "From " at the start of a body paragraph after text
+    on the previous line does not split a message. LF and CRLF line endings
+    are both recognised.
+    """
+    # Each separator line starts at group 1; the message before it ends
+    # after the first newline of the match
+    seps = [(m.start() + 1, m.start(1)) for m in _SEPARATOR_RE.finditer(buf)]
+    if buf[:5] == b"From ":
+        seps.insert(0, (0, 0))
+    spans: list[tuple[int, int]] = []
+    for i, (_, line) in enumerate(seps):
+        start = buf.find(b"\n", line)
+        if start == -1:
+            break
+        start += 1
+        end = seps[i + 1][0] if i + 1 < len(seps) else len(buf)
+        if end > start:
+            spans.append((start, end))
+    return spans
+
+
+def unescape_mbox(raw: bytes) -> bytes:
+    """Undo mboxrd quoting: ">From " at a line start loses one ">"."""
+    return _QUOTED_FROM_RE.sub(rb"\1", raw) if b">From " in raw else raw
+
+
+def header_text(raw: bytes) -> str:
+    """The header block of a raw message, as IMAP BODY[HEADER] would return it."""
+    for sep in (b"\r\n\r\n", b"\n\n"):
+        end = raw.find(sep)
+        if end != -1:
+            return raw[:end + len(sep)].decode("utf-8", errors="replace")
+    return raw.decode("utf-8", errors="replace")
+
+
+class MboxArchive:
+    """Messages of an mbox file, read through a memory map.
+
+    The file is indexed once by scanning for "From " separator lines; each
+    message is keyed by its byte offset, which stays stable when mail is
+    appended to the file.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map: mmap.mmap | None = None
+        self.spans: list[tuple[int, int]] = []
+        if self.path.stat().st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.spans = index_mbox(self._map)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __iter__(self) -> Iterator[tuple[int, bytes]]:
+        for start, end in self.spans:
+            assert self._map is not None
+            yield start, unescape_mbox(self._map[start:end])
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "MboxArchive":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+class MaildirArchive:
+    """Messages of a Maildir (cur/ and new/) in file-name order, keyed by maildir_key().
+
+    Keys depend only on each file's unique name, so they survive deletions,
+    new deliveries and flag changes.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.files = sorted(
+            (f for sub in ("cur", "new") if (self.path / sub).is_dir() for f in (self.path / sub).iterdir()),
+            key=lambda f: f.name,
+        )
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self) -> Iterator[tuple[int, bytes]]:
+        for f in self.files:
+            yield maildir_key(f.name), f.read_bytes()
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "MaildirArchive":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def open_archive(path: str | Path) -> MboxArchive | MaildirArchive:
+    """Open a Maildir directory or an mbox file."""
+    path = Path(path)
+    if path.is_dir():
+        if not ((path / "cur").is_dir() or (path / "new").is_dir()):
+            raise ValueError(f"{path} is a directory but not a Maildir (no cur/ or new/)")
+        return MaildirArchive(path)
+    return MboxArchive(path)
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+from .db import SeenStore
+from .imap_client import ImapSession
+
+
+class Backfill:
+    """Walks a mailbox backwards in fixed date windows, newest first.
+
+    Completed windows are stored per UIDVALIDITY, so each run resumes just
+    below the oldest finished window. The backfill is over once nothing
+    older than that window is left in the mailbox.
+    """
+
+    def __init__(
+        self,
+        imap: ImapSession,
+        store: SeenStore,
+        uidvalidity: str,
+        window_days: int = 7,
+        today: date | None = None,
+    ) -> None:
+        self.imap = imap
+        self.store = store
+        self.uidvalidity = uidvalidity
+        self.window = timedelta(days=window_days)
+        self.today = today or date.today()
+
+    @property
+    def started(self) -> bool:
+        return self.store.oldest_backfill_since(self.uidvalidity) is not None
+
+    def next_window(self) -> tuple[date, date] | None:
+        """The next [since, before) window to process, or None when done."""
+        oldest = self.store.oldest_backfill_since(self.uidvalidity)
+        if oldest is None:
+            # First window ends tomorrow so that today's mail is included
+            before = self.today + timedelta(days=1)
+        else:
+            before = date.fromisoformat(oldest)
+            if not self.imap.search_dates(before=before):
+                return None
+        return before - self.window, before
+
+    def search(self, window: tuple[date, date]) -> list[int]:
+        """UIDs in the window, newest first."""
+        return sorted(self.imap.search_dates(*window), reverse=True)
+
+    def complete(self, window: tuple[date, date], messages: int) -> None:
+        since, before = window
+        self.store.add_backfill_window(self.uidvalidity, since.isoformat(), before.isoformat(), messages)
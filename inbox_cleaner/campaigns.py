@@ -0,0 +1,118 @@
+import hashlib
+import re
+from datetime import UTC, datetime, timedelta
+
+from .db import SeenStore
+
+BITS = 64
+# Eight 8-bit bands: two fingerprints within Hamming distance 7 always share
+# at least one band exactly (pigeonhole), so band lookups find every match
+# for any max distance below BANDS.
+BANDS = 8
+BAND_BITS = BITS // BANDS
+SHINGLE = 3
+MIN_FEATURES = 8
+# Only the start of a message is fingerprinted; this bounds the
+# per-message cost without losing the template text.
+FINGERPRINT_CHARS = 20000
+
+_DROP_BLOCK_RE = re.compile(r"<(style|script)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_DIGIT_RE = re.compile(r"\d")
+
+
+def simhash(text: str) -> int | None:
+    """64-bit SimHash of word 3-shingles; None if the text is too short to compare."""
+    text = _TAG_RE.sub(" ", _DROP_BLOCK_RE.sub(" ", text[:FINGERPRINT_CHARS]))
+    # Order numbers, prices and tracking IDs vary per recipient
+    tokens = _TOKEN_RE.findall(_DIGIT_RE.sub("0", text.lower()))
+    features = {" ".join(tokens[i:i + SHINGLE]) for i in range(len(tokens) - SHINGLE + 1)}
+    if len(features) < MIN_FEATURES:
+        return None
+
+    weights = [0] * BITS
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for bit, set_ in enumerate(reversed(format(h, "064b"))):
+            weights[bit] += 1 if set_ == "1" else -1
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def bands(fingerprint: int) -> list[int]:
+    """LSH band keys: each band's bits, tagged with the band number."""
+    mask = (1 << BAND_BITS) - 1
+    return [(i << BAND_BITS) | ((fingerprint >> (i * BAND_BITS)) & mask) for i in range(BANDS)]
+
+
+def order_by_cluster(keys: dict[int, tuple[str, int | None]], max_distance: int) -> list[int]:
+    """Order a batch so one representative per near-duplicate cluster comes first.
+
+    `keys` maps UID -> (sender domain, SimHash). Clusters are formed greedily in
+    the order of `keys` within each domain; representatives are returned first, then the
+    remaining members, so members find their representative's verdict in the
+    index instead of being scored themselves.
+    """
+    leaders: dict[str, list[int]] = {}
+    first: list[int] = []
+    rest: list[int] = []
+    for uid, (domain, fp) in keys.items():
+        if fp is None or not domain:
+            first.append(uid)
+            continue
+        if any(hamming(fp, other) <= max_distance for other in leaders.get(domain, [])):
+            rest.append(uid)
+        else:
+            leaders.setdefault(domain, []).append(fp)
+            first.append(uid)
+    return first + rest
+
+
+class CampaignIndex:
+    """Verdict cache keyed by (sender domain, SimHash), persisted in the state DB."""
+
+    def __init__(self, store: SeenStore, max_distance: int = 5, ttl_days: int = 14) -> None:
+        self.store = store
+        # Beyond BANDS - 1 the band lookup could miss matches
+        self.max_distance = min(max_distance, BANDS - 1)
+        self.ttl_days = ttl_days
+        self.hits = 0
+
+    def lookup(self, domain: str, fingerprint: int | None) -> dict[str, object] | None:
+        """Closest already-classified message from the same domain, if near enough."""
+        if fingerprint is None or not domain:
+            return None
+        since = (datetime.now(UTC) - timedelta(days=self.ttl_days)).isoformat()
+        best: dict[str, object] | None = None
+        best_distance = self.max_distance + 1
+        for candidate in self.store.find_campaigns(domain, bands(fingerprint), since):
+            distance = hamming(fingerprint, candidate["simhash"])
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        if best is not None:
+            self.hits += 1
+        return best
+
+    def add(
+        self,
+        domain: str,
+        fingerprint: int | None,
+        uid: int,
+        rspamd_result: dict[str, object],
+        llm_label: str,
+    ) -> None:
+        if fingerprint is None or not domain:
+            return
+        self.store.add_campaign(
+            domain,
+            fingerprint,
+            bands(fingerprint),
+            uid,
+            float(rspamd_result.get("score", 0.0)),
+            str(rspamd_result.get("action") or ""),
+            llm_label,
+        )
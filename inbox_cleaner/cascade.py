@@ -0,0 +1,202 @@
+import re
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from .config import Settings
+from .resilience import Backoff, CircuitOpenError, call, get_breaker
+
+LLM_BACKOFF = Backoff(base=1.0, cap=8.0, attempts=2)
+
+# A fraction ("0.92", ".75") or a percentage ("92", "92%"); a sentence's
+# closing period may follow
+_CONFIDENCE_RE = re.compile(r"(?<![\d.])(\d+(?:\.\d+)?|\.\d+)(%?)(?!\d)(?!\.\d)")
+
+
+def parse_label(out: str) -> tuple[str, float]:
+    """Map a model answer like "promotional 0.92" to (label, confidence).
+
+    A missing confidence counts as 0.0 so the answer escalates.
+    """
+    out = out.strip().lower()
+    if "spam" in out:
+        label = "spam"
+    elif "promo" in out:
+        label = "promotional"
+    else:
+        label = "normal"
+    match = _CONFIDENCE_RE.search(out)
+    if not match:
+        return label, 0.0
+    confidence = float(match.group(1))
+    if match.group(2) or confidence > 1:
+        confidence /= 100
+    return label, confidence if confidence <= 1 else 0.0
+
+
+@dataclass
+class TierStats:
+    calls: int = 0
+    escalations: int = 0
+    failures: int = 0
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+
+def cached_tokens(details: object) -> int:
+    """Prompt tokens served from the provider's cache, found in usage details.
+
+    OpenAI-style APIs (OpenRouter included) report
+    prompt_tokens_details.cached_tokens; Anthropic reports
+    cache_read_input_tokens.
+    """
+    if not isinstance(details, dict):
+        return 0
+    total = 0
+    for key, value in details.items():
+        if key in ("cached_tokens", "cache_read_input_tokens") and isinstance(value, int):
+            total += value
+        elif isinstance(value, dict):
+            total += cached_tokens(value)
+    return total
+
+
+class Cascade:
+    """Route each prompt through models from cheapest to most capable.
+
+    Every tier but the last answers first; its label stands unless its
+    confidence is below `min_confidence` or the label is in `escalate_labels`,
+    in which case the next tier is asked. A tier that fails or whose circuit
+    is open is skipped. The last tier's answer is always final.
+    """
+
+    def __init__(
+        self,
+        model_ids: list[str],
+        min_confidence: float = 0.8,
+        escalate_labels: tuple[str, ...] = ("spam",),
+        get_model: Callable[[str], object] | None = None,
+    ) -> None:
+        if not model_ids:
+            raise ValueError("Cascade needs at least one model")
+        self.model_ids = model_ids
+        self.min_confidence = min_confidence
+        self.escalate_labels = escalate_labels
+        self._get_model = get_model
+        self.stats = {model_id: TierStats() for model_id in model_ids}
+        # (model, tokens in, tokens out, cached) per call of the last classify()
+        self.last_calls: list[tuple[str, int, int, int]] = []
+
+    def _model(self, model_id: str) -> object:
+        if self._get_model is None:
+            import llm
+
+            self._get_model = llm.get_model
+        return self._get_model(model_id)
+
+    def _ask(self, model_id: str, prompt: str, system: str) -> str:
+        stats = self.stats[model_id]
+        start = time.perf_counter()
+        response = self._model(model_id).prompt(prompt, system=system, temperature=0.0)
+        text = response.text()
+        stats.latency += time.perf_counter() - start
+        stats.calls += 1
+        usage = response.usage()
+        call_usage = (model_id, usage.input or 0, usage.output or 0, cached_tokens(usage.details))
+        stats.input_tokens += call_usage[1]
+        stats.output_tokens += call_usage[2]
+        stats.cached_tokens += call_usage[3]
+        self.last_calls.append(call_usage)
+        return text
+
+    def classify(self, prompt: str, system: str) -> str:
+        import llm
+
+        self.last_calls = []
+        last = len(self.model_ids) - 1
+        for i, model_id in enumerate(self.model_ids):
+            breaker = get_breaker(f"llm:{model_id}")
+            ask = lambda model_id=model_id: self._ask(model_id, prompt, system)  # noqa: E731
+            if i < last:
+                # Cheap tiers get one shot; the next tier is the retry
+                try:
+                    out = call(
+                        breaker, ask,
+                        retry_on=(Exception,),
+                        fatal=(llm.errors.NeedsKeyException,),
+                        backoff=Backoff(attempts=1),
+                    )
+                except llm.errors.NeedsKeyException:
+                    raise
+                except Exception:
+                    self.stats[model_id].failures += 1
+                    continue
+                label, confidence = parse_label(out)
+                if confidence >= self.min_confidence and label not in self.escalate_labels:
+                    return label
+                self.stats[model_id].escalations += 1
+                continue
+
+            def _fallback(exc: BaseException, model_id: str = model_id) -> str:
+                self.stats[model_id].failures += 1
+                # An open circuit already announced the outage; stay quiet per message
+                if not isinstance(exc, CircuitOpenError):
+                    print(f"\nWARNING: Failed to classify email: {exc}", file=sys.stderr)
+                    print("Defaulting to 'normal' classification.", file=sys.stderr)
+                return "normal"
+
+            out = call(
+                breaker, ask,
+                retry_on=(Exception,),
+                fatal=(llm.errors.NeedsKeyException,),
+                backoff=LLM_BACKOFF,
+                fallback=_fallback,
+            )
+            return parse_label(out)[0]
+        raise AssertionError("unreachable: the last tier always answers")
+
+    def summary(self) -> list[str]:
+        lines = []
+        for model_id, s in self.stats.items():
+            if not (s.calls or s.failures):
+                continue
+            avg_ms = s.latency / s.calls * 1000 if s.calls else 0.0
+            rate = s.escalations / s.calls * 100 if s.calls else 0.0
+            line = (
+                f"{model_id}: {s.calls} call(s), avg {avg_ms:.0f} ms, "
+                f"{s.input_tokens} in / {s.output_tokens} out tokens"
+            )
+            if s.calls:
+                line += f" (avg {s.input_tokens // s.calls} in per call)"
+            if s.cached_tokens:
+                line += f", {s.cached_tokens / s.input_tokens * 100:.0f}% of input cached"
+            if model_id != self.model_ids[-1]:
+                line += f", {rate:.0f}% escalated"
+            if s.failures:
+                line += f", {s.failures} failed"
+            lines.append(line)
+        return lines
+
+    def stats_rows(self) -> list[tuple[str, int, int, int, int, float, int, int, int]]:
+        """(model, tier, calls, escalations, failures, latency ms, tokens in, tokens out, cached)."""
+        return [
+            (
+                model_id, tier, s.calls, s.escalations, s.failures,
+                s.latency * 1000, s.input_tokens, s.output_tokens, s.cached_tokens,
+            )
+            for tier, (model_id, s) in enumerate(self.stats.items())
+            if s.calls or s.failures
+        ]
+
+
+def cascade_from_settings(settings: Settings) -> Cascade:
+    """Build the routing cascade from LLM_CASCADE, falling back to LLM_MODEL alone."""
+    model_ids = list(settings.llm_cascade) or [settings.llm_model]
+    return Cascade(
+        model_ids,
+        min_confidence=settings.llm_cascade_min_confidence,
+        escalate_labels=settings.llm_cascade_escalate,
+    )
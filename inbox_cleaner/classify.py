@@ -1,95 +1,106 @@
-import os
+import re
 import sys
-import llm
-from email import message_from_bytes
-from email.message import Message
-from dotenv import load_dotenv
-
-load_dotenv()
-
-
-LLM_MODEL = os.getenv("LLM_MODEL", "openrouter/google/gemini-2.5-flash")
-# Max tokens to send (Gemini 2.5 Flash supports 1,048,576 tokens)
-# Observed ratio from production: ~1.4 chars per token for email content
-# Target ~800K tokens to leave headroom for prompt overhead (250K token buffer)
-MAX_CHARS = int(os.getenv("LLM_MAX_CHARS", "1120000"))  # ~800k tokens * 1.4 chars/token
-
-def _extract_text_content(msg: Message) -> str:
-    """Extract only text content from email, excluding attachments."""
-    text_parts: list[str] = []
-
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition", ""))
-
-            # Skip attachments (identified by Content-Disposition: attachment)
-            if "attachment" in content_disposition.lower():
-                continue
-
-            # Only extract text/plain and text/html parts
-            if content_type in ("text/plain", "text/html"):
-                try:
-                    payload = part.get_payload(decode=True)
-                    if isinstance(payload, bytes):
-                        charset = part.get_content_charset() or "utf-8"
-                        text_parts.append(payload.decode(charset, errors="replace"))
-                except Exception:
-                    pass
-    else:
-        # Non-multipart message - just get the payload
-        try:
-            payload = msg.get_payload(decode=True)
-            if isinstance(payload, bytes):
-                charset = msg.get_content_charset() or "utf-8"
-                text_parts.append(payload.decode(charset, errors="replace"))
-        except Exception:
-            pass
-
-    return "\n\n".join(text_parts)
-
-def classify_message(headers_text: str, raw_email: bytes) -> str:
+from email.parser import HeaderParser
+from functools import lru_cache
+
+from . import profiling
+from .config import load_settings
+from .cascade import Cascade, cascade_from_settings
+from .parsing import decode_email_header, extract_text
+
+SYSTEM_PROMPT = "Classify emails for triage using minimal tokens."
+
+# Fixed for every message and sent first, so providers that cache prompt
+# prefixes can reuse it; everything message-specific follows.
+INSTRUCTIONS = (
+    "You are an email triage classifier. "
+    "Return exactly one of: spam, promotional, or normal. "
+    "Rules: newsletters/ads/sales = promotional; political/phishing/scam/junk = spam; valid personal or work = normal.\n"
+    "Answer with only the single label followed by your confidence from 0 to 1, "
+    "e.g. \"promotional 0.9\".\n"
+)
+
+# Headers that say who sent a message and how; Received, ARC-*, DKIM-Signature
+# and most X-* chains are long and tell the model nothing.
+KEEP_HEADERS = (
+    "From", "Sender", "Reply-To", "To", "Return-Path", "Date", "List-Id",
+    "List-Unsubscribe", "List-Unsubscribe-Post", "Precedence", "Auto-Submitted",
+    "Feedback-ID", "Content-Type",
+)
+HEADER_VALUE_CHARS = 200
+
+_AUTH_RESULT_RE = re.compile(r"\b(spf|dkim|dmarc|arc)=([a-z]+)", re.IGNORECASE)
+
+
+def summarize_headers(headers_text: str) -> str:
+    """Reduce a header block to the headers useful for triage.
+
+    Keeps KEEP_HEADERS (decoded, unfolded and truncated) in that order and
+    condenses Authentication-Results to its spf/dkim/dmarc/arc verdicts.
+    """
+    msg = HeaderParser().parsestr(headers_text, headersonly=True)
+    lines = []
+    for name in KEEP_HEADERS:
+        for value in msg.get_all(name, []):
+            value = " ".join(decode_email_header(str(value)).split())
+            lines.append(f"{name}: {value[:HEADER_VALUE_CHARS]}")
+    verdicts: dict[str, str] = {}
+    for value in msg.get_all("Authentication-Results", []):
+        for method, result in _AUTH_RESULT_RE.findall(str(value)):
+            verdicts.setdefault(method.lower(), result.lower())
+    if verdicts:
+        lines.append("Authentication-Results: " + " ".join(f"{m}={r}" for m, r in verdicts.items()))
+    return "\n".join(lines)
+
+
+def build_prompt(subject: str, headers_text: str, body: str) -> str:
+    return f"{INSTRUCTIONS}Headers:\n{summarize_headers(headers_text)}\nSubject: {subject}\nBody:\n{body}"
+
+
+@lru_cache(maxsize=1)
+def default_cascade() -> Cascade:
+    return cascade_from_settings(load_settings())
+
+
+def classify_message(
+    headers_text: str,
+    raw_email: bytes,
+    model_name: str | None = None,
+    max_chars: int | None = None,
+    cascade: Cascade | None = None,
+    text: str | None = None,
+    subject: str | None = None,
+) -> str:
     """
     Classify email using text content only (excluding attachments)
-    Uses llm package which supports multiple providers
+    Uses llm package which supports multiple providers; `cascade` routes the
+    prompt from cheap to capable models (default: LLM_CASCADE or LLM_MODEL).
+    Pass `text` and `subject` when the message was already parsed (see
+    parsing.ParsedMessage); otherwise the subject is decoded from `headers_text`.
     """
-    subject = ""
-    for line in headers_text.splitlines():
-        if line.lower().startswith("subject:"):
-            subject = line.split(":", 1)[1].strip()
-            break
+    # llm pulls in its whole plugin system; only pay for it once a
+    # message actually needs classification.
+    import llm
 
-    # Parse email and extract only text content (no attachments)
-    try:
-        msg = message_from_bytes(raw_email)
-        full_content = _extract_text_content(msg)
-    except Exception:
-        # Fallback to raw decoding if parsing fails
-        full_content = raw_email[:MAX_CHARS].decode("utf-8", errors="replace")
-
-    # Truncate to MAX_CHARS after extraction
-    full_content = full_content[:MAX_CHARS]
-
-    prompt = (
-        "You are an email triage classifier. "
-        "Return exactly one of: spam, promotional, or normal. "
-        "Rules: newsletters/ads/sales = promotional; political/phishing/scam/junk = spam; valid personal or work = normal.\n"
-        f"Subject: {subject}\n"
-        "Headers:\n"
-        f"{headers_text}\n"
-        "Full email body:\n"
-        f"{full_content}\n"
-        "Answer with only the single label."
-    )
+    settings = load_settings()
+    if cascade is None:
+        cascade = Cascade([model_name]) if model_name else default_cascade()
+    max_chars = max_chars or settings.llm_max_chars
+
+    if subject is None:
+        msg = HeaderParser().parsestr(headers_text, headersonly=True)
+        subject = decode_email_header(str(msg.get("Subject", "")))
+    subject = " ".join(subject.split())
+
+    if text is None:
+        with profiling.stage("extract"):
+            text = extract_text(raw_email, max_chars)
+    with profiling.stage("prompt"):
+        prompt = build_prompt(subject, headers_text, text[:max_chars])
 
     try:
-        model = llm.get_model(LLM_MODEL)
-        response = model.prompt(
-            prompt,
-            system="Classify emails for triage using minimal tokens.",
-            temperature=0.0,
-        )
-        out = response.text().strip().lower()
+        with profiling.stage("llm"):
+            label = cascade.classify(prompt, system=SYSTEM_PROMPT)
     except llm.errors.NeedsKeyException as e:
         print(f"\nERROR: {e}", file=sys.stderr)
         print("\nTo set up your API key, run:", file=sys.stderr)
@@ -99,13 +110,8 @@ def classify_message(headers_text: str, raw_email: bytes) -> str:
         print("\nGet your API key from: https://openrouter.ai/keys", file=sys.stderr)
         print("\nOr use Ollama for local inference:", file=sys.stderr)
         sys.exit(1)
-    except Exception as e:
-        print(f"\nWARNING: Failed to classify email: {e}", file=sys.stderr)
-        print("Defaulting to 'normal' classification.", file=sys.stderr)
-        return "normal"
-
-    if "spam" in out:
-        return "spam"
-    if "promo" in out:
-        return "promotional"
-    return "normal"
+
+    for model_id, tokens_in, tokens_out, cached in cascade.last_calls:
+        line = f"  ↳ LLM {model_id}: {tokens_in} in / {tokens_out} out tokens"
+        print(line + (f" ({cached} cached)" if cached else ""))
+    return label
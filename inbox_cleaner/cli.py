@@ -1,71 +1,35 @@
 #!/usr/bin/env python3
 
-import os
-import re
 import sys
 import argparse
-from dotenv import load_dotenv
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import TYPE_CHECKING
+from pathlib import Path
+from . import profiling
+from .config import Settings, load_settings
 from .imap_client import ImapSession
 from .db import SeenStore
+from .progress import Checkpoint, RunBudget
+from .backfill import Backfill
+from .resilience import degraded_report, total_fallbacks
+from .campaigns import CampaignIndex, order_by_cluster
+from .recovery import recover_uidvalidity_change
 from .rspamd import check_message
+from .cascade import Cascade, cascade_from_settings
 from .classify import classify_message
-from email import message_from_bytes
-from email.header import decode_header
-
-# Load .env file from current directory or parent directories
-load_dotenv()
-
-IMAP_HOST = os.getenv("IMAP_HOST", "imap.mail.yahoo.com")
-IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
-YAHOO_EMAIL = os.getenv("YAHOO_EMAIL")
-YAHOO_APP_PASSWORD = os.getenv("YAHOO_APP_PASSWORD")
-MAILBOX = os.getenv("MAILBOX", "INBOX")
-DEST_FOLDER = os.getenv("DEST_FOLDER", "Promotional")
-TRASH_FOLDER = os.getenv("TRASH_FOLDER", "Bulk Mail")
-SQLITE_PATH = os.getenv("SQLITE_PATH", "./state.sqlite")
-RSPAMD_URL = os.getenv("RSPAMD_URL", "http://127.0.0.1:11333/checkv2")
-RSPAMD_SPAM_SCORE = float(os.getenv("RSPAMD_SPAM_SCORE", "6.0"))
-RSPAMD_TRASH_SCORE = float(os.getenv("RSPAMD_TRASH_SCORE", "7.0"))
-INTERACTIVE = os.getenv("INTERACTIVE", "true").lower() in ("true", "1", "yes")
-HISTORY_WEIGHT = float(os.getenv("HISTORY_WEIGHT", "0.3"))
-HISTORY_MIN_SAMPLES = int(os.getenv("HISTORY_MIN_SAMPLES", "3"))
-
-def decode_email_header(header_value: str) -> str:
-    """Decode email header value (handles encoded headers)"""
-    if not header_value:
-        return ""
-    decoded_parts = decode_header(header_value)
-    result = []
-    for content, encoding in decoded_parts:
-        if isinstance(content, bytes):
-            # Handle unknown or invalid encodings
-            if encoding and encoding.lower() not in ('unknown-8bit', 'unknown'):
-                try:
-                    result.append(content.decode(encoding, errors='replace'))
-                except (LookupError, UnicodeDecodeError):
-                    # Fall back to utf-8 if encoding is invalid
-                    result.append(content.decode('utf-8', errors='replace'))
-            else:
-                # Default to utf-8 for unknown encodings
-                result.append(content.decode('utf-8', errors='replace'))
-        else:
-            result.append(content)
-    return ''.join(result)
-
-def extract_email_info(raw_email: bytes) -> tuple[str, str]:
-    """Extract subject and from fields from raw email"""
-    msg = message_from_bytes(raw_email)
-    subject = decode_email_header(msg.get('Subject', '(No Subject)'))
-    from_addr = decode_email_header(msg.get('From', '(Unknown)'))
-    return subject, from_addr
-
-def extract_domain(from_addr: str) -> str:
-    """Extract domain from email address (e.g., 'Name <user@example.com>' -> 'example.com')"""
-    # Handle formats: "Name <email@domain.com>" or "email@domain.com"
-    match = re.search(r'[\w\.-]+@([\w\.-]+)', from_addr)
-    if match:
-        return match.group(1).lower()
-    return ""
+from .feedback import RspamdFeedback
+from .history import SenderHistory
+if TYPE_CHECKING:
+    from .embeddings import EmbeddingIndex
+from .parsing import (  # noqa: F401 - helpers re-exported for existing callers
+    ParsedMessage,
+    ParsePool,
+    decode_email_header,
+    extract_domain,
+    extract_email_info,
+    parse_message,
+)
 
 def calculate_historical_bias(domain_history: dict[str, int], min_samples: int = 3) -> dict[str, float] | None:
     """Calculate historical action percentages for a domain"""
@@ -161,7 +125,15 @@ def get_action_display(action: str) -> str:
     else:
         return "KEEP"
 
-def prompt_user(subject: str, from_addr: str, rspamd_score: float, llm_label: str, recommended_action: str, domain_history: dict[str, int] | None = None) -> str:
+def prompt_user(
+    subject: str,
+    from_addr: str,
+    rspamd_score: float,
+    llm_label: str,
+    recommended_action: str,
+    domain_history: dict[str, int] | None = None,
+    history_min_samples: int = 3,
+) -> str:
     """Show email info and prompt user for action"""
     print("\n" + "="*80)
     print(f"From: {from_addr}")
@@ -174,7 +146,7 @@ def prompt_user(subject: str, from_addr: str, rspamd_score: float, llm_label: st
     # Show historical information if available
     if domain_history:
         total = sum(domain_history.values())
-        if total >= HISTORY_MIN_SAMPLES:
+        if total >= history_min_samples:
             trash_pct = int(domain_history.get("trash", 0) / total * 100)
             promo_pct = int(domain_history.get("promotional", 0) / total * 100)
             keep_pct = int(domain_history.get("skip", 0) / total * 100)
@@ -211,6 +183,403 @@ def prompt_user(subject: str, from_addr: str, rspamd_score: float, llm_label: st
             print("\nInterrupted by user")
             sys.exit(0)
 
+def fetch_batch(imap: ImapSession, uids: list[int], failed: list[int]) -> dict[int, tuple[bytes, str]]:
+    """Fetch raw message and headers for each UID; UIDs that fail go to `failed`."""
+    batch: dict[int, tuple[bytes, str]] = {}
+    for uid in uids:
+        try:
+            batch[uid] = (imap.fetch_rfc822(uid), imap.fetch_headers(uid))
+        except Exception as e:
+            print(f"  WARNING: Failed to fetch UID {uid}: {e}", file=sys.stderr)
+            failed.append(uid)
+    return batch
+
+def open_embedding_index(settings: Settings, store: SeenStore) -> "EmbeddingIndex | None":
+    """The nearest-neighbour label index, if EMBEDDING_MODEL is set and NumPy is installed."""
+    if not settings.embedding_model:
+        return None
+    try:
+        from .embeddings import EmbeddingIndex
+    except ImportError:
+        print(
+            "  WARNING: EMBEDDING_MODEL is set but NumPy is not installed "
+            "(pip install 'inbox-cleaner[embeddings]'); classifying without neighbours.",
+            file=sys.stderr,
+        )
+        return None
+    return EmbeddingIndex(
+        settings.embedding_index_path or f"{settings.sqlite_path}.vectors",
+        store,
+        settings.embedding_model,
+        k=settings.embedding_k,
+        min_similarity=settings.embedding_min_similarity,
+        max_chars=settings.embedding_max_chars,
+    )
+
+@dataclass(frozen=True)
+class Pipeline:
+    """The collaborators one run shares across every message it analyzes."""
+
+    store: SeenStore
+    settings: Settings
+    campaigns: CampaignIndex | None = None
+    cascade: Cascade | None = None
+    feedback: RspamdFeedback | None = None
+    knn: "EmbeddingIndex | None" = None
+    history: SenderHistory | None = None
+
+def process_uids(
+    imap: ImapSession,
+    pipeline: Pipeline,
+    uidvalidity: str,
+    uids: list[int],
+    interactive: bool,
+    checkpoint: Checkpoint,
+    budget: RunBudget,
+    done: list[int],
+    failed: list[int],
+    parser: ParsePool,
+) -> bool:
+    """Process `uids` in the given order, batch by batch.
+
+    Successful UIDs go to `done` and the checkpoint, failures to `failed`.
+    Returns False if the run budget stopped processing before the end.
+    """
+    settings, campaigns, knn = pipeline.settings, pipeline.campaigns, pipeline.knn
+    for start in range(0, len(uids), settings.batch_size):
+        if budget.exhausted():
+            return False
+        with profiling.stage("fetch"):
+            batch = fetch_batch(imap, uids[start:start + settings.batch_size], failed)
+        with profiling.stage("parse"):
+            parsed = parser.parse({uid: raw for uid, (raw, _) in batch.items()}, failed)
+        # One representative per near-duplicate cluster is scored first;
+        # the rest then inherit its verdict from the campaign index
+        order = (
+            order_by_cluster({uid: (p.domain, p.simhash) for uid, p in parsed.items()}, campaigns.max_distance)
+            if campaigns else list(parsed)
+        )
+        vectors, proposals = knn.lookup(parsed) if knn else ({}, {})
+        try:
+            for uid in order:
+                if budget.exhausted():
+                    return False
+                budget.spend()
+                profiling.tick()
+                raw, hdr = batch[uid]
+                try:
+                    final_action = process_message(
+                        imap, pipeline, uidvalidity, uid, raw, hdr, interactive,
+                        parsed=parsed[uid], proposal=proposals.get(uid),
+                    )
+                except Exception as e:
+                    # Leave a gap in the checkpoint; the next run retries just this UID
+                    print(f"  WARNING: Failed to process UID {uid}: {e}", file=sys.stderr)
+                    failed.append(uid)
+                    continue
+                with profiling.stage("db"):
+                    checkpoint.complete(uid)
+                done.append(uid)
+                if knn and uid in vectors:
+                    knn.add(parsed[uid].message_id or parsed[uid].fingerprint, vectors[uid], final_action)
+        finally:
+            if knn:
+                knn.flush()
+    return True
+
+def analyze_message(
+    pipeline: Pipeline,
+    uid: int,
+    raw: bytes,
+    hdr: str,
+    parsed: ParsedMessage,
+    proposal: tuple[str, float] | None = None,
+) -> tuple[dict, str, str, dict[str, int]]:
+    """Score one message with Rspamd/LLM and history.
+
+    `proposal` is a (label, similarity) from the embedding index; when given
+    it stands in for the LLM. Returns (Rspamd result, LLM label, recommended
+    action, domain history).
+    """
+    settings, campaigns, history = pipeline.settings, pipeline.campaigns, pipeline.history
+    # Get historical actions for the sender, from the in-memory table when loaded
+    domain = parsed.domain
+    if history is not None:
+        domain_history = history.lookup(parsed.from_addr, settings.history_min_samples)
+    else:
+        domain_history = pipeline.store.get_domain_history(domain) if domain else {}
+
+    # Reuse the analysis of a near-identical message from the same campaign
+    cached = campaigns.lookup(domain, parsed.simhash) if campaigns else None
+    if cached:
+        rsp = {"score": cached["score"], "action": cached["action"]}
+        llm = str(cached["llm_label"])
+        print(f"  ↳ Near-duplicate of an earlier email from {domain}; reusing its analysis")
+    else:
+        # Get analysis
+        fallbacks = total_fallbacks()
+        with profiling.stage("rspamd"):
+            rsp = check_message(settings.rspamd_url, raw)
+        if proposal:
+            llm = proposal[0]
+            print(f"  ↳ Close to labeled mail (similarity {proposal[1]:.2f}); labeling it {llm} without the LLM")
+        else:
+            llm = classify_message(
+                hdr, raw, max_chars=settings.llm_max_chars, cascade=pipeline.cascade, text=parsed.text,
+                subject=parsed.subject,
+            )
+        # Never let a degraded default stand in for a whole campaign
+        if campaigns and total_fallbacks() == fallbacks:
+            campaigns.add(domain, parsed.simhash, uid, rsp, llm)
+
+    # Decide recommended action with history
+    recommended = decide_action(
+        rsp,
+        llm,
+        settings.rspamd_spam_score,
+        settings.rspamd_trash_score,
+        domain_history=domain_history,
+        history_weight=settings.history_weight,
+        history_min_samples=settings.history_min_samples,
+    )
+    return rsp, llm, recommended, domain_history
+
+def process_message(
+    imap: ImapSession,
+    pipeline: Pipeline,
+    uidvalidity: str,
+    uid: int,
+    raw: bytes,
+    hdr: str,
+    interactive: bool,
+    parsed: ParsedMessage | None = None,
+    proposal: tuple[str, float] | None = None,
+) -> str:
+    """Run one message through Rspamd/LLM/decision, act on it and record it."""
+    settings = pipeline.settings
+    # Extract email info for display
+    if parsed is None:
+        parsed = parse_message(raw, settings.llm_max_chars)
+    subject, from_addr = parsed.subject, parsed.from_addr
+
+    rsp, llm, recommended, domain_history = analyze_message(pipeline, uid, raw, hdr, parsed, proposal=proposal)
+    rspamd_score = rsp.get('score', 0.0)
+
+    # Interactive mode: ask user
+    if interactive:
+        final_action = prompt_user(
+            subject, from_addr, rspamd_score, llm, recommended,
+            domain_history, settings.history_min_samples,
+        )
+        mode = "interactive"
+    else:
+        # Auto mode: use recommended action and show what we're doing
+        final_action = recommended
+        mode = "auto"
+        print(f"\n{subject[:60]}... → {get_action_display(recommended)}", flush=True)
+
+    # Execute action
+    if final_action == "promotional":
+        imap.move_to_folder(uid, settings.dest_folder)
+        print(f"✓ Moved to {settings.dest_folder}")
+    elif final_action == "trash":
+        imap.move_to_folder(uid, settings.trash_folder)
+        print(f"✓ Moved to {settings.trash_folder}")
+    else:  # skip/keep
+        print("✓ Kept in inbox")
+
+    # Record action to database
+    with profiling.stage("db"):
+        pipeline.store.record_action(
+            uidvalidity=uidvalidity,
+            uid=uid,
+            from_addr=from_addr,
+            subject=subject,
+            rspamd_score=rspamd_score,
+            llm_label=llm,
+            recommended_action=recommended,
+            final_action=final_action,
+            mode=mode,
+            message_id=parsed.message_id,
+            fingerprint=parsed.fingerprint,
+        )
+    if pipeline.history is not None:
+        pipeline.history.record(from_addr, final_action)
+
+    # Teach Rspamd from confirmed (or, with RSPAMD_LEARN=all, automatic) decisions
+    if pipeline.feedback and (interactive or settings.rspamd_learn == "all"):
+        pipeline.feedback.submit(parsed.message_id or parsed.fingerprint, raw, final_action)
+
+    return final_action
+
+def run_compact(settings: Settings, args: argparse.Namespace) -> None:
+    """Compact the state DB and write a compressed snapshot (or delta)."""
+    from .snapshot import compact_store, write_delta, write_snapshot
+
+    store = SeenStore(settings.sqlite_path)
+    if args.delta:
+        out = args.output or f"{settings.sqlite_path}.delta.json.gz"
+        rows = write_delta(store, out)
+        print(f"Wrote delta with {rows} changed action(s) to {out}")
+        return
+
+    retention_days = args.retention_days if args.retention_days is not None else settings.state_retention_days
+    removed = compact_store(store, retention_days, settings.campaign_ttl_days)
+    print(f"Rolled {removed} action(s) older than {retention_days} day(s) into domain aggregates.")
+    knn = open_embedding_index(settings, store)
+    if knn:
+        print(f"Dropped {knn.compact()} stale row(s) from the embedding index ({len(knn)} kept).")
+    out = args.output or f"{settings.sqlite_path}.gz"
+    size = write_snapshot(store, out)
+    print(f"Wrote snapshot to {out} ({size / 1024:.1f} KiB)")
+
+def run_restore(settings: Settings, args: argparse.Namespace) -> None:
+    """Rebuild the state DB from a snapshot plus any deltas."""
+    from .snapshot import restore
+
+    restore(args.snapshot, settings.sqlite_path, args.deltas)
+    print(f"Restored {settings.sqlite_path} from {args.snapshot}"
+          + (f" + {len(args.deltas)} delta(s)" if args.deltas else ""))
+
+def run_embed(settings: Settings, args: argparse.Namespace) -> None:
+    """Embed recorded actions that have no vector yet, newest first."""
+    from .embeddings import embedding_text
+
+    store = SeenStore(settings.sqlite_path)
+    knn = open_embedding_index(settings, store)
+    if knn is None:
+        print("Set EMBEDDING_MODEL (and install NumPy) to build the embedding index.", file=sys.stderr)
+        sys.exit(1)
+    added = 0
+    while added < args.limit:
+        rows = store.unembedded_actions(min(settings.batch_size, args.limit - added))
+        if not rows:
+            break
+        # Only sender and subject are stored for past actions; such rows are
+        # matched against the same fields of new mail, not its full text
+        vectors = knn.embed([
+            embedding_text(from_addr, subject, "", knn.max_chars) for _, from_addr, subject, _ in rows
+        ])
+        if vectors is None:
+            break
+        before = len(knn)
+        for (key, _, _, action), vector in zip(rows, vectors):
+            knn.add(key, vector, action, headers_only=True)
+        knn.flush()
+        if len(knn) == before:
+            break
+        added += len(rows)
+    print(f"Embedded {added} recorded action(s); the index holds {len(knn)} labeled email(s).")
+
+def run_ingest(settings: Settings, args: argparse.Namespace) -> None:
+    """Classify an mbox/Maildir export offline; record results and/or write a CSV report."""
+    import csv
+    from collections import Counter
+    from pathlib import Path
+    from .archive import header_text, open_archive
+
+    store = SeenStore(settings.sqlite_path)
+    # Archive messages live under their own pseudo-UIDVALIDITY, one per archive
+    # path, keyed by byte offset (mbox) or file-name hash (Maildir)
+    source = f"archive:{Path(args.path).resolve()}"
+    record = not args.no_record
+    skip = store.recorded_uids(source) if record else set()
+    # The campaign index lives in the state DB, so a report-only run goes without it
+    campaigns = (
+        CampaignIndex(store, settings.campaign_max_distance, settings.campaign_ttl_days)
+        if settings.campaign_dedup and record else None
+    )
+    cascade = cascade_from_settings(settings)
+    parser = ParsePool(settings.parse_workers, settings.llm_max_chars)
+    knn = open_embedding_index(settings, store)
+    history = SenderHistory.load(store)
+    pipeline = Pipeline(store, settings, campaigns=campaigns, cascade=cascade, knn=knn, history=history)
+    budget = RunBudget(
+        args.time_budget if args.time_budget is not None else settings.run_time_budget,
+        args.max_messages if args.max_messages is not None else settings.run_message_budget,
+    )
+    report = open(args.report, "w", newline="", encoding="utf-8") if args.report else None
+    writer = csv.writer(report) if report else None
+    if writer:
+        writer.writerow(["key", "from", "subject", "rspamd_score", "llm_label", "recommended"])
+
+    actions: Counter[str] = Counter()
+    failed: list[int] = []
+
+    def classify_batch(batch: dict[int, bytes]) -> None:
+        with profiling.stage("parse"):
+            parsed = parser.parse(batch, failed)
+        order = (
+            order_by_cluster({key: (p.domain, p.simhash) for key, p in parsed.items()}, campaigns.max_distance)
+            if campaigns else list(parsed)
+        )
+        vectors, proposals = knn.lookup(parsed) if knn else ({}, {})
+        for key in order:
+            if budget.exhausted():
+                return
+            budget.spend()
+            profiling.tick()
+            p = parsed[key]
+            try:
+                rsp, llm, recommended, _ = analyze_message(
+                    pipeline, key, batch[key], header_text(batch[key]), p, proposal=proposals.get(key),
+                )
+            except Exception as e:
+                print(f"  WARNING: Failed to classify message {key}: {e}", file=sys.stderr)
+                failed.append(key)
+                continue
+            actions[recommended] += 1
+            if writer:
+                writer.writerow([key, p.from_addr, p.subject, rsp.get("score", 0.0), llm, recommended])
+            if record:
+                with profiling.stage("db"):
+                    store.record_action(
+                        uidvalidity=source, uid=key, from_addr=p.from_addr, subject=p.subject,
+                        rspamd_score=rsp.get("score", 0.0), llm_label=llm,
+                        recommended_action=recommended, final_action=recommended, mode="archive",
+                        message_id=p.message_id, fingerprint=p.fingerprint,
+                    )
+                history.record(p.from_addr, recommended)
+                if knn and key in vectors:
+                    knn.add(p.message_id or p.fingerprint, vectors[key], recommended)
+        if knn:
+            knn.flush()
+
+    try:
+        with open_archive(args.path) as archive:
+            print(f"Indexed {len(archive)} message(s) in {args.path}; {len(skip)} already recorded.")
+            batch: dict[int, bytes] = {}
+            for key, raw in archive:
+                if key in skip:
+                    continue
+                if budget.exhausted():
+                    break
+                batch[key] = raw
+                if len(batch) >= settings.batch_size:
+                    classify_batch(batch)
+                    batch = {}
+            if batch:
+                classify_batch(batch)
+    finally:
+        parser.close()
+        if report:
+            report.close()
+        if record:
+            store.record_llm_stats(cascade.stats_rows())
+
+    print(f"\nDone! Classified {sum(actions.values())} archived email(s): "
+          + ", ".join(f"{n} {action}" for action, n in sorted(actions.items())))
+    if failed:
+        print(f"{len(failed)} email(s) failed; run again to retry them.")
+    if budget.exhausted():
+        print("Run budget reached; run again to continue where this run stopped.")
+    if args.report:
+        print(f"Wrote report to {args.report}")
+    for line in cascade.summary():
+        print(f"LLM {line}")
+    if campaigns and campaigns.hits:
+        print(f"Reused {campaigns.hits} campaign verdict(s) instead of re-classifying.")
+
 def main() -> None:
     # Parse command-line arguments
     parser = argparse.ArgumentParser(
@@ -221,102 +590,231 @@ def main() -> None:
         action="store_true",
         help="Automatically apply recommended actions without prompting (overrides INTERACTIVE=true)"
     )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Work through the mailbox newest-first in date windows (automatic above BACKFILL_THRESHOLD pending)",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=int,
+        help="Stop cleanly after this many seconds (default: RUN_TIME_BUDGET)",
+    )
+    parser.add_argument(
+        "--max-messages",
+        type=int,
+        help="Stop cleanly after this many messages (default: RUN_MESSAGE_BUDGET)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile CPU and memory use of this run (see --profile-dir)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Where --profile writes its files (default: profile/ next to SQLITE_PATH)",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    compact_parser = subparsers.add_parser(
+        "compact",
+        help="Roll old actions into domain aggregates, VACUUM and write a compressed snapshot",
+    )
+    compact_parser.add_argument(
+        "--retention-days",
+        type=int,
+        help="Keep individual actions this many days (default: STATE_RETENTION_DAYS)",
+    )
+    compact_parser.add_argument(
+        "--output",
+        help="Snapshot path (default: SQLITE_PATH + .gz, or .delta.json.gz with --delta)",
+    )
+    compact_parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Only export rows changed since the last snapshot; skips compaction",
+    )
+    restore_parser = subparsers.add_parser(
+        "restore", help="Rebuild SQLITE_PATH from a snapshot and optional deltas",
+    )
+    restore_parser.add_argument("snapshot", help="Path to a .gz snapshot")
+    restore_parser.add_argument("deltas", nargs="*", help="Delta files to apply, oldest first")
+    embed_parser = subparsers.add_parser(
+        "embed", help="Embed past decisions from the state DB into the nearest-neighbour index",
+    )
+    embed_parser.add_argument("--limit", type=int, default=10000, help="Max actions to embed (default: 10000)")
+    ingest_parser = subparsers.add_parser(
+        "ingest",
+        help="Classify an mbox file or Maildir offline, seeding the history or writing a report",
+    )
+    ingest_parser.add_argument("path", help="mbox file or Maildir directory")
+    ingest_parser.add_argument("--report", help="Write one CSV row per classified message to this path")
+    ingest_parser.add_argument(
+        "--no-record",
+        action="store_true",
+        help="Do not record results in the state DB (report only)",
+    )
     args = parser.parse_args()
-
+    settings = load_settings()
+
+    if not args.profile:
+        run_command(settings, args)
+        return
+    out_dir = args.profile_dir or str(Path(settings.sqlite_path).parent / "profile")
+    from .profiling import Profiler
+
+    try:
+        with Profiler(out_dir, settings.profile_snapshot_every):
+            run_command(settings, args)
+    finally:
+        print(f"Wrote profile to {out_dir}")
+
+
+def run_command(settings: Settings, args: argparse.Namespace) -> None:
+    if args.command == "compact":
+        run_compact(settings, args)
+        return
+    if args.command == "restore":
+        run_restore(settings, args)
+        return
+    if args.command == "embed":
+        run_embed(settings, args)
+        return
+    if args.command == "ingest":
+        run_ingest(settings, args)
+        return
+    run_triage(settings, args)
+
+
+def run_triage(settings: Settings, args: argparse.Namespace) -> None:
     # Determine if interactive mode is enabled
-    interactive = INTERACTIVE and not args.auto
+    interactive = settings.interactive and not args.auto
 
-    if not (YAHOO_EMAIL and YAHOO_APP_PASSWORD):
+    if not (settings.yahoo_email and settings.yahoo_app_password):
         print("Missing YAHOO_EMAIL or YAHOO_APP_PASSWORD env vars.", file=sys.stderr)
         sys.exit(1)
 
-    store = SeenStore(SQLITE_PATH)
-    with ImapSession(IMAP_HOST, IMAP_PORT, YAHOO_EMAIL, YAHOO_APP_PASSWORD) as imap:
-        imap.select_mailbox(MAILBOX)
-        imap.ensure_folder(DEST_FOLDER)
-        imap.ensure_folder(TRASH_FOLDER)
-
-        uidvalidity = imap.get_uidvalidity(MAILBOX)
-        last_uid = store.get_last_uid(uidvalidity)
+    store = SeenStore(settings.sqlite_path)
+    with ImapSession(
+        settings.imap_host,
+        settings.imap_port,
+        settings.yahoo_email,
+        settings.yahoo_app_password,
+    ) as imap:
+        imap.select_mailbox(settings.mailbox)
+        imap.ensure_folder(settings.dest_folder)
+        imap.ensure_folder(settings.trash_folder)
+
+        uidvalidity = imap.get_uidvalidity(settings.mailbox)
+        checkpoint = Checkpoint(store, uidvalidity)
+
+        stale = store.stale_uidvalidities(uidvalidity, settings.mailbox)
+        store.set_mailbox(uidvalidity, settings.mailbox)
+        if stale:
+            print(f"UIDVALIDITY changed ({', '.join(stale)} → {uidvalidity}); matching already-processed mail...")
+            recovered = recover_uidvalidity_change(imap, store, checkpoint, stale)
+            print(f"Recognised {recovered} previously processed email(s).")
+
+        last_uid = checkpoint.watermark
 
         if last_uid > 0:
             print(f"Resuming from UID {last_uid} (progress saved from previous run).")
 
-        uids = imap.search_since_uid(last_uid)
-        if not uids:
+        # Anything above the watermark that is not yet done, including gaps
+        # left by messages that failed in an earlier run
+        pending = checkpoint.begin(imap.search_since_uid(last_uid), above=last_uid)
+
+        backfill = Backfill(imap, store, uidvalidity, settings.backfill_window_days)
+        threshold = settings.backfill_threshold
+        window = None
+        if args.backfill or backfill.started or (threshold and len(pending) > threshold):
+            window = backfill.next_window()
+        if not pending and window is None:
             print("No new emails.")
             return
 
-        print(f"Processing {len(uids)} email(s)...")
         if interactive:
             print("Interactive mode enabled. You will be prompted for each email.")
         else:
             print("Auto mode enabled. Applying recommended actions automatically.")
 
-        for uid in uids:
-            raw = imap.fetch_rfc822(uid)
-            hdr = imap.fetch_headers(uid)
-
-            # Extract email info for display
-            subject, from_addr = extract_email_info(raw)
-
-            # Extract domain and get historical actions
-            domain = extract_domain(from_addr)
-            domain_history = store.get_domain_history(domain) if domain else {}
-
-            # Get analysis
-            rsp = check_message(RSPAMD_URL, raw)
-            llm = classify_message(hdr, raw)
-            rspamd_score = rsp.get('score', 0.0)
-
-            # Decide recommended action with history
-            recommended = decide_action(
-                rsp,
-                llm,
-                RSPAMD_SPAM_SCORE,
-                RSPAMD_TRASH_SCORE,
-                domain_history=domain_history,
-                history_weight=HISTORY_WEIGHT,
-                history_min_samples=HISTORY_MIN_SAMPLES,
+        campaigns = (
+            CampaignIndex(store, settings.campaign_max_distance, settings.campaign_ttl_days)
+            if settings.campaign_dedup else None
+        )
+        cascade = cascade_from_settings(settings)
+        parser = ParsePool(settings.parse_workers, settings.llm_max_chars)
+        feedback = (
+            RspamdFeedback(
+                store, settings.rspamd_controller_url, settings.rspamd_controller_password,
+                settings.rspamd_fuzzy_flag,
+            )
+            if settings.rspamd_controller_url and settings.rspamd_learn != "off" else None
+        )
+        knn = open_embedding_index(settings, store)
+        # Whole sender history in memory; no per-message history queries
+        history = SenderHistory.load(store)
+        pipeline = Pipeline(
+            store, settings, campaigns=campaigns, cascade=cascade, feedback=feedback, knn=knn, history=history,
+        )
+        budget = RunBudget(
+            args.time_budget if args.time_budget is not None else settings.run_time_budget,
+            args.max_messages if args.max_messages is not None else settings.run_message_budget,
+        )
+        done: list[int] = []
+        failed: list[int] = []
+
+        def run(uids: list[int]) -> bool:
+            return process_uids(
+                imap, pipeline, uidvalidity, uids, interactive, checkpoint, budget, done, failed, parser,
             )
 
-            # Interactive mode: ask user
-            if interactive:
-                final_action = prompt_user(subject, from_addr, rspamd_score, llm, recommended, domain_history)
-                mode = "interactive"
+        try:
+            if window is None:
+                print(f"Processing {len(pending)} email(s)...")
+                run(pending)
             else:
-                # Auto mode: use recommended action and show what we're doing
-                final_action = recommended
-                mode = "auto"
-                print(f"\n{subject[:60]}... → {get_action_display(recommended)}", flush=True)
-
-            # Execute action
-            if final_action == "promotional":
-                imap.move_to_folder(uid, DEST_FOLDER)
-                print(f"✓ Moved to {DEST_FOLDER}")
-            elif final_action == "trash":
-                imap.move_to_folder(uid, TRASH_FOLDER)
-                print(f"✓ Moved to {TRASH_FOLDER}")
-            else:  # skip/keep
-                print("✓ Kept in inbox")
-
-            # Record action to database
-            store.record_action(
-                uidvalidity=uidvalidity,
-                uid=uid,
-                from_addr=from_addr,
-                subject=subject,
-                rspamd_score=rspamd_score,
-                llm_label=llm,
-                recommended_action=recommended,
-                final_action=final_action,
-                mode=mode,
+                if backfill.started:
+                    # Mail that arrived since the last run goes before the backlog
+                    fresh = [uid for uid in pending if uid > checkpoint.highest]
+                    if fresh:
+                        print(f"Processing {len(fresh)} new email(s) before resuming backfill...")
+                        run(sorted(fresh, reverse=True))
+                while window is not None and not budget.exhausted():
+                    since, before = window
+                    uids = checkpoint.begin(backfill.search(window))
+                    print(f"Backfill {since} to {before - timedelta(days=1)}: {len(uids)} email(s)")
+                    if not run(uids):
+                        break
+                    backfill.complete(window, len(uids))
+                    window = backfill.next_window()
+                if window is None:
+                    print("Backfill complete; later runs process new mail by UID.")
+        finally:
+            parser.close()
+            if feedback:
+                feedback.close()
+            checkpoint.flush()
+            store.record_llm_stats(cascade.stats_rows())
+
+        if budget.exhausted():
+            print("Run budget reached; the remaining emails will be processed next run.")
+        print(f"\nDone! Processed {len(done)} email(s).")
+        if failed:
+            print(f"{len(failed)} email(s) failed and will be retried next run.")
+        for line in cascade.summary():
+            print(f"LLM {line}")
+        if campaigns and campaigns.hits:
+            print(f"Reused {campaigns.hits} campaign verdict(s) instead of re-classifying.")
+        if feedback:
+            print(feedback.summary())
+        if knn:
+            print(f"Embedding index: {len(knn)} labeled email(s), {knn.proposed} label(s) proposed by neighbours.")
+        for name, counts in degraded_report().items():
+            print(
+                f"Degraded: {name} failed {counts['failures']} time(s), "
+                f"circuit opened {counts['trips']} time(s), "
+                f"{counts['fast_fails']} fast-fail(s), {counts['fallbacks']} default result(s)"
             )
 
-            # Always update progress
-            store.set_last_uid(uidvalidity, uid)
-
-        print(f"\nDone! Processed {len(uids)} email(s).")
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+import os
+from collections.abc import Mapping
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+def _env_bool(value: str) -> bool:
+    return value.strip().lower() in ("true", "1", "yes")
+
+
+def _env_list(value: str) -> tuple[str, ...]:
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Typed view of the environment, loaded once per process."""
+
+    imap_host: str = "imap.mail.yahoo.com"
+    imap_port: int = 993
+    yahoo_email: str | None = None
+    yahoo_app_password: str | None = None
+    mailbox: str = "INBOX"
+    dest_folder: str = "Promotional"
+    trash_folder: str = "Bulk Mail"
+    sqlite_path: str = "./state.sqlite"
+    rspamd_url: str = "http://127.0.0.1:11333/checkv2"
+    rspamd_spam_score: float = 6.0
+    rspamd_trash_score: float = 7.0
+    # Controller (usually port 11334) for learning from decisions; empty disables
+    rspamd_controller_url: str = ""
+    rspamd_controller_password: str | None = None
+    # Which decisions to learn from: off, interactive or all
+    rspamd_learn: str = "interactive"
+    # Fuzzy storage flag for trashed mail; 0 disables fuzzy-add
+    rspamd_fuzzy_flag: int = 1
+    interactive: bool = True
+    history_weight: float = 0.3
+    history_min_samples: int = 3
+    llm_model: str = "openrouter/google/gemini-2.5-flash"
+    # Max tokens to send (Gemini 2.5 Flash supports 1,048,576 tokens)
+    # Observed ratio from production: ~1.4 chars per token for email content
+    # Target ~800K tokens to leave headroom for prompt overhead (250K token buffer)
+    llm_max_chars: int = 1120000  # ~800k tokens * 1.4 chars/token
+    # Cheapest model first; empty means LLM_MODEL alone
+    llm_cascade: tuple[str, ...] = ()
+    llm_cascade_min_confidence: float = 0.8
+    llm_cascade_escalate: tuple[str, ...] = ("spam",)
+    # Embedding model for nearest-neighbour labels; empty disables
+    embedding_model: str = ""
+    # Vector matrix file; empty means SQLITE_PATH + .vectors
+    embedding_index_path: str = ""
+    embedding_k: int = 5
+    embedding_min_similarity: float = 0.92
+    embedding_max_chars: int = 2000
+    state_retention_days: int = 365
+    # Messages fetched and clustered together before scoring
+    batch_size: int = 50
+    campaign_dedup: bool = True
+    campaign_max_distance: int = 5
+    campaign_ttl_days: int = 14
+    # Worker processes for MIME parsing; 0 parses in the main process
+    parse_workers: int = 0
+    # Newest-first backfill kicks in above this many pending messages (0 = never)
+    backfill_threshold: int = 1000
+    backfill_window_days: int = 7
+    # Per-run limits; 0 means unlimited
+    run_time_budget: int = 0
+    run_message_budget: int = 0
+    # tracemalloc snapshot interval (messages) under --profile; 0 = end of run only
+    profile_snapshot_every: int = 500
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> "Settings":
+        """Build settings from an environment mapping, falling back to defaults."""
+        d = cls()
+        return cls(
+            imap_host=env.get("IMAP_HOST", d.imap_host),
+            imap_port=int(env.get("IMAP_PORT", d.imap_port)),
+            yahoo_email=env.get("YAHOO_EMAIL"),
+            yahoo_app_password=env.get("YAHOO_APP_PASSWORD"),
+            mailbox=env.get("MAILBOX", d.mailbox),
+            dest_folder=env.get("DEST_FOLDER", d.dest_folder),
+            trash_folder=env.get("TRASH_FOLDER", d.trash_folder),
+            sqlite_path=env.get("SQLITE_PATH", d.sqlite_path),
+            rspamd_url=env.get("RSPAMD_URL", d.rspamd_url),
+            rspamd_spam_score=float(env.get("RSPAMD_SPAM_SCORE", d.rspamd_spam_score)),
+            rspamd_trash_score=float(env.get("RSPAMD_TRASH_SCORE", d.rspamd_trash_score)),
+            rspamd_controller_url=env.get("RSPAMD_CONTROLLER_URL", d.rspamd_controller_url),
+            rspamd_controller_password=env.get("RSPAMD_CONTROLLER_PASSWORD"),
+            rspamd_learn=env.get("RSPAMD_LEARN", d.rspamd_learn).strip().lower(),
+            rspamd_fuzzy_flag=int(env.get("RSPAMD_FUZZY_FLAG", d.rspamd_fuzzy_flag)),
+            interactive=_env_bool(env.get("INTERACTIVE", "true")),
+            history_weight=float(env.get("HISTORY_WEIGHT", d.history_weight)),
+            history_min_samples=int(env.get("HISTORY_MIN_SAMPLES", d.history_min_samples)),
+            llm_model=env.get("LLM_MODEL", d.llm_model),
+            llm_max_chars=int(env.get("LLM_MAX_CHARS", d.llm_max_chars)),
+            llm_cascade=_env_list(env.get("LLM_CASCADE", "")),
+            llm_cascade_min_confidence=float(
+                env.get("LLM_CASCADE_MIN_CONFIDENCE", d.llm_cascade_min_confidence)
+            ),
+            llm_cascade_escalate=_env_list(
+                env.get("LLM_CASCADE_ESCALATE", ",".join(d.llm_cascade_escalate))
+            ),
+            embedding_model=env.get("EMBEDDING_MODEL", d.embedding_model),
+            embedding_index_path=env.get("EMBEDDING_INDEX_PATH", d.embedding_index_path),
+            embedding_k=int(env.get("EMBEDDING_K", d.embedding_k)),
+            embedding_min_similarity=float(
+                env.get("EMBEDDING_MIN_SIMILARITY", d.embedding_min_similarity)
+            ),
+            embedding_max_chars=int(env.get("EMBEDDING_MAX_CHARS", d.embedding_max_chars)),
+            state_retention_days=int(env.get("STATE_RETENTION_DAYS", d.state_retention_days)),
+            batch_size=int(env.get("BATCH_SIZE", d.batch_size)),
+            campaign_dedup=_env_bool(env.get("CAMPAIGN_DEDUP", "true")),
+            campaign_max_distance=int(env.get("CAMPAIGN_MAX_DISTANCE", d.campaign_max_distance)),
+            campaign_ttl_days=int(env.get("CAMPAIGN_TTL_DAYS", d.campaign_ttl_days)),
+            parse_workers=int(env.get("PARSE_WORKERS", d.parse_workers)),
+            backfill_threshold=int(env.get("BACKFILL_THRESHOLD", d.backfill_threshold)),
+            backfill_window_days=int(env.get("BACKFILL_WINDOW_DAYS", d.backfill_window_days)),
+            run_time_budget=int(env.get("RUN_TIME_BUDGET", d.run_time_budget)),
+            run_message_budget=int(env.get("RUN_MESSAGE_BUDGET", d.run_message_budget)),
+            profile_snapshot_every=int(env.get("PROFILE_SNAPSHOT_EVERY", d.profile_snapshot_every)),
+        )
+
+
+@lru_cache(maxsize=1)
+def load_settings() -> Settings:
+    """Load .env (once) and return the process-wide settings."""
+    # Imported here so that importing the package stays cheap
+    from dotenv import load_dotenv
+
+    # Load .env file from current directory or parent directories
+    load_dotenv()
+    return Settings.from_env(os.environ)
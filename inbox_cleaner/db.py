@@ -1,4 +1,5 @@
 import sqlite3
+from collections.abc import Callable
 from pathlib import Path
 from datetime import UTC, datetime
 
@@ -20,20 +21,165 @@ CREATE TABLE IF NOT EXISTS email_actions (
     recommended_action TEXT NOT NULL,
     final_action TEXT NOT NULL,
     mode TEXT NOT NULL,
+    message_id TEXT,
+    fingerprint TEXT,
     UNIQUE(uidvalidity, uid)
 );
 
 CREATE INDEX IF NOT EXISTS idx_processed_at ON email_actions(processed_at);
 CREATE INDEX IF NOT EXISTS idx_final_action ON email_actions(final_action);
 CREATE INDEX IF NOT EXISTS idx_from_addr ON email_actions(from_addr);
+
+-- Completed UID ranges (inclusive); progress.last_uid mirrors the contiguous
+-- watermark so older tooling keeps working
+-- Mailbox each UIDVALIDITY belongs to; a UIDVALIDITY reset is only assumed
+-- within one mailbox
+CREATE TABLE IF NOT EXISTS mailboxes (
+    uidvalidity TEXT PRIMARY KEY,
+    mailbox TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS uid_ranges (
+    uidvalidity TEXT NOT NULL,
+    start_uid INTEGER NOT NULL,
+    end_uid INTEGER NOT NULL,
+    PRIMARY KEY(uidvalidity, start_uid)
+);
+
+-- Date windows a newest-first backfill has fully processed: [since, before)
+CREATE TABLE IF NOT EXISTS backfill_windows (
+    uidvalidity TEXT NOT NULL,
+    since TEXT NOT NULL,
+    before TEXT NOT NULL,
+    messages INTEGER NOT NULL,
+    completed_at TEXT NOT NULL,
+    PRIMARY KEY(uidvalidity, since)
+);
+
+-- Per-domain action counts for email_actions rows rolled up by compaction
+CREATE TABLE IF NOT EXISTS domain_stats (
+    domain TEXT NOT NULL,
+    final_action TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY(domain, final_action)
+);
+
+-- Identities of kept mail whose email_actions rows were rolled up by
+-- compaction; still in the mailbox, so still needed by UIDVALIDITY recovery
+CREATE TABLE IF NOT EXISTS seen_identities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uidvalidity TEXT NOT NULL,
+    message_id TEXT,
+    fingerprint TEXT,
+    final_action TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_seen_message_id ON seen_identities(message_id);
+CREATE INDEX IF NOT EXISTS idx_seen_fingerprint ON seen_identities(fingerprint);
+
+-- Near-duplicate campaign index: SimHash per classified message
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    domain TEXT NOT NULL,
+    simhash INTEGER NOT NULL,
+    uid INTEGER,
+    rspamd_score REAL,
+    rspamd_action TEXT,
+    llm_label TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_campaign_created ON campaigns(created_at);
+
+-- LSH bands of each SimHash (band number in the high bits) for exact-match
+-- candidate lookup
+CREATE TABLE IF NOT EXISTS campaign_bands (
+    band INTEGER NOT NULL,
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    PRIMARY KEY(band, campaign_id)
+) WITHOUT ROWID;
+
+-- Messages already fed to Rspamd's learn endpoints (keyed by Message-ID or fingerprint)
+CREATE TABLE IF NOT EXISTS rspamd_learned (
+    message_key TEXT PRIMARY KEY,
+    verdict TEXT NOT NULL,
+    learned_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+-- Which message (and label) each row of the embedding matrix file holds
+CREATE TABLE IF NOT EXISTS embeddings (
+    row INTEGER PRIMARY KEY,
+    message_key TEXT NOT NULL UNIQUE,
+    label TEXT NOT NULL
+);
+
+-- Per-run, per-model LLM routing stats (tier 0 = cheapest)
+CREATE TABLE IF NOT EXISTS llm_stats (
+    run_at TEXT NOT NULL,
+    model TEXT NOT NULL,
+    tier INTEGER NOT NULL,
+    calls INTEGER NOT NULL,
+    escalations INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    PRIMARY KEY(run_at, model)
+);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+"""
+
+# Columns added after the first release: (table, column, type). Older
+# databases get them via ALTER TABLE on open.
+ADDED_COLUMNS = (
+    ("email_actions", "message_id", "TEXT"),
+    ("email_actions", "fingerprint", "TEXT"),
+    ("llm_stats", "cached_tokens", "INTEGER NOT NULL DEFAULT 0"),
+    # Rows seeded by `embed` from sender and subject only
+    ("embeddings", "headers_only", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Indexes on ADDED_COLUMNS, created once the columns are guaranteed to exist
+POST_MIGRATION = """
+CREATE INDEX IF NOT EXISTS idx_message_id ON email_actions(message_id);
+CREATE INDEX IF NOT EXISTS idx_fingerprint ON email_actions(fingerprint);
 """
 
+ACTION_COLUMNS = (
+    "uidvalidity", "uid", "processed_at", "from_addr", "subject", "rspamd_score",
+    "llm_label", "recommended_action", "final_action", "mode", "message_id",
+    "fingerprint",
+)
+
+def _to_signed64(value: int) -> int:
+    """SQLite integers are signed; store unsigned 64-bit hashes two's-complement."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
 class SeenStore:
     def __init__(self, path: str):
         Path(path).parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(path)
+        # Checkpoints may be flushed from worker threads; callers serialize access
+        self.conn = sqlite3.connect(path, check_same_thread=False)
         with self.conn:
             self.conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self) -> None:
+        for table, column, ddl_type in ADDED_COLUMNS:
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+        self.conn.executescript(POST_MIGRATION)
 
     def get_last_uid(self, uidvalidity: str) -> int:
         cur = self.conn.execute("SELECT last_uid FROM progress WHERE uidvalidity = ?", (uidvalidity,))
@@ -48,6 +194,193 @@ class SeenStore:
                 (uidvalidity, last_uid),
             )
 
+    def get_uid_ranges(self, uidvalidity: str) -> list[tuple[int, int]]:
+        """Completed UID ranges, falling back to the legacy last_uid watermark."""
+        cur = self.conn.execute(
+            "SELECT start_uid, end_uid FROM uid_ranges WHERE uidvalidity = ? ORDER BY start_uid",
+            (uidvalidity,),
+        )
+        ranges = [(row[0], row[1]) for row in cur.fetchall()]
+        if not ranges:
+            last_uid = self.get_last_uid(uidvalidity)
+            if last_uid > 0:
+                ranges = [(1, last_uid)]
+        return ranges
+
+    def set_uid_ranges(self, uidvalidity: str, ranges: list[tuple[int, int]]) -> None:
+        """Replace the completed ranges and update the contiguous watermark."""
+        watermark = ranges[0][1] if ranges and ranges[0][0] <= 1 else 0
+        with self.conn:
+            self.conn.execute("DELETE FROM uid_ranges WHERE uidvalidity = ?", (uidvalidity,))
+            self.conn.executemany(
+                "INSERT INTO uid_ranges(uidvalidity, start_uid, end_uid) VALUES(?,?,?)",
+                [(uidvalidity, start, end) for start, end in ranges],
+            )
+            self.conn.execute(
+                "INSERT INTO progress(uidvalidity,last_uid) VALUES(?,?) "
+                "ON CONFLICT(uidvalidity) DO UPDATE SET last_uid=excluded.last_uid",
+                (uidvalidity, watermark),
+            )
+
+    def update_uid_ranges(
+        self,
+        uidvalidity: str,
+        added: list[tuple[int, int]],
+        removed: list[tuple[int, int]],
+        watermark: int,
+    ) -> None:
+        """Apply a change to the completed ranges and set the contiguous watermark."""
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM uid_ranges WHERE uidvalidity = ? AND start_uid = ?",
+                [(uidvalidity, start) for start, _ in removed],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO uid_ranges(uidvalidity, start_uid, end_uid) VALUES(?,?,?)",
+                [(uidvalidity, start, end) for start, end in added],
+            )
+            self.conn.execute(
+                "INSERT INTO progress(uidvalidity,last_uid) VALUES(?,?) "
+                "ON CONFLICT(uidvalidity) DO UPDATE SET last_uid=excluded.last_uid",
+                (uidvalidity, watermark),
+            )
+
+    def add_backfill_window(self, uidvalidity: str, since: str, before: str, messages: int) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO backfill_windows(uidvalidity, since, before, messages, completed_at) "
+                "VALUES(?,?,?,?,?)",
+                (uidvalidity, since, before, messages, datetime.now(UTC).isoformat()),
+            )
+
+    def oldest_backfill_since(self, uidvalidity: str) -> str | None:
+        """Start date (ISO) of the oldest completed backfill window, if any."""
+        row = self.conn.execute(
+            "SELECT MIN(since) FROM backfill_windows WHERE uidvalidity = ?", (uidvalidity,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_mailbox(self, uidvalidity: str, mailbox: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO mailboxes(uidvalidity, mailbox) VALUES(?,?)", (uidvalidity, mailbox)
+            )
+
+    def mailbox_of(self, uidvalidity: str) -> str | None:
+        row = self.conn.execute("SELECT mailbox FROM mailboxes WHERE uidvalidity = ?", (uidvalidity,)).fetchone()
+        return row[0] if row else None
+
+    def stale_uidvalidities(self, uidvalidity: str, mailbox: str) -> list[str]:
+        """Earlier UIDVALIDITYs of `mailbox` with saved progress, if `uidvalidity` has none.
+
+        Progress saved before mailboxes were recorded counts too; other
+        mailboxes' UIDVALIDITYs never do.
+        """
+        if self.conn.execute(
+            "SELECT 1 FROM progress WHERE uidvalidity = ?", (uidvalidity,)
+        ).fetchone():
+            return []
+        cur = self.conn.execute(
+            """
+            SELECT p.uidvalidity FROM progress p
+            LEFT JOIN mailboxes m ON m.uidvalidity = p.uidvalidity
+            WHERE p.uidvalidity != ? AND (m.mailbox = ? OR m.mailbox IS NULL)
+            """,
+            (uidvalidity, mailbox),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def forget_uidvalidity(self, uidvalidity: str) -> None:
+        """Drop progress for a UIDVALIDITY the server no longer uses."""
+        with self.conn:
+            self.conn.execute("DELETE FROM progress WHERE uidvalidity = ?", (uidvalidity,))
+            self.conn.execute("DELETE FROM uid_ranges WHERE uidvalidity = ?", (uidvalidity,))
+            self.conn.execute("DELETE FROM backfill_windows WHERE uidvalidity = ?", (uidvalidity,))
+            self.conn.execute("DELETE FROM mailboxes WHERE uidvalidity = ?", (uidvalidity,))
+            self.conn.execute("DELETE FROM seen_identities WHERE uidvalidity = ?", (uidvalidity,))
+
+    def remap_seen(
+        self,
+        uidvalidity: str,
+        stale: list[str],
+        identities: dict[int, tuple[str | None, str]],
+    ) -> dict[int, str]:
+        """Move already-processed messages onto their new UIDs after a UIDVALIDITY change.
+
+        Only rows recorded under the `stale` UIDVALIDITYs are candidates, so
+        archive ingests and other mailboxes keep theirs. `identities` maps
+        each current UID to its (Message-ID, fingerprint). A stored row
+        matches on Message-ID when both sides have one, otherwise on
+        fingerprint. Messages whose rows were compacted away are matched
+        against seen_identities instead. Returns the matched UIDs, in order,
+        with the UIDVALIDITY each was matched from.
+        """
+        if not stale:
+            return {}
+        with self.conn:
+            self.conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS remap_lookup "
+                "(uid INTEGER PRIMARY KEY, message_id TEXT, fingerprint TEXT)"
+            )
+            self.conn.execute("DELETE FROM remap_lookup")
+            self.conn.executemany(
+                "INSERT INTO remap_lookup(uid, message_id, fingerprint) VALUES(?,?,?)",
+                [(uid, mid, fp) for uid, (mid, fp) in identities.items()],
+            )
+            # Newest row first so a message seen under several UIDVALIDITYs
+            # keeps its most recent decision
+            cur = self.conn.execute(
+                f"""
+                SELECT l.uid, a.id, a.uidvalidity
+                FROM remap_lookup l
+                JOIN email_actions a ON a.uidvalidity IN ({",".join("?" * len(stale))}) AND (
+                    (l.message_id IS NOT NULL AND a.message_id = l.message_id)
+                    OR ((l.message_id IS NULL OR a.message_id IS NULL)
+                        AND a.fingerprint = l.fingerprint)
+                )
+                ORDER BY a.processed_at DESC
+                """,
+                stale,
+            )
+            matches: dict[int, tuple[int, str]] = {}
+            used: set[int] = set()
+            for uid, action_id, old in cur.fetchall():
+                if uid not in matches and action_id not in used:
+                    matches[uid] = (action_id, old)
+                    used.add(action_id)
+            self.conn.executemany(
+                "UPDATE email_actions SET uidvalidity = ?, uid = ? WHERE id = ?",
+                [(uidvalidity, uid, action_id) for uid, (action_id, _) in matches.items()],
+            )
+            self.conn.executemany("DELETE FROM remap_lookup WHERE uid = ?", [(uid,) for uid in matches])
+
+            cur = self.conn.execute(
+                f"""
+                SELECT l.uid, s.id, s.uidvalidity
+                FROM remap_lookup l
+                JOIN seen_identities s ON s.uidvalidity IN ({",".join("?" * len(stale))}) AND (
+                    (l.message_id IS NOT NULL AND s.message_id = l.message_id)
+                    OR ((l.message_id IS NULL OR s.message_id IS NULL)
+                        AND s.fingerprint = l.fingerprint)
+                )
+                ORDER BY s.id DESC
+                """,
+                stale,
+            )
+            compacted: dict[int, tuple[int, str]] = {}
+            used = set()
+            for uid, seen_id, old in cur.fetchall():
+                if uid not in compacted and seen_id not in used:
+                    compacted[uid] = (seen_id, old)
+                    used.add(seen_id)
+            self.conn.executemany(
+                "UPDATE seen_identities SET uidvalidity = ? WHERE id = ?",
+                [(uidvalidity, seen_id) for seen_id, _ in compacted.values()],
+            )
+            self.conn.execute("DELETE FROM remap_lookup")
+        matches.update(compacted)
+        return {uid: matches[uid][1] for uid in sorted(matches)}
+
     def record_action(
         self,
         uidvalidity: str,
@@ -59,6 +392,8 @@ class SeenStore:
         recommended_action: str,
         final_action: str,
         mode: str,
+        message_id: str | None = None,
+        fingerprint: str | None = None,
     ) -> None:
         """Record email processing action to database"""
         with self.conn:
@@ -66,8 +401,9 @@ class SeenStore:
                 """
                 INSERT INTO email_actions
                 (uidvalidity, uid, processed_at, from_addr, subject, rspamd_score,
-                 llm_label, recommended_action, final_action, mode)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 llm_label, recommended_action, final_action, mode, message_id,
+                 fingerprint)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ON CONFLICT(uidvalidity, uid) DO UPDATE SET
                     processed_at=excluded.processed_at,
                     from_addr=excluded.from_addr,
@@ -76,7 +412,9 @@ class SeenStore:
                     llm_label=excluded.llm_label,
                     recommended_action=excluded.recommended_action,
                     final_action=excluded.final_action,
-                    mode=excluded.mode
+                    mode=excluded.mode,
+                    message_id=excluded.message_id,
+                    fingerprint=excluded.fingerprint
                 """,
                 (
                     uidvalidity,
@@ -89,9 +427,16 @@ class SeenStore:
                     recommended_action,
                     final_action,
                     mode,
+                    message_id,
+                    fingerprint,
                 ),
             )
 
+    def recorded_uids(self, uidvalidity: str) -> set[int]:
+        """UIDs (or archive keys) with a recorded action under `uidvalidity`."""
+        cur = self.conn.execute("SELECT uid FROM email_actions WHERE uidvalidity = ?", (uidvalidity,))
+        return {row[0] for row in cur.fetchall()}
+
     def get_domain_history(self, domain: str) -> dict[str, int]:
         """Get historical action counts for a specific domain"""
         if not domain:
@@ -99,12 +444,20 @@ class SeenStore:
 
         cur = self.conn.execute(
             """
-            SELECT final_action, COUNT(*) as count
-            FROM email_actions
-            WHERE from_addr LIKE ?
+            SELECT final_action, SUM(count) FROM (
+                SELECT final_action, COUNT(*) as count
+                FROM email_actions
+                WHERE from_addr LIKE ? OR from_addr LIKE ?
+                GROUP BY final_action
+                UNION ALL
+                SELECT final_action, count
+                FROM domain_stats
+                WHERE domain = ?
+            )
             GROUP BY final_action
             """,
-            (f"%@{domain}",),
+            # Bare address or "Name <user@domain>"
+            (f"%@{domain}", f"%@{domain}>", domain.lower()),
         )
 
         result = {}
@@ -112,3 +465,286 @@ class SeenStore:
             result[action] = count
 
         return result
+
+    def history_counts(self) -> tuple[list[tuple[str, str, int]], list[tuple[str, str, int]]]:
+        """All history in two queries: per-sender and rolled-up per-domain action counts."""
+        senders = self.conn.execute(
+            "SELECT from_addr, final_action, COUNT(*) FROM email_actions GROUP BY from_addr, final_action"
+        ).fetchall()
+        domains = self.conn.execute("SELECT domain, final_action, count FROM domain_stats").fetchall()
+        return senders, domains
+
+    def compact(self, cutoff: str, domain_of: Callable[[str], str]) -> int:
+        """Roll email_actions rows processed before `cutoff` into domain_stats.
+
+        Rolled-up rows are deleted; their per-domain counts keep feeding
+        get_domain_history. Mail that was kept in the mailbox leaves its
+        identity in seen_identities for UIDVALIDITY recovery. Rspamd learn
+        records older than `cutoff` go too unless a remaining row still
+        refers to the message. Returns the number of rows removed.
+        """
+        rows = self.conn.execute(
+            "SELECT id, from_addr, final_action FROM email_actions WHERE processed_at < ?",
+            (cutoff,),
+        ).fetchall()
+        counts: dict[tuple[str, str], int] = {}
+        for _, from_addr, final_action in rows:
+            domain = domain_of(from_addr or "")
+            if domain:
+                key = (domain, final_action)
+                counts[key] = counts.get(key, 0) + 1
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO domain_stats(domain, final_action, count) VALUES(?,?,?) "
+                "ON CONFLICT(domain, final_action) DO UPDATE SET count=count+excluded.count",
+                [(domain, action, n) for (domain, action), n in counts.items()],
+            )
+            self.conn.execute(
+                """
+                INSERT INTO seen_identities(uidvalidity, message_id, fingerprint, final_action)
+                SELECT uidvalidity, message_id, fingerprint, final_action FROM email_actions
+                WHERE processed_at < ? AND final_action IN ('skip', 'keep')
+                  AND uidvalidity NOT LIKE 'archive:%'
+                  AND (message_id IS NOT NULL OR fingerprint IS NOT NULL)
+                ORDER BY processed_at
+                """,
+                (cutoff,),
+            )
+            self.conn.executemany(
+                "DELETE FROM email_actions WHERE id = ?",
+                [(row[0],) for row in rows],
+            )
+            self.conn.execute(
+                """
+                DELETE FROM rspamd_learned
+                WHERE learned_at < ? AND message_key NOT IN (
+                    SELECT message_id FROM email_actions WHERE message_id IS NOT NULL
+                    UNION SELECT fingerprint FROM email_actions WHERE fingerprint IS NOT NULL
+                )
+                """,
+                (cutoff,),
+            )
+        return len(rows)
+
+    def add_campaign(
+        self,
+        domain: str,
+        simhash: int,
+        bands: list[int],
+        uid: int,
+        rspamd_score: float,
+        rspamd_action: str,
+        llm_label: str,
+    ) -> None:
+        with self.conn:
+            cur = self.conn.execute(
+                """
+                INSERT INTO campaigns
+                (domain, simhash, uid, rspamd_score, rspamd_action, llm_label, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    domain, _to_signed64(simhash), uid, rspamd_score, rspamd_action,
+                    llm_label, datetime.now(UTC).isoformat(),
+                ),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO campaign_bands(band, campaign_id) VALUES(?,?)",
+                [(band, cur.lastrowid) for band in bands],
+            )
+
+    def find_campaigns(self, domain: str, bands: list[int], since: str) -> list[dict[str, object]]:
+        """Indexed campaigns from `domain` sharing at least one band, newer than `since`."""
+        marks = ", ".join("?" for _ in bands)
+        cur = self.conn.execute(
+            f"""
+            SELECT DISTINCT c.id, c.simhash, c.uid, c.rspamd_score, c.rspamd_action, c.llm_label
+            FROM campaign_bands b
+            JOIN campaigns c ON c.id = b.campaign_id
+            WHERE b.band IN ({marks}) AND c.domain = ? AND c.created_at >= ?
+            """,
+            (*bands, domain, since),
+        )
+        return [
+            {
+                "simhash": _to_unsigned64(row[1]),
+                "uid": row[2],
+                "score": row[3],
+                "action": row[4],
+                "llm_label": row[5],
+            }
+            for row in cur.fetchall()
+        ]
+
+    def prune_campaigns(self, cutoff: str) -> int:
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM campaign_bands WHERE campaign_id IN "
+                "(SELECT id FROM campaigns WHERE created_at < ?)",
+                (cutoff,),
+            )
+            cur = self.conn.execute("DELETE FROM campaigns WHERE created_at < ?", (cutoff,))
+        return cur.rowcount
+
+    def record_llm_stats(self, rows: list[tuple[str, int, int, int, int, float, int, int, int]]) -> None:
+        """Store one run's per-model stats as produced by Cascade.stats_rows()."""
+        run_at = datetime.now(UTC).isoformat()
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO llm_stats
+                (run_at, model, tier, calls, escalations, failures, latency_ms,
+                 input_tokens, output_tokens, cached_tokens)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(run_at, *row) for row in rows],
+            )
+
+    def learned_messages(self) -> dict[str, str]:
+        """Message key -> verdict ("spam"/"ham") last sent to Rspamd."""
+        return dict(self.conn.execute("SELECT message_key, verdict FROM rspamd_learned").fetchall())
+
+    def mark_learned(self, rows: list[tuple[str, str]]) -> None:
+        """Record (message key, verdict) pairs Rspamd accepted."""
+        learned_at = datetime.now(UTC).isoformat()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rspamd_learned(message_key, verdict, learned_at) VALUES(?,?,?)",
+                [(key, verdict, learned_at) for key, verdict in rows],
+            )
+
+    def embedding_rows(self) -> list[tuple[int, str, str, bool]]:
+        """(matrix row, message key, label, headers only) for every live embedding."""
+        return [
+            (row, key, label, bool(headers_only))
+            for row, key, label, headers_only in self.conn.execute(
+                "SELECT row, message_key, label, headers_only FROM embeddings ORDER BY row"
+            )
+        ]
+
+    def add_embeddings(self, rows: list[tuple[int, str, str, bool]]) -> None:
+        """Record newly appended matrix rows; a message's earlier row is replaced."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO embeddings(row, message_key, label, headers_only) VALUES(?,?,?,?) "
+                "ON CONFLICT(message_key) DO UPDATE SET row=excluded.row, label=excluded.label, "
+                "headers_only=excluded.headers_only",
+                rows,
+            )
+
+    def replace_embeddings(self, rows: list[tuple[int, str, str, bool]]) -> None:
+        """Replace the whole row map, after compaction or a reset."""
+        with self.conn:
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.executemany(
+                "INSERT INTO embeddings(row, message_key, label, headers_only) VALUES(?,?,?,?)", rows,
+            )
+
+    def unembedded_actions(self, limit: int) -> list[tuple[str, str, str, str]]:
+        """(message key, from, subject, final action) of recorded actions not yet embedded."""
+        return self.conn.execute(
+            """
+            SELECT a.key, a.from_addr, a.subject, a.final_action FROM (
+                SELECT COALESCE(message_id, fingerprint, uidvalidity || ':' || uid) AS key,
+                       from_addr, subject, final_action, id
+                FROM email_actions
+            ) a
+            LEFT JOIN embeddings e ON e.message_key = a.key
+            WHERE e.row IS NULL AND a.final_action IN ('trash', 'promotional', 'skip', 'keep')
+            ORDER BY a.id DESC
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+
+    def vacuum(self, into: str | None = None) -> None:
+        """Rebuild the database file, optionally into a fresh copy at `into`."""
+        if into is None:
+            self.conn.execute("VACUUM")
+        else:
+            self.conn.execute("VACUUM INTO ?", (into,))
+
+    def record_snapshot(self, kind: str, path: str) -> str:
+        """Remember that a snapshot was taken; returns its timestamp."""
+        created_at = datetime.now(UTC).isoformat()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO snapshots(created_at, kind, path) VALUES(?,?,?)",
+                (created_at, kind, path),
+            )
+        return created_at
+
+    def last_snapshot_at(self) -> str | None:
+        row = self.conn.execute("SELECT MAX(created_at) FROM snapshots").fetchone()
+        return row[0] if row else None
+
+    def export_changes(self, since: str | None) -> dict[str, list[list[object]]]:
+        """Rows changed after `since` (all rows if None), keyed by table."""
+        cols = ", ".join(ACTION_COLUMNS)
+        actions = self.conn.execute(
+            f"SELECT {cols} FROM email_actions WHERE processed_at > ? ORDER BY processed_at",
+            (since or "",),
+        ).fetchall()
+        return {
+            "progress": [list(r) for r in self.conn.execute("SELECT uidvalidity, last_uid FROM progress")],
+            "uid_ranges": [
+                list(r) for r in self.conn.execute("SELECT uidvalidity, start_uid, end_uid FROM uid_ranges")
+            ],
+            "domain_stats": [
+                list(r) for r in self.conn.execute("SELECT domain, final_action, count FROM domain_stats")
+            ],
+            "backfill_windows": [
+                list(r) for r in self.conn.execute(
+                    "SELECT uidvalidity, since, before, messages, completed_at FROM backfill_windows"
+                )
+            ],
+            "email_actions": [list(r) for r in actions],
+            "rspamd_learned": [
+                list(r) for r in self.conn.execute(
+                    "SELECT message_key, verdict, learned_at FROM rspamd_learned WHERE learned_at > ?",
+                    (since or "",),
+                )
+            ],
+        }
+
+    def apply_changes(self, changes: dict[str, list[list[object]]]) -> None:
+        """Apply rows produced by export_changes on top of this database."""
+        cols = ", ".join(ACTION_COLUMNS)
+        marks = ", ".join("?" for _ in ACTION_COLUMNS)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in ACTION_COLUMNS[2:])
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO progress(uidvalidity,last_uid) VALUES(?,?) "
+                "ON CONFLICT(uidvalidity) DO UPDATE SET last_uid=MAX(last_uid, excluded.last_uid)",
+                changes.get("progress", []),
+            )
+            # uid_ranges and domain_stats in a delta are full tables, so replace them
+            ranges = changes.get("uid_ranges", [])
+            self.conn.executemany(
+                "DELETE FROM uid_ranges WHERE uidvalidity = ?",
+                sorted({(r[0],) for r in ranges}),
+            )
+            self.conn.executemany(
+                "INSERT INTO uid_ranges(uidvalidity, start_uid, end_uid) VALUES(?,?,?)",
+                ranges,
+            )
+            self.conn.executemany(
+                "INSERT INTO domain_stats(domain, final_action, count) VALUES(?,?,?) "
+                "ON CONFLICT(domain, final_action) DO UPDATE SET count=excluded.count",
+                changes.get("domain_stats", []),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO backfill_windows(uidvalidity, since, before, messages, completed_at) "
+                "VALUES(?,?,?,?,?)",
+                changes.get("backfill_windows", []),
+            )
+            self.conn.executemany(
+                f"INSERT INTO email_actions ({cols}) VALUES ({marks}) "
+                f"ON CONFLICT(uidvalidity, uid) DO UPDATE SET {updates}",
+                changes.get("email_actions", []),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rspamd_learned(message_key, verdict, learned_at) VALUES(?,?,?)",
+                changes.get("rspamd_learned", []),
+            )
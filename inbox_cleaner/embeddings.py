@@ -0,0 +1,279 @@
+import json
+import os
+import sys
+from collections.abc import Callable, Iterable, Mapping
+from pathlib import Path
+
+import numpy as np
+
+from .db import SeenStore
+from .parsing import ParsedMessage
+from .resilience import Backoff, call, get_breaker
+
+# LLM labels in code order; final actions map onto them
+LABELS = ("spam", "promotional", "normal")
+ACTION_LABELS = {"trash": "spam", "promotional": "promotional", "skip": "normal", "keep": "normal"}
+EMBED_BACKOFF = Backoff(base=1.0, cap=8.0, attempts=2)
+# Dead rows (relabeled messages) above this share trigger a rewrite
+COMPACT_DEAD_RATIO = 0.2
+
+
+def embedding_text(from_addr: str, subject: str, body: str, max_chars: int) -> str:
+    return f"From: {from_addr}\nSubject: {subject}\n\n{body}"[:max_chars]
+
+
+class EmbeddingIndex:
+    """Labeled message vectors in a memory-mapped float32 matrix, searched by k-NN.
+
+    Rows are L2-normalised, so cosine similarity is a matrix product. The
+    vector file is append-only; which row holds which message (and its label)
+    lives in the state DB's `embeddings` table. Rows without a DB entry, left
+    by relabeled messages or an interrupted append, are dead and are dropped
+    by compact(). A sidecar JSON file records the model and dimension; if the
+    model changes, the index starts over.
+
+    Rows seeded from past actions by `embed` only know the sender and
+    subject. They are marked headers-only and are compared with a
+    sender-and-subject embedding of each query, never with its full text;
+    a message decided later replaces its seeded row with a full one.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        store: SeenStore,
+        model_id: str,
+        k: int = 5,
+        min_similarity: float = 0.92,
+        chunk_rows: int = 65536,
+        max_chars: int = 2000,
+        embed: Callable[[list[str]], Iterable[list[float]]] | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.meta_path = Path(f"{path}.json")
+        self.store = store
+        self.model_id = model_id
+        self.k = k
+        self.min_similarity = min_similarity
+        self.chunk_rows = chunk_rows
+        self.max_chars = max_chars
+        self._embed = embed
+        self._map: np.memmap | None = None
+        self._pending: list[tuple[str, np.ndarray, int, bool]] = []
+        self.dim = 0
+        self.labels = np.zeros(0, dtype=np.int8)
+        self.headers_only = np.zeros(0, dtype=bool)
+        self.keys: dict[str, tuple[int, int]] = {}
+        self.proposed = 0
+        self._load()
+
+    def _load(self) -> None:
+        meta = json.loads(self.meta_path.read_text()) if self.meta_path.exists() else {}
+        if meta.get("model") != self.model_id or not self.path.exists():
+            self._reset()
+            return
+        self.dim = int(meta["dim"])
+        rows = self.path.stat().st_size // (4 * self.dim) if self.dim else 0
+        self.labels = np.full(rows, -1, dtype=np.int8)
+        self.headers_only = np.zeros(rows, dtype=bool)
+        recorded = self.store.embedding_rows()
+        for row, key, label, headers_only in recorded:
+            if row < rows and label in LABELS:
+                code = LABELS.index(label)
+                self.labels[row] = code
+                self.headers_only[row] = headers_only
+                self.keys[key] = (row, code)
+        if len(self.keys) < len(recorded):
+            # The vector file is older than the DB (e.g. restored separately)
+            self.store.replace_embeddings(self._live_rows())
+
+    def _reset(self) -> None:
+        self.store.replace_embeddings([])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(b"")
+        self.meta_path.unlink(missing_ok=True)
+        self.dim = 0
+        self.labels = np.zeros(0, dtype=np.int8)
+        self.headers_only = np.zeros(0, dtype=bool)
+        self.keys = {}
+        self._map = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _live_rows(self) -> list[tuple[int, str, str, bool]]:
+        return [
+            (row, key, LABELS[code], bool(self.headers_only[row])) for key, (row, code) in self.keys.items()
+        ]
+
+    @property
+    def has_seeded_rows(self) -> bool:
+        return bool((self.headers_only & (self.labels >= 0)).any())
+
+    def _matrix(self) -> np.ndarray:
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.float32, mode="r", shape=(len(self.labels), self.dim))
+        return self._map
+
+    def embed(self, texts: list[str]) -> np.ndarray | None:
+        """Normalised vectors for `texts`, or None if the embedding model is unavailable."""
+        if self._embed is None:
+            import llm
+
+            model = llm.get_embedding_model(self.model_id)
+            self._embed = model.embed_batch
+
+        def _fallback(exc: BaseException) -> None:
+            print(f"  WARNING: Embedding failed, classifying without neighbours: {exc}", file=sys.stderr)
+
+        vectors = call(
+            get_breaker(f"embed:{self.model_id}"),
+            lambda: np.asarray(list(self._embed(texts)), dtype=np.float32),  # type: ignore[misc]
+            retry_on=(Exception,),
+            backoff=EMBED_BACKOFF,
+            fallback=_fallback,
+        )
+        if vectors is None or vectors.ndim != 2 or len(vectors) != len(texts):
+            return None
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def search(
+        self, queries: np.ndarray, header_queries: np.ndarray | None = None,
+    ) -> list[tuple[str, float] | None]:
+        """Propose (label, similarity) per query from its k nearest labeled rows.
+
+        Full rows are compared with `queries`, headers-only rows with
+        `header_queries` (skipped when not given). Neighbours below
+        `min_similarity` don't vote; the others vote with their similarity.
+        None means no close labeled neighbour.
+        """
+        rows = len(self.labels)
+        if not rows or not len(self.keys) or queries.shape[1] != self.dim:
+            return [None] * len(queries)
+        matrix = self._matrix()
+        k = min(self.k, rows)
+        best_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), k), dtype=np.int64)
+        for start in range(0, rows, self.chunk_rows):
+            block = np.asarray(matrix[start:start + self.chunk_rows])
+            sims = queries @ block.T
+            seeded = self.headers_only[start:start + len(block)]
+            if header_queries is not None and seeded.any():
+                sims[:, seeded] = header_queries @ block[seeded].T
+            else:
+                sims[:, seeded] = -np.inf
+            sims[:, self.labels[start:start + len(block)] < 0] = -np.inf
+            cand_sims = np.concatenate([best_sims, sims], axis=1)
+            cand_rows = np.concatenate(
+                [best_rows, np.broadcast_to(np.arange(start, start + len(block)), sims.shape)], axis=1,
+            )
+            top = np.argpartition(-cand_sims, k - 1, axis=1)[:, :k]
+            best_sims = np.take_along_axis(cand_sims, top, axis=1)
+            best_rows = np.take_along_axis(cand_rows, top, axis=1)
+
+        proposals: list[tuple[str, float] | None] = []
+        for sims, neighbours in zip(best_sims, best_rows):
+            close = sims >= self.min_similarity
+            if not close.any():
+                proposals.append(None)
+                continue
+            codes = self.labels[neighbours[close]]
+            votes = np.bincount(codes, weights=sims[close], minlength=len(LABELS))
+            code = int(votes.argmax())
+            proposals.append((LABELS[code], float(sims[close][codes == code].max())))
+            self.proposed += 1
+        return proposals
+
+    def lookup(
+        self, parsed: Mapping[int, ParsedMessage],
+    ) -> tuple[dict[int, np.ndarray], dict[int, tuple[str, float]]]:
+        """Embed a parsed batch in one call; returns (vectors, proposals) by key."""
+        if not parsed:
+            return {}, {}
+        keys = list(parsed)
+        texts = [embedding_text(p.from_addr, p.subject, p.text, self.max_chars) for p in parsed.values()]
+        seeded = self.has_seeded_rows
+        if seeded:
+            # Same call: sender-and-subject texts to match the seeded rows
+            texts += [embedding_text(p.from_addr, p.subject, "", self.max_chars) for p in parsed.values()]
+        embedded = self.embed(texts)
+        if embedded is None:
+            return {}, {}
+        vectors = embedded[:len(keys)]
+        proposals = self.search(vectors, embedded[len(keys):] if seeded else None)
+        return (
+            dict(zip(keys, vectors)),
+            {key: proposal for key, proposal in zip(keys, proposals) if proposal},
+        )
+
+    def add(self, key: str, vector: np.ndarray, final_action: str, headers_only: bool = False) -> None:
+        """Queue a decided message; written by flush().
+
+        `headers_only` marks a vector of embedding_text() without the body.
+        """
+        label = ACTION_LABELS.get(final_action)
+        if label is None:
+            return
+        code = LABELS.index(label)
+        row, known = self.keys.get(key, (None, None))
+        # Keep an existing row with the same label, unless a full vector replaces a seeded one
+        if known == code and (headers_only or not self.headers_only[row]):
+            return
+        self._pending.append((key, vector, code, headers_only))
+
+    def flush(self) -> None:
+        """Append queued vectors to the matrix file and record their rows."""
+        if not self._pending:
+            return
+        # A message decided twice in one batch keeps its last label only
+        pending = list({entry[0]: entry for entry in self._pending}.values())
+        self._pending = []
+        if not self.dim:
+            self.dim = len(pending[0][1])
+            self.meta_path.write_text(json.dumps({"model": self.model_id, "dim": self.dim}))
+        first = len(self.labels)
+        with open(self.path, "ab") as f:
+            for _, vector, _, _ in pending:
+                f.write(np.asarray(vector, dtype=np.float32).tobytes())
+        rows = [(first + i, key, LABELS[code], seeded) for i, (key, _, code, seeded) in enumerate(pending)]
+        self.store.add_embeddings(rows)
+        # Earlier rows of relabeled messages die with their DB entry
+        for key, _, _, _ in pending:
+            if key in self.keys:
+                self.labels[self.keys[key][0]] = -1
+        self.labels = np.concatenate([self.labels, np.array([code for _, _, code, _ in pending], dtype=np.int8)])
+        self.headers_only = np.concatenate([self.headers_only, np.array([s for *_, s in pending], dtype=bool)])
+        for row, key, label, _ in rows:
+            self.keys[key] = (row, LABELS.index(label))
+        self._map = None
+        if self.dead_ratio() > COMPACT_DEAD_RATIO:
+            self.compact()
+
+    def dead_ratio(self) -> float:
+        return 1 - len(self.keys) / len(self.labels) if len(self.labels) else 0.0
+
+    def compact(self) -> int:
+        """Rewrite the matrix without dead rows; returns the number removed."""
+        self.flush()
+        rows = len(self.labels)
+        live = [(row, key, code) for key, (row, code) in sorted(self.keys.items(), key=lambda kv: kv[1][0])]
+        if len(live) == rows:
+            return 0
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        matrix = self._matrix()
+        with open(tmp, "wb") as f:
+            for start in range(0, len(live), self.chunk_rows):
+                idx = [row for row, _, _ in live[start:start + self.chunk_rows]]
+                f.write(np.ascontiguousarray(matrix[idx]).tobytes())
+        self._map = None
+        del matrix
+        os.replace(tmp, self.path)
+        seeded = [bool(self.headers_only[row]) for row, _, _ in live]
+        self.store.replace_embeddings(
+            [(i, key, LABELS[code], seeded[i]) for i, (_, key, code) in enumerate(live)]
+        )
+        self.labels = np.array([code for _, _, code in live], dtype=np.int8)
+        self.headers_only = np.array(seeded, dtype=bool)
+        self.keys = {key: (i, code) for i, (_, key, code) in enumerate(live)}
+        return rows - len(live)
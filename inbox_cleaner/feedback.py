@@ -0,0 +1,121 @@
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .db import SeenStore
+from .resilience import Backoff, call, get_breaker
+
+LEARN_BACKOFF = Backoff(base=0.5, cap=4.0, attempts=3)
+# Rspamd answers 208 when a message was already learned with the same class
+LEARNED_STATUSES = (200, 208)
+SPAM_ACTIONS = ("trash", "promotional")
+
+
+class LearnError(RuntimeError):
+    """The Rspamd controller refused a learn or fuzzy request."""
+
+
+class RspamdFeedback:
+    """Teaches Rspamd from final decisions, off the message-processing path.
+
+    Trash and promotional verdicts go to /learnspam, kept mail to /learnham,
+    and trash is also added to fuzzy storage so repeats of a blast score high
+    on their own. Messages are queued and sent in batches by a background
+    thread; each (message, verdict) pair is learned only once across runs.
+    """
+
+    def __init__(
+        self,
+        store: SeenStore,
+        controller_url: str,
+        password: str | None = None,
+        fuzzy_flag: int = 1,
+        batch_size: int = 25,
+    ) -> None:
+        self.store = store
+        self.controller_url = controller_url.rstrip("/")
+        self.password = password
+        self.fuzzy_flag = fuzzy_flag
+        self.batch_size = batch_size
+        self._learned = store.learned_messages()
+        self._pending: list[tuple[str, bytes, str, bool]] = []
+        self._jobs: list[Future[list[tuple[str, str]]]] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rspamd-learn")
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def submit(self, key: str, raw: bytes, final_action: str) -> None:
+        """Queue one decided message; `key` is its Message-ID or fingerprint."""
+        verdict = "spam" if final_action in SPAM_ACTIONS else "ham"
+        if self._learned.get(key) == verdict:
+            self.skipped += 1
+            return
+        self._learned[key] = verdict
+        self._pending.append((key, raw, verdict, final_action == "trash"))
+        if len(self._pending) >= self.batch_size:
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._jobs.append(self._executor.submit(self._send, batch))
+        self._collect(wait=False)
+
+    def _collect(self, wait: bool) -> None:
+        # Learned marks are written here, on the caller's thread, not by the worker
+        still_running: list[Future[list[tuple[str, str]]]] = []
+        for job in self._jobs:
+            if wait or job.done():
+                learned = job.result()
+                self.store.mark_learned(learned)
+                self.sent += len(learned)
+            else:
+                still_running.append(job)
+        self._jobs = still_running
+
+    def _send(self, batch: list[tuple[str, bytes, str, bool]]) -> list[tuple[str, str]]:
+        learned: list[tuple[str, str]] = []
+        for key, raw, verdict, fuzzy in batch:
+            try:
+                self._post(f"/learn{verdict}", raw, {})
+                if fuzzy and self.fuzzy_flag:
+                    self._post("/fuzzyadd", raw, {"Flag": str(self.fuzzy_flag), "Weight": "1"})
+            except Exception as e:
+                print(f"  WARNING: Rspamd learn failed for {key}: {e}", file=sys.stderr)
+                self.failed += 1
+                continue
+            learned.append((key, verdict))
+        return learned
+
+    def _post(self, path: str, raw: bytes, headers: dict[str, str]) -> None:
+        # Deferred so runs with nothing to learn never import requests
+        import requests
+
+        headers = {"Content-Type": "message/rfc822", **headers}
+        if self.password:
+            headers["Password"] = self.password
+
+        def _request() -> None:
+            r = requests.post(self.controller_url + path, data=raw, headers=headers, timeout=20)
+            if r.status_code not in LEARNED_STATUSES:
+                # 4xx is a configuration problem (password, no Bayes backend); don't retry it
+                if 400 <= r.status_code < 500:
+                    raise LearnError(f"{path} returned {r.status_code}: {r.text[:200]}")
+                r.raise_for_status()
+
+        call(
+            get_breaker("rspamd-controller"),
+            _request,
+            retry_on=(requests.RequestException,),
+            backoff=LEARN_BACKOFF,
+            fatal=(LearnError,),
+        )
+
+    def close(self) -> None:
+        """Send what is still queued and wait for all batches to finish."""
+        self._dispatch()
+        self._collect(wait=True)
+        self._executor.shutdown()
+
+    def summary(self) -> str:
+        return f"Rspamd learned {self.sent} message(s), {self.skipped} already learned, {self.failed} failed"
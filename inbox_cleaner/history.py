@@ -0,0 +1,97 @@
+from .db import SeenStore
+from .parsing import extract_address
+
+# Second-level labels under two-letter country TLDs that are not registrable
+# on their own (example.co.uk, example.com.au); a stand-in for the public
+# suffix list that covers the common cases.
+_COUNTRY_SECOND_LEVEL = frozenset({"ac", "co", "com", "edu", "gov", "ne", "net", "or", "org"})
+
+
+def registrable_depth(labels: list[str]) -> int:
+    """How many reversed labels make up the registrable domain."""
+    if len(labels) >= 3 and len(labels[0]) == 2 and labels[1] in _COUNTRY_SECOND_LEVEL:
+        return 3
+    return min(2, len(labels))
+
+
+class _Node:
+    __slots__ = ("children", "counts")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.counts: dict[str, int] = {}
+
+
+class SenderHistory:
+    """Action counts per sender, kept in a trie of reversed domain labels.
+
+    A message from user@e.mail.brand.com counts towards the nodes for
+    brand.com, mail.brand.com, e.mail.brand.com and the address itself, so
+    senders that rotate subdomains still build up history at brand.com.
+    Loaded from the state DB once per run and updated in place.
+    """
+
+    def __init__(self) -> None:
+        self.root = _Node()
+
+    @classmethod
+    def load(cls, store: SeenStore) -> "SenderHistory":
+        history = cls()
+        senders, domains = store.history_counts()
+        for from_addr, action, count in senders:
+            history.record(from_addr, action, count)
+        # Compacted rows only kept their domain
+        for domain, action, count in domains:
+            history._add(domain.split(".")[::-1], None, action, count)
+        return history
+
+    def record(self, from_addr: str, action: str, count: int = 1) -> None:
+        address = extract_address(from_addr)
+        if address:
+            local, domain = address.rsplit("@", 1)
+            self._add(domain.split(".")[::-1], local, action, count)
+
+    def _add(self, labels: list[str], local: str | None, action: str, count: int) -> None:
+        depth = registrable_depth(labels)
+        node = self.root
+        for i, label in enumerate(labels, start=1):
+            node = node.children.setdefault(label, _Node())
+            if i >= depth:
+                node.counts[action] = node.counts.get(action, 0) + count
+        if local is not None:
+            node = node.children.setdefault("@" + local, _Node())
+            node.counts[action] = node.counts.get(action, 0) + count
+
+    def levels(self, from_addr: str) -> list[tuple[str, dict[str, int]]]:
+        """(name, counts) from the full address up to the registrable domain."""
+        address = extract_address(from_addr)
+        if not address:
+            return []
+        local, domain = address.rsplit("@", 1)
+        labels = domain.split(".")[::-1]
+        depth = registrable_depth(labels)
+        found: list[tuple[str, dict[str, int]]] = []
+        node = self.root
+        for i, label in enumerate(labels, start=1):
+            node = node.children.get(label)  # type: ignore[assignment]
+            if node is None:
+                break
+            if i >= depth:
+                found.append((".".join(labels[:i][::-1]), node.counts))
+        else:
+            sender = node.children.get("@" + local)
+            if sender is not None:
+                found.append((address, sender.counts))
+        return found[::-1]
+
+    def lookup(self, from_addr: str, min_samples: int) -> dict[str, int]:
+        """Counts at the most specific level with at least `min_samples` actions.
+
+        Falls back to the registrable domain, the broadest level, when no
+        level has enough history.
+        """
+        levels = self.levels(from_addr)
+        for _, counts in levels:
+            if sum(counts.values()) >= min_samples:
+                return dict(counts)
+        return dict(levels[-1][1]) if levels else {}
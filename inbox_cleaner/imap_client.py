@@ -1,7 +1,22 @@
 import imaplib
+import re
 import ssl
+from datetime import date
+
+from .resilience import Backoff, call, get_breaker
 
 MAX_RETRIES = 3
+IMAP_BACKOFF = Backoff(base=0.5, cap=4.0, attempts=MAX_RETRIES)
+# UIDs per bulk FETCH command; keeps command lines well under server limits
+FETCH_CHUNK = 500
+
+_UID_RE = re.compile(rb"UID (\d+)")
+
+
+def _imap_date(d: date) -> str:
+    # IMAP wants English month abbreviations regardless of locale
+    months = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+    return f"{d.day:02d}-{months[d.month - 1]}-{d.year}"
 
 
 class ImapSession:
@@ -12,6 +27,8 @@ class ImapSession:
         self.app_password = app_password
         self.conn: imaplib.IMAP4_SSL | None = None
         self._selected_mailbox: str | None = None
+        # Set after a connection-level failure; the next attempt reconnects first
+        self._broken = False
 
     def __enter__(self) -> "ImapSession":
         self._connect()
@@ -66,18 +83,50 @@ class ImapSession:
             return [u for u in uids if u > last_uid]
         return self._retry_on_abort(_search)
 
+    def search_dates(self, since: date | None = None, before: date | None = None) -> list[int]:
+        """UIDs by internal date: SINCE is inclusive, BEFORE exclusive (day granularity)."""
+        criteria: list[str] = []
+        if since is not None:
+            criteria += ["SINCE", _imap_date(since)]
+        if before is not None:
+            criteria += ["BEFORE", _imap_date(before)]
+        def _search() -> list[int]:
+            typ, data = self.conn.uid("SEARCH", None, *(criteria or ["ALL"]))
+            self._ok(typ)
+            if not data or data[0] is None:
+                return []
+            return [int(x) for x in data[0].split()]
+        return self._retry_on_abort(_search)
+
     def _retry_on_abort(self, fn: "callable") -> object:
-        """Retry an IMAP operation up to MAX_RETRIES times on server disconnect."""
-        last_exc: Exception | None = None
-        for attempt in range(MAX_RETRIES):
+        """Retry an IMAP operation with backoff, reconnecting after a server disconnect.
+
+        The reconnect happens at the start of the next attempt rather than in
+        a before_retry hook, so the half-open probe after the circuit opened
+        runs on a fresh connection too.
+        """
+        retry_on = (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError)
+
+        def _attempt() -> object:
+            if self._broken:
+                self.reconnect()
+                self._broken = False
             try:
                 return fn()
-            except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError) as exc:
-                last_exc = exc
-                if attempt < MAX_RETRIES - 1:
-                    print(f"  ⚠ IMAP connection lost, reconnecting (attempt {attempt + 2}/{MAX_RETRIES})...")
-                    self.reconnect()
-        raise last_exc  # type: ignore[misc]
+            except retry_on:
+                self._broken = True
+                raise
+
+        def _announce(attempt: int, exc: BaseException) -> None:
+            print(f"  ⚠ IMAP connection lost, reconnecting (attempt {attempt + 2}/{MAX_RETRIES})...")
+
+        return call(
+            get_breaker("imap", failure_threshold=5),
+            _attempt,
+            retry_on=retry_on,
+            backoff=IMAP_BACKOFF,
+            before_retry=_announce,
+        )
 
     def _validate_fetch_data(self, data: list[object], uid: int, part: str) -> None:
         """Validate that IMAP FETCH returned a usable response."""
@@ -107,6 +156,34 @@ class ImapSession:
             return data[0][1].decode("utf-8", errors="replace")
         return self._retry_on_abort(_fetch)
 
+    def fetch_header_fields(self, uids: list[int], fields: tuple[str, ...]) -> dict[int, bytes]:
+        """Bulk-fetch only the named header fields for many UIDs."""
+        spec = f"(UID BODY.PEEK[HEADER.FIELDS ({' '.join(fields)})])"
+        result: dict[int, bytes] = {}
+        for i in range(0, len(uids), FETCH_CHUNK):
+            chunk = ",".join(str(u) for u in uids[i:i + FETCH_CHUNK])
+            def _fetch() -> list[object]:
+                typ, data = self.conn.uid("FETCH", chunk, spec)
+                self._ok(typ)
+                return data
+            pending: bytes | None = None
+            for item in self._retry_on_abort(_fetch):
+                # Literal responses arrive as (b'12 (UID 345 BODY[...] {n}', b'headers');
+                # servers that send UID after the literal follow it with b' UID 345)'
+                if isinstance(item, tuple) and len(item) >= 2:
+                    match = _UID_RE.search(item[0])
+                    if match:
+                        result[int(match.group(1))] = item[1]
+                        pending = None
+                    else:
+                        pending = item[1]
+                elif isinstance(item, bytes) and pending is not None:
+                    match = _UID_RE.search(item)
+                    if match:
+                        result[int(match.group(1))] = pending
+                    pending = None
+        return result
+
     def _quote_folder(self, name: str) -> str:
         """Quote folder name if it contains spaces"""
         if ' ' in name:
@@ -0,0 +1,236 @@
+import re
+import sys
+from dataclasses import dataclass
+from email import message_from_bytes
+from email.header import decode_header
+from email.message import Message
+
+from . import profiling
+from .campaigns import FINGERPRINT_CHARS, simhash
+from .recovery import message_identity
+
+
+def decode_email_header(header_value: str) -> str:
+    """Decode email header value (handles encoded headers)"""
+    if not header_value:
+        return ""
+    decoded_parts = decode_header(header_value)
+    result = []
+    prev_encoded: bool | None = None
+    for content, encoding in decoded_parts:
+        if isinstance(content, bytes):
+            # Handle unknown or invalid encodings
+            if encoding and encoding.lower() not in ('unknown-8bit', 'unknown'):
+                try:
+                    content = content.decode(encoding, errors='replace')
+                except (LookupError, UnicodeDecodeError):
+                    # Fall back to utf-8 if encoding is invalid
+                    content = content.decode('utf-8', errors='replace')
+            else:
+                # Default to utf-8 for unknown encodings
+                content = content.decode('utf-8', errors='replace')
+        # decode_header can drop the folding whitespace between an encoded
+        # word and plain text; adjacent encoded words join without any
+        encoded = encoding is not None
+        if (prev_encoded is not None and encoded != prev_encoded
+                and not content[:1].isspace() and not result[-1][-1:].isspace()):
+            result.append(' ')
+        prev_encoded = encoded
+        result.append(content)
+    return ''.join(result)
+
+def extract_email_info(raw_email: bytes) -> tuple[str, str]:
+    """Extract subject and from fields from raw email"""
+    msg = message_from_bytes(raw_email)
+    subject = decode_email_header(msg.get('Subject', '(No Subject)'))
+    from_addr = decode_email_header(msg.get('From', '(Unknown)'))
+    return subject, from_addr
+
+def extract_domain(from_addr: str) -> str:
+    """Extract domain from email address (e.g., 'Name <user@example.com>' -> 'example.com')"""
+    # Handle formats: "Name <email@domain.com>" or "email@domain.com"
+    match = re.search(r'[\w\.-]+@([\w\.-]+)', from_addr)
+    if match:
+        return match.group(1).lower()
+    return ""
+
+def extract_address(from_addr: str) -> str:
+    """Bare lower-cased address ('Name <User@Example.com>' -> 'user@example.com')"""
+    match = re.search(r'[\w\.-]+@[\w\.-]+', from_addr)
+    return match.group(0).lower() if match else ""
+
+def _extract_text_content(msg: Message) -> str:
+    """Extract only text content from email, excluding attachments."""
+    text_parts: list[str] = []
+
+    if msg.is_multipart():
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition", ""))
+
+            # Skip attachments (identified by Content-Disposition: attachment)
+            if "attachment" in content_disposition.lower():
+                continue
+
+            # Only extract text/plain and text/html parts
+            if content_type in ("text/plain", "text/html"):
+                try:
+                    payload = part.get_payload(decode=True)
+                    if isinstance(payload, bytes):
+                        charset = part.get_content_charset() or "utf-8"
+                        text_parts.append(payload.decode(charset, errors="replace"))
+                except Exception:
+                    pass
+    else:
+        # Non-multipart message - just get the payload
+        try:
+            payload = msg.get_payload(decode=True)
+            if isinstance(payload, bytes):
+                charset = msg.get_content_charset() or "utf-8"
+                text_parts.append(payload.decode(charset, errors="replace"))
+        except Exception:
+            pass
+
+    return "\n\n".join(text_parts)
+
+def extract_text(raw_email: bytes, max_chars: int) -> str:
+    """Text content of a raw message (no attachments), truncated to max_chars."""
+    # Parse email and extract only text content (no attachments)
+    try:
+        msg = message_from_bytes(raw_email)
+        full_content = _extract_text_content(msg)
+    except Exception:
+        # Fallback to raw decoding if parsing fails
+        full_content = raw_email[:max_chars].decode("utf-8", errors="replace")
+
+    # Truncate to max_chars after extraction
+    return full_content[:max_chars]
+
+
+@dataclass(frozen=True)
+class ParsedMessage:
+    """Everything the pipeline needs from a raw message, small enough to pickle."""
+
+    subject: str
+    from_addr: str
+    domain: str
+    # Body text (no attachments), truncated to the LLM character limit
+    text: str
+    simhash: int | None
+    message_id: str | None
+    fingerprint: str
+    raw_size: int
+    # Length of the full body text before truncation
+    body_chars: int
+
+
+def parse_message(raw: bytes, max_chars: int) -> ParsedMessage:
+    """Parse a raw message once for display, campaign matching and the LLM prompt."""
+    msg = message_from_bytes(raw)
+    subject = decode_email_header(msg.get('Subject', '(No Subject)'))
+    from_addr = decode_email_header(msg.get('From', '(Unknown)'))
+    with profiling.stage("extract"):
+        try:
+            body = _extract_text_content(msg)
+        except Exception:
+            body = raw[:max(max_chars, FINGERPRINT_CHARS)].decode("utf-8", errors="replace")
+    message_id, fingerprint = message_identity(raw)
+    return ParsedMessage(
+        subject=subject,
+        from_addr=from_addr,
+        domain=extract_domain(from_addr),
+        text=body[:max_chars],
+        simhash=simhash(body[:FINGERPRINT_CHARS]),
+        message_id=message_id,
+        fingerprint=fingerprint,
+        raw_size=len(raw),
+        body_chars=len(body),
+    )
+
+
+def _parse_shared(name: str, offset: int, size: int, max_chars: int) -> ParsedMessage:
+    """Worker side: parse one message straight out of the batch's shared memory block."""
+    from multiprocessing.shared_memory import SharedMemory
+
+    shm = SharedMemory(name=name)
+    try:
+        raw = bytes(shm.buf[offset:offset + size])
+    finally:
+        shm.close()
+    return parse_message(raw, max_chars)
+
+
+class ParsePool:
+    """Parses batches of raw messages, optionally across worker processes.
+
+    With `workers` > 0 each batch is copied once into a shared memory block
+    and workers read their message from it, so only offsets are pickled on
+    the way in and compact ParsedMessage records on the way out. With 0
+    workers (or if the pool breaks) messages are parsed in-process.
+    """
+
+    def __init__(self, workers: int, max_chars: int) -> None:
+        self.max_chars = max_chars
+        self.executor = None
+        if workers > 0:
+            # multiprocessing is only worth importing when the pool is used
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.executor = ProcessPoolExecutor(workers)
+
+    def parse(self, raws: dict[int, bytes], failed: list[int]) -> dict[int, ParsedMessage]:
+        """Parse each message; UIDs that fail go to `failed`, like fetch_batch."""
+        if self.executor is not None and len(raws) > 1:
+            from concurrent.futures.process import BrokenProcessPool
+
+            try:
+                return self._parse_pooled(raws, failed)
+            except BrokenProcessPool as e:
+                print(f"  WARNING: Parser pool failed ({e}); parsing in-process", file=sys.stderr)
+                self.close()
+        parsed: dict[int, ParsedMessage] = {}
+        for uid, raw in raws.items():
+            try:
+                parsed[uid] = parse_message(raw, self.max_chars)
+            except Exception as e:
+                print(f"  WARNING: Failed to parse UID {uid}: {e}", file=sys.stderr)
+                failed.append(uid)
+        return parsed
+
+    def _parse_pooled(self, raws: dict[int, bytes], failed: list[int]) -> dict[int, ParsedMessage]:
+        from concurrent.futures.process import BrokenProcessPool
+        from multiprocessing.shared_memory import SharedMemory
+
+        assert self.executor is not None
+        shm = SharedMemory(create=True, size=max(1, sum(len(raw) for raw in raws.values())))
+        try:
+            jobs = {}
+            offset = 0
+            for uid, raw in raws.items():
+                shm.buf[offset:offset + len(raw)] = raw
+                jobs[uid] = self.executor.submit(_parse_shared, shm.name, offset, len(raw), self.max_chars)
+                offset += len(raw)
+            parsed: dict[int, ParsedMessage] = {}
+            for uid, job in jobs.items():
+                try:
+                    parsed[uid] = job.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    print(f"  WARNING: Failed to parse UID {uid}: {e}", file=sys.stderr)
+                    failed.append(uid)
+            return parsed
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def __enter__(self) -> "ParsePool":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
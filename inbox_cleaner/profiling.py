@@ -0,0 +1,221 @@
+import fnmatch
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from types import FrameType, TracebackType
+
+# The profiler of the current run; stage() and tick() are no-ops without one
+_active: "Profiler | None" = None
+
+SAMPLE_INTERVAL = 0.005
+TOP_ALLOCATIONS = 15
+
+
+def stage(name: str) -> AbstractContextManager[object]:
+    """Attribute the enclosed work to pipeline stage `name` when profiling."""
+    return _active.stage(name) if _active else nullcontext()
+
+
+def tick() -> None:
+    """Count one processed message when profiling."""
+    if _active:
+        _active.tick()
+
+
+def _rss_bytes() -> int:
+    """Current resident set size, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _max_rss_bytes() -> int:
+    """Peak resident set size of the process so far."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+    traced_peak: int = 0
+    rss_peak: int = 0
+    rss_growth: int = 0
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    """Samples the profiled thread's stack into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+class Profiler:
+    """Profile a run into `out_dir`.
+
+    Writes profile.pstats (cProfile, for snakeviz or pstats),
+    profile.collapsed (sampled stacks, for flamegraph.pl or speedscope), a
+    tracemalloc snapshot every `snapshot_every` messages and report.txt with
+    time, traced-memory peak and RSS per stage plus the top allocation sites.
+
+    Stages may nest; an outer stage's figures include its inner stages.
+    RSS figures are for this process only, so parse work done in
+    PARSE_WORKERS processes is not included.
+    """
+
+    def __init__(self, out_dir: str | Path, snapshot_every: int = 500) -> None:
+        self.out_dir = Path(out_dir)
+        self.snapshot_every = snapshot_every
+        self.messages = 0
+        self.stages: dict[str, StageStats] = {}
+        self._open_peaks: list[int] = []
+        self._traced_peak = 0
+        self._snapshots: list[tuple[int, object]] = []
+
+    def __enter__(self) -> "Profiler":
+        global _active
+        import cProfile
+        import tracemalloc
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._filters = [
+            tracemalloc.Filter(False, pattern)
+            for pattern in (tracemalloc.__file__, __file__, "<frozen importlib._bootstrap*>", "<unknown>")
+        ]
+        # Compile the filters' patterns now so that doesn't show up as allocations
+        for f in self._filters:
+            fnmatch.fnmatch("", f.filename_pattern)
+        tracemalloc.start()
+        self._sampler = _Sampler(threading.get_ident(), SAMPLE_INTERVAL)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self._started = time.perf_counter()
+        _active = self
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        global _active
+        import tracemalloc
+
+        _active = None
+        self._profile.disable()
+        self._sampler.stop()
+        elapsed = time.perf_counter() - self._started
+        self._snapshot()
+        traced_peak = max(self._traced_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        self._profile.dump_stats(self.out_dir / "profile.pstats")
+        with open(self.out_dir / "profile.collapsed", "w") as f:
+            for stack, count in self._sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self._write_report(elapsed, traced_peak)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        import tracemalloc
+
+        stats = self.stages.setdefault(name, StageStats())
+        # The traced peak is process-wide; keep the run's and the enclosing
+        # stage's peak so far before resetting it
+        peak = tracemalloc.get_traced_memory()[1]
+        self._traced_peak = max(self._traced_peak, peak)
+        if self._open_peaks:
+            self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+        tracemalloc.reset_peak()
+        self._open_peaks.append(0)
+        rss_before = _max_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.calls += 1
+            peak = max(self._open_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if self._open_peaks:
+                self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+            stats.traced_peak = max(stats.traced_peak, peak)
+            rss_after = _max_rss_bytes()
+            stats.rss_peak = max(stats.rss_peak, rss_after, _rss_bytes())
+            stats.rss_growth += rss_after - rss_before
+
+    def tick(self) -> None:
+        self.messages += 1
+        if self.snapshot_every and self.messages % self.snapshot_every == 0:
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        import tracemalloc
+
+        if self._snapshots and self._snapshots[-1][0] == self.messages:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        snapshot.dump(str(self.out_dir / f"snapshot-{self.messages:06d}.tracemalloc"))
+        # Only the first and latest are compared in the report
+        self._snapshots = [*self._snapshots[:1], (self.messages, snapshot)]
+
+    def _write_report(self, elapsed: float, traced_peak: int) -> None:
+        mib = 1024 * 1024
+        lines = [
+            f"Profiled {self.messages} message(s) in {elapsed:.1f} s; "
+            f"peak RSS {_max_rss_bytes() / mib:.1f} MiB, peak traced {traced_peak / mib:.1f} MiB",
+            "",
+            f"{'stage':<10} {'calls':>7} {'total s':>9} {'traced peak MiB':>16} "
+            f"{'RSS peak MiB':>13} {'RSS growth MiB':>15}",
+        ]
+        for name, s in sorted(self.stages.items(), key=lambda kv: -kv[1].seconds):
+            lines.append(
+                f"{name:<10} {s.calls:>7} {s.seconds:>9.2f} {s.traced_peak / mib:>16.1f} "
+                f"{s.rss_peak / mib:>13.1f} {s.rss_growth / mib:>15.1f}"
+            )
+        first_at, first = self._snapshots[0]
+        last_at, last = self._snapshots[-1]
+        lines += ["", f"Top allocation sites at message {last_at}:"]
+        lines += [f"  {stat}" for stat in last.statistics("lineno")[:TOP_ALLOCATIONS]]  # type: ignore[attr-defined]
+        if last_at != first_at:
+            lines += ["", f"Largest growth from message {first_at} to {last_at}:"]
+            lines += [
+                f"  {stat}"
+                for stat in last.compare_to(first, "lineno")[:TOP_ALLOCATIONS]  # type: ignore[attr-defined]
+            ]
+        (self.out_dir / "report.txt").write_text("\n".join(lines) + "\n")
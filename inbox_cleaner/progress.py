@@ -0,0 +1,162 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable, Iterable
+
+from .db import SeenStore
+
+CHECKPOINT_BATCH = 25
+
+
+class UidRangeSet:
+    """Sorted set of disjoint, non-adjacent inclusive UID ranges."""
+
+    def __init__(self, ranges: Iterable[tuple[int, int]] = ()) -> None:
+        self._starts: list[int] = []
+        self._ends: list[int] = []
+        for start, end in ranges:
+            self.add(start, end)
+
+    def add(self, start: int, end: int | None = None) -> None:
+        """Mark [start, end] (inclusive) as done, merging with neighbours."""
+        end = start if end is None else end
+        if end < start:
+            return
+        # Ranges that overlap or touch [start, end] are folded into it
+        lo = bisect_left(self._ends, start - 1)
+        hi = bisect_right(self._starts, end + 1)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def __contains__(self, uid: int) -> bool:
+        i = bisect_right(self._starts, uid) - 1
+        return i >= 0 and self._ends[i] >= uid
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def ranges(self) -> list[tuple[int, int]]:
+        return list(zip(self._starts, self._ends))
+
+    def watermark(self) -> int:
+        """Highest UID below which everything is done (0 if UID 1 is not)."""
+        if self._starts and self._starts[0] <= 1:
+            return self._ends[0]
+        return 0
+
+    def missing(self, uids: Iterable[int]) -> list[int]:
+        """The subset of `uids` not yet done, i.e. the gaps to (re)process."""
+        return [u for u in uids if u not in self]
+
+
+class Checkpoint:
+    """Out-of-order completion tracking for one UIDVALIDITY, persisted in batches.
+
+    complete() may be called from worker threads in any order; the set is
+    written back every `batch_size` completions and on flush().
+    """
+
+    def __init__(self, store: SeenStore, uidvalidity: str, batch_size: int = CHECKPOINT_BATCH) -> None:
+        self.store = store
+        self.uidvalidity = uidvalidity
+        self.batch_size = batch_size
+        self.done = UidRangeSet(store.get_uid_ranges(uidvalidity))
+        self._floor: dict[int, int] = {}
+        # Ranges as last written; None until the first flush, which writes
+        # them all (the loaded ranges may be a legacy last_uid fallback)
+        self._saved: set[tuple[int, int]] | None = None
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def watermark(self) -> int:
+        return self.done.watermark()
+
+    @property
+    def highest(self) -> int:
+        """Highest UID completed so far (0 if none)."""
+        ranges = self.done.ranges()
+        return ranges[-1][1] if ranges else 0
+
+    def begin(self, found: list[int], above: int | None = None) -> list[int]:
+        """Register the UIDs a search returned; returns those still to process.
+
+        Pass `above` when `found` is every UID greater than it (a UID-range
+        search). UIDs are assigned in increasing order, so nothing can exist
+        between two consecutive results: completing a UID then also covers
+        the gap below it, which keeps the range set (and the watermark)
+        compact. Date-window searches must leave `above` as None; they keep
+        any lower floor an earlier UID-range search gave the same UID.
+        """
+        pending: list[int] = []
+        with self._lock:
+            prev = above
+            for uid in sorted(found):
+                if uid in self.done:
+                    # Close gaps left by UIDs that have since disappeared
+                    if prev is not None and prev + 1 < uid and (prev + 1) not in self.done:
+                        self.done.add(prev + 1, uid)
+                        self._unsaved += 1
+                else:
+                    floor = uid if prev is None else prev + 1
+                    self._floor[uid] = min(floor, self._floor.get(uid, uid))
+                    pending.append(uid)
+                if above is not None:
+                    prev = uid
+        return pending
+
+    def complete(self, uid: int) -> None:
+        with self._lock:
+            self.done.add(self._floor.get(uid, uid), uid)
+            self._unsaved += 1
+            if self._unsaved >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        # Only the ranges that changed since the last flush are written, so
+        # a long run with many open gaps doesn't rewrite the whole set
+        if self._unsaved:
+            ranges = self.done.ranges()
+            current = set(ranges)
+            if self._saved is None:
+                self.store.set_uid_ranges(self.uidvalidity, ranges)
+            else:
+                self.store.update_uid_ranges(
+                    self.uidvalidity,
+                    added=sorted(current - self._saved),
+                    removed=sorted(self._saved - current),
+                    watermark=self.done.watermark(),
+                )
+            self._saved = current
+            self._unsaved = 0
+
+
+class RunBudget:
+    """Wall-clock and message limits for one run; 0 means unlimited."""
+
+    def __init__(
+        self,
+        max_seconds: float = 0,
+        max_messages: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_seconds = max_seconds
+        self.max_messages = max_messages
+        self.clock = clock
+        self.started = clock()
+        self.messages = 0
+
+    def spend(self) -> None:
+        self.messages += 1
+
+    def exhausted(self) -> bool:
+        if self.max_messages and self.messages >= self.max_messages:
+            return True
+        return bool(self.max_seconds) and self.clock() - self.started >= self.max_seconds
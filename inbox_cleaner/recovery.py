@@ -0,0 +1,66 @@
+import hashlib
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+
+from .db import SeenStore
+from .imap_client import ImapSession
+from .progress import Checkpoint
+
+# Headers fetched per message when rebuilding UIDs after a UIDVALIDITY reset
+IDENTITY_FIELDS = ("MESSAGE-ID", "DATE", "FROM", "SUBJECT")
+
+
+def message_identity(raw: bytes) -> tuple[str | None, str]:
+    """Return (Message-ID, content fingerprint) for a message or its headers.
+
+    The fingerprint hashes the normalized Date/From/Subject headers so that
+    messages without a Message-ID can still be matched across UIDVALIDITYs.
+    """
+    headers = BytesHeaderParser().parsebytes(raw)
+    message_id = str(headers.get("Message-ID", "")).strip() or None
+
+    date = str(headers.get("Date", "")).strip()
+    try:
+        date = parsedate_to_datetime(date).isoformat()
+    except (TypeError, ValueError):
+        pass
+    parts = (
+        date,
+        " ".join(str(headers.get("From", "")).lower().split()),
+        " ".join(str(headers.get("Subject", "")).split()),
+    )
+    fingerprint = hashlib.sha256("\x1f".join(parts).encode("utf-8", "replace")).hexdigest()[:32]
+    return message_id, fingerprint
+
+
+def recover_uidvalidity_change(
+    imap: ImapSession,
+    store: SeenStore,
+    checkpoint: Checkpoint,
+    stale: list[str],
+) -> int:
+    """Carry processed messages over to a new UIDVALIDITY without reprocessing them.
+
+    Fetches only the identity headers for the whole mailbox, remaps matching
+    email_actions rows onto the new UIDs and marks those UIDs done. Returns
+    the number of messages recognised.
+
+    Progress of a stale UIDVALIDITY is dropped if it is known to belong to
+    this mailbox, or, for progress saved before mailboxes were recorded,
+    once some of its mail turned up here.
+    """
+    uids = imap.search_since_uid(0)
+    headers = imap.fetch_header_fields(uids, IDENTITY_FIELDS)
+    identities = {uid: message_identity(raw) for uid, raw in headers.items()}
+    remapped = store.remap_seen(checkpoint.uidvalidity, stale, identities)
+
+    checkpoint.begin(uids, above=0)
+    for uid in remapped:
+        checkpoint.complete(uid)
+    checkpoint.flush()
+
+    matched_from = set(remapped.values())
+    for old in stale:
+        if store.mailbox_of(old) is not None or old in matched_from:
+            store.forget_uidvalidity(old)
+    return len(remapped)
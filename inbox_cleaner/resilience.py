@@ -0,0 +1,186 @@
+import random
+import sys
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"{name} circuit is open; skipping call")
+        self.name = name
+
+
+@dataclass(frozen=True)
+class Backoff:
+    """Capped exponential backoff with full jitter."""
+
+    base: float = 0.5
+    cap: float = 8.0
+    attempts: int = 3
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Per-dependency breaker: opens after consecutive failures, probes once after a cool-down."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        # Degraded-mode counters, reported at the end of a run
+        self.failures = 0
+        self.trips = 0
+        self.fast_fails = 0
+        self.fallbacks = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                # Let exactly one probe through; everyone else keeps fast-failing
+                self._probing = True
+                return True
+            self.fast_fails += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"  ✓ {self.name} recovered; circuit closed.", file=sys.stderr)
+            self.state = CLOSED
+            self._consecutive = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._consecutive += 1
+            if self.state == HALF_OPEN or self._consecutive >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                    print(
+                        f"  ⚠ {self.name} unavailable; fast-failing for {self.reset_timeout:.0f}s.",
+                        file=sys.stderr,
+                    )
+                self.state = OPEN
+                self._opened_at = self.clock()
+                self._probing = False
+
+    def release_probe(self) -> None:
+        """End a probe that neither succeeded nor failed, e.g. on an unrelated error."""
+        with self._lock:
+            self._probing = False
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.failures or self.fast_fails or self.fallbacks)
+
+
+_BREAKERS: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, **kwargs: object) -> CircuitBreaker:
+    """Process-wide breaker for a dependency, created on first use."""
+    if name not in _BREAKERS:
+        _BREAKERS[name] = CircuitBreaker(name, **kwargs)  # type: ignore[arg-type]
+    return _BREAKERS[name]
+
+
+def degraded_report() -> dict[str, dict[str, int]]:
+    """Failure/fast-fail/fallback counts for every dependency that misbehaved."""
+    return {
+        name: {
+            "failures": b.failures,
+            "trips": b.trips,
+            "fast_fails": b.fast_fails,
+            "fallbacks": b.fallbacks,
+        }
+        for name, b in _BREAKERS.items()
+        if b.degraded
+    }
+
+
+def total_fallbacks() -> int:
+    """Default results handed out so far; lets callers tell real verdicts from fallbacks."""
+    return sum(b.fallbacks for b in _BREAKERS.values())
+
+
+def call(
+    breaker: CircuitBreaker,
+    fn: Callable[[], T],
+    *,
+    retry_on: tuple[type[BaseException], ...],
+    backoff: Backoff = Backoff(),
+    fatal: tuple[type[BaseException], ...] = (),
+    before_retry: Callable[[int, BaseException], None] | None = None,
+    fallback: Callable[[BaseException], T] | None = None,
+    sleep: Callable[[float], None] | None = None,
+) -> T:
+    """Call `fn` through `breaker`, retrying `retry_on` errors with jittered backoff.
+
+    `fatal` errors propagate immediately. When the circuit is open or attempts
+    run out, `fallback(exc)` is returned if given, otherwise the error is raised.
+    `before_retry(attempt, exc)` runs after the backoff sleep, e.g. to reconnect.
+    """
+    last_exc: BaseException | None = None
+    for attempt in range(backoff.attempts):
+        if not breaker.allow():
+            exc: BaseException = CircuitOpenError(breaker.name)
+            if fallback is not None:
+                breaker.fallbacks += 1
+                return fallback(exc)
+            raise exc from last_exc
+        try:
+            result = fn()
+        except fatal:
+            breaker.release_probe()
+            raise
+        except retry_on as e:
+            last_exc = e
+            breaker.record_failure()
+            if attempt < backoff.attempts - 1 and breaker.state != OPEN:
+                (sleep or time.sleep)(backoff.delay(attempt))
+                if before_retry is not None:
+                    before_retry(attempt, e)
+            continue
+        except BaseException:
+            # Not a dependency failure, but a half-open probe must not stay claimed
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+    assert last_exc is not None
+    if fallback is not None:
+        breaker.fallbacks += 1
+        return fallback(last_exc)
+    raise last_exc
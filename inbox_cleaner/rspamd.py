@@ -1,38 +1,48 @@
 import sys
-import time
 
-import requests
+from .resilience import Backoff, CircuitOpenError, call, get_breaker
+
+RSPAMD_BACKOFF = Backoff(base=0.5, cap=2.0, attempts=3)
+SAFE_RESULT = {"score": 0.0, "action": "noaction"}
 
 
 def check_message(rspamd_url: str, raw_email: bytes) -> dict[str, object]:
     """
     Rspamd HTTP /checkv2: returns JSON with score/action.
-    Retries up to 3 times with backoff on transient failures.
+    Retries transient failures with jittered backoff; while Rspamd is down its
+    circuit is open and this returns the safe default immediately.
     """
+    # Deferred so runs with nothing to scan never import requests
+    import requests
+
     headers = {"Content-Type": "message/rfc822"}
-    delays = [1, 2]  # delays between attempts: 1s, then 2s
 
-    last_exc: Exception | None = None
-    for attempt in range(3):
+    def _post() -> dict[str, object]:
+        r = requests.post(rspamd_url, data=raw_email, headers=headers, timeout=20)
+        r.raise_for_status()
         try:
-            r = requests.post(rspamd_url, data=raw_email, headers=headers, timeout=20)
-            r.raise_for_status()
-            try:
-                return r.json()
-            except Exception:
-                return {"score": 0.0, "action": "noaction"}
-        except requests.RequestException as e:
-            last_exc = e
-            if attempt < 2:
-                print(
-                    f"  WARNING: Rspamd request failed (attempt {attempt + 1}/3): {e}",
-                    file=sys.stderr,
-                )
-                time.sleep(delays[attempt])
-
-    print(
-        f"  WARNING: Rspamd unavailable after 3 attempts: {last_exc}",
-        file=sys.stderr,
+            return r.json()
+        except Exception:
+            return dict(SAFE_RESULT)
+
+    def _warn(attempt: int, exc: BaseException) -> None:
+        print(
+            f"  WARNING: Rspamd request failed (attempt {attempt + 1}/{RSPAMD_BACKOFF.attempts}): {exc}",
+            file=sys.stderr,
+        )
+
+    def _fallback(exc: BaseException) -> dict[str, object]:
+        # An open circuit already announced the outage; stay quiet per message
+        if not isinstance(exc, CircuitOpenError):
+            print(f"  WARNING: Rspamd unavailable: {exc}", file=sys.stderr)
+            print("  Defaulting to safe score (0.0 / noaction).", file=sys.stderr)
+        return dict(SAFE_RESULT)
+
+    return call(
+        get_breaker("rspamd"),
+        _post,
+        retry_on=(requests.RequestException,),
+        backoff=RSPAMD_BACKOFF,
+        before_retry=_warn,
+        fallback=_fallback,
     )
-    print("  Defaulting to safe score (0.0 / noaction).", file=sys.stderr)
-    return {"score": 0.0, "action": "noaction"}
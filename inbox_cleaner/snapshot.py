@@ -0,0 +1,62 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+from .parsing import extract_domain
+from .db import SeenStore
+
+
+def compact_store(store: SeenStore, retention_days: int, campaign_ttl_days: int | None = None) -> int:
+    """Roll rows older than the retention window into per-domain aggregates."""
+    now = datetime.now(UTC)
+    cutoff = (now - timedelta(days=retention_days)).isoformat()
+    removed = store.compact(cutoff, extract_domain)
+    if campaign_ttl_days is not None:
+        # Expired campaign fingerprints are never matched again
+        store.prune_campaigns((now - timedelta(days=campaign_ttl_days)).isoformat())
+    store.vacuum()
+    return removed
+
+
+def write_snapshot(store: SeenStore, out_path: str) -> int:
+    """Write a gzip-compressed, vacuumed copy of the database. Returns its size."""
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    # Recorded before copying so the snapshot knows its own watermark
+    store.record_snapshot("full", out.name)
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "state.sqlite")
+        store.vacuum(into=copy)
+        with open(copy, "rb") as src, gzip.open(out, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    return out.stat().st_size
+
+
+def write_delta(store: SeenStore, out_path: str) -> int:
+    """Write rows changed since the last snapshot as gzipped JSON. Returns row count."""
+    changes = store.export_changes(store.last_snapshot_at())
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(out, "wt", encoding="utf-8") as f:
+        json.dump(changes, f, separators=(",", ":"))
+    store.record_snapshot("delta", out.name)
+    return len(changes["email_actions"])
+
+
+def restore(snapshot_path: str, dest_path: str, delta_paths: list[str] | None = None) -> None:
+    """Rebuild the database at `dest_path` from a snapshot plus optional deltas."""
+    dest = Path(dest_path)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(snapshot_path, "rb") as src, open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+    store = SeenStore(str(dest))
+    for path in delta_paths or []:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            store.apply_changes(json.load(f))
+        store.record_snapshot("delta", Path(path).name)
+    store.conn.close()
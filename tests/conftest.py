@@ -0,0 +1,42 @@
+"""Fixtures shared across the test suite."""
+
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from inbox_cleaner.db import SeenStore
+from inbox_cleaner.recovery import message_identity
+
+Recorder = Callable[..., None]
+
+
+@pytest.fixture()
+def store(tmp_path: Path) -> SeenStore:
+    return SeenStore(str(tmp_path / "state.sqlite"))
+
+
+@pytest.fixture()
+def record(store: SeenStore) -> Recorder:
+    """Record one processed message in `store`.
+
+    Call as record(uid, from_addr, action); other email_actions columns may
+    be given by keyword, and `raw` fills in its Message-ID and fingerprint.
+    """
+
+    def _record(uid: int, from_addr: str, action: str, raw: bytes | None = None, **columns: object) -> None:
+        if raw is not None:
+            columns["message_id"], columns["fingerprint"] = message_identity(raw)
+        fields: dict[str, object] = {
+            "uidvalidity": "1",
+            "subject": "test",
+            "rspamd_score": 0.0,
+            "llm_label": "normal",
+            "recommended_action": action,
+            "final_action": action,
+            "mode": "auto",
+        }
+        fields.update(columns)
+        store.record_action(uid=uid, from_addr=from_addr, **fields)  # type: ignore[arg-type]
+
+    return _record
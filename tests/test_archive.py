@@ -0,0 +1,184 @@
+"""Tests for offline mbox/Maildir ingest."""
+
+import argparse
+import csv
+from pathlib import Path
+
+import pytest
+
+from inbox_cleaner import cli
+from inbox_cleaner.archive import (
+    MaildirArchive, MboxArchive, header_text, index_mbox, maildir_key, open_archive,
+)
+from inbox_cleaner.config import Settings
+from inbox_cleaner.db import SeenStore
+
+
+def _message(n: int) -> bytes:
+    return (
+        f"From: Shop <news@shop{n % 2}.example>\nSubject: Offer {n}\n"
+        f"Message-ID: <{n}@shop.example>\n\nA deal from our store to you: number {n}.\n"
+    ).encode()
+
+
+def _mbox(path: Path, count: int) -> Path:
+    with open(path, "wb") as f:
+        for n in range(1, count + 1):
+            f.write(b"From MAILER-DAEMON Mon Oct  6 10:00:00 2025\n" + _message(n) + b"\n")
+    return path
+
+
+class TestMbox:
+    def test_index_splits_on_separator_lines_only(self) -> None:
+        buf = b"From a\nSubject: x\n\nhi\nFrom here on, mail is\n\nFrom b\nSubject: y\n\nbody\n"
+        assert [buf[s:e] for s, e in index_mbox(buf)] == [
+            b"Subject: x\n\nhi\nFrom here on, mail is\n",
+            b"Subject: y\n\nbody\n",
+        ]
+
+    def test_crlf_line_endings(self) -> None:
+        buf = b"From a\r\nSubject: x\r\n\r\nhi\r\n\r\nFrom b\r\nSubject: y\r\n\r\nbody\r\n"
+        assert [buf[s:e] for s, e in index_mbox(buf)] == [
+            b"Subject: x\r\n\r\nhi\r\n",
+            b"Subject: y\r\n\r\nbody\r\n",
+        ]
+
+    def test_quoted_from_lines_are_unescaped(self, tmp_path: Path) -> None:
+        path = tmp_path / "q.mbox"
+        path.write_bytes(b"From a\nSubject: x\n\n>From the start\n>>From quoted\nnot >From here\n")
+        with MboxArchive(path) as archive:
+            assert [raw for _, raw in archive] == [
+                b"Subject: x\n\nFrom the start\n>From quoted\nnot >From here\n",
+            ]
+
+    def test_reads_messages_through_mmap(self, tmp_path: Path) -> None:
+        with MboxArchive(_mbox(tmp_path / "a.mbox", 3)) as archive:
+            messages = list(archive)
+        assert len(messages) == 3
+        assert [raw.split(b"\n")[1] for _, raw in messages] == [
+            b"Subject: Offer 1", b"Subject: Offer 2", b"Subject: Offer 3",
+        ]
+        # Keys are byte offsets, increasing through the file
+        assert [key for key, _ in messages] == sorted(key for key, _ in messages)
+
+    def test_empty_file(self, tmp_path: Path) -> None:
+        (tmp_path / "empty.mbox").write_bytes(b"")
+        with MboxArchive(tmp_path / "empty.mbox") as archive:
+            assert list(archive) == []
+
+    def test_header_text(self) -> None:
+        assert header_text(b"Subject: x\r\nFrom: a@b\r\n\r\nbody") == "Subject: x\r\nFrom: a@b\r\n\r\n"
+
+
+class TestMaildir:
+    def test_reads_cur_and_new_in_name_order(self, tmp_path: Path) -> None:
+        for sub, name, n in (("cur", "1700000002.b:2,S", 2), ("new", "1700000001.a", 1)):
+            (tmp_path / sub).mkdir(exist_ok=True)
+            (tmp_path / sub / name).write_bytes(_message(n))
+        archive = open_archive(tmp_path)
+        assert isinstance(archive, MaildirArchive)
+        assert [(key, raw.split(b"\n")[1]) for key, raw in archive] == [
+            (maildir_key("1700000001.a"), b"Subject: Offer 1"),
+            (maildir_key("1700000002.b"), b"Subject: Offer 2"),
+        ]
+
+    def test_keys_ignore_flags(self) -> None:
+        assert maildir_key("1700000001.a:2,S") == maildir_key("1700000001.a") == maildir_key("1700000001.a!2,RS")
+        assert maildir_key("1700000001.a") != maildir_key("1700000001.b")
+
+    def test_plain_directory_rejected(self, tmp_path: Path) -> None:
+        with pytest.raises(ValueError):
+            open_archive(tmp_path)
+
+
+class TestIngest:
+    def test_records_reports_and_resumes(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(cli, "check_message", lambda url, raw: {"score": 0.0, "action": "no action"})
+        calls: list[str] = []
+
+        def fake_classify(hdr: str, raw: bytes, **kwargs: object) -> str:
+            calls.append(hdr)
+            return "promotional"
+
+        monkeypatch.setattr(cli, "classify_message", fake_classify)
+        settings = Settings(sqlite_path=str(tmp_path / "state.sqlite"), campaign_dedup=False, batch_size=2)
+        mbox = _mbox(tmp_path / "export.mbox", 5)
+        report = tmp_path / "report.csv"
+
+        args = argparse.Namespace(
+            path=str(mbox), report=str(report), no_record=False, time_budget=None, max_messages=3,
+        )
+        cli.run_ingest(settings, args)
+        assert len(calls) == 3
+        assert calls[0].startswith("From: Shop <news@shop1.example>")
+        with open(report, newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert [row["subject"] for row in rows] == ["Offer 1", "Offer 2", "Offer 3"]
+        assert {row["recommended"] for row in rows} == {"promotional"}
+
+        # A second run picks up only the two messages not yet recorded
+        args.max_messages = None
+        cli.run_ingest(settings, args)
+        assert len(calls) == 5
+        store = SeenStore(settings.sqlite_path)
+        assert store.get_domain_history("shop1.example") == {"promotional": 3}
+        modes = store.conn.execute("SELECT DISTINCT uidvalidity, mode FROM email_actions").fetchall()
+        assert modes == [(f"archive:{mbox.resolve()}", "archive")]
+
+    def test_same_file_name_in_other_directory_is_a_new_archive(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        calls = self._fake_pipeline(monkeypatch)
+        settings = Settings(sqlite_path=str(tmp_path / "state.sqlite"), campaign_dedup=False)
+        for sub in ("a", "b"):
+            (tmp_path / sub).mkdir()
+            cli.run_ingest(settings, self._args(_mbox(tmp_path / sub / "Inbox.mbox", 2)))
+        assert len(calls) == 4
+
+    def test_maildir_rerun_after_delete_and_delivery(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        calls = self._fake_pipeline(monkeypatch)
+        settings = Settings(sqlite_path=str(tmp_path / "state.sqlite"), campaign_dedup=False)
+        maildir = tmp_path / "Maildir"
+        (maildir / "cur").mkdir(parents=True)
+        for n in range(1, 4):
+            (maildir / "cur" / f"170000000{n}.m{n}:2,S").write_bytes(_message(n))
+        cli.run_ingest(settings, self._args(maildir))
+        assert len(calls) == 3
+
+        (maildir / "cur" / "1700000001.m1:2,S").unlink()
+        (maildir / "cur" / "1700000004.m4:2,").write_bytes(_message(4))
+        cli.run_ingest(settings, self._args(maildir))
+        assert len(calls) == 4 and "Offer 4" in calls[-1]
+
+        store = SeenStore(settings.sqlite_path)
+        subjects = dict(store.conn.execute("SELECT uid, subject FROM email_actions").fetchall())
+        assert subjects[maildir_key("1700000002.m2")] == "Offer 2"
+
+    def test_no_record_leaves_state_db_untouched(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        calls = self._fake_pipeline(monkeypatch)
+        settings = Settings(sqlite_path=str(tmp_path / "state.sqlite"))
+        args = self._args(_mbox(tmp_path / "export.mbox", 3))
+        args.no_record = True
+        cli.run_ingest(settings, args)
+        assert len(calls) == 3
+        store = SeenStore(settings.sqlite_path)
+        for table in ("email_actions", "campaigns", "llm_stats"):
+            assert store.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+
+    @staticmethod
+    def _fake_pipeline(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+        monkeypatch.setattr(cli, "check_message", lambda url, raw: {"score": 0.0, "action": "no action"})
+        calls: list[str] = []
+
+        def fake_classify(hdr: str, raw: bytes, **kwargs: object) -> str:
+            calls.append(hdr)
+            return "promotional"
+
+        monkeypatch.setattr(cli, "classify_message", fake_classify)
+        return calls
+
+    @staticmethod
+    def _args(path: Path) -> argparse.Namespace:
+        return argparse.Namespace(path=str(path), report=None, no_record=False, time_budget=None, max_messages=None)
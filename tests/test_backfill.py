@@ -0,0 +1,98 @@
+"""Tests for newest-first windowed backfill and run budgets."""
+
+from datetime import date, timedelta
+
+import pytest
+
+from inbox_cleaner.backfill import Backfill
+from inbox_cleaner.campaigns import order_by_cluster
+from inbox_cleaner.db import SeenStore
+from inbox_cleaner.progress import Checkpoint, RunBudget
+
+TODAY = date(2025, 10, 20)
+
+
+class FakeImap:
+    """Date search over a fixed UID -> internal date mapping."""
+
+    def __init__(self, days: dict[int, date]) -> None:
+        self.days = days
+
+    def search_dates(self, since: date | None = None, before: date | None = None) -> list[int]:
+        return sorted(
+            uid for uid, d in self.days.items()
+            if (since is None or d >= since) and (before is None or d < before)
+        )
+
+
+@pytest.fixture()
+def imap() -> FakeImap:
+    # Ten messages, one every three days, UID 10 being today's
+    return FakeImap({uid: TODAY - timedelta(days=3 * (10 - uid)) for uid in range(1, 11)})
+
+
+class TestBackfill:
+    def test_walks_windows_newest_first_until_empty(self, store: SeenStore, imap: FakeImap) -> None:
+        backfill = Backfill(imap, store, "1", window_days=7, today=TODAY)  # type: ignore[arg-type]
+        assert not backfill.started
+
+        seen: list[list[int]] = []
+        while (window := backfill.next_window()) is not None:
+            uids = backfill.search(window)
+            seen.append(uids)
+            backfill.complete(window, len(uids))
+
+        assert seen[0] == [10, 9, 8]
+        assert [uid for uids in seen for uid in uids] == list(range(10, 0, -1))
+        assert backfill.started
+
+    def test_resumes_below_oldest_window(self, store: SeenStore, imap: FakeImap) -> None:
+        first = Backfill(imap, store, "1", window_days=7, today=TODAY)  # type: ignore[arg-type]
+        window = first.next_window()
+        assert window is not None
+        first.complete(window, 3)
+
+        # A later run, days afterwards, continues with the backlog
+        later = Backfill(imap, store, "1", window_days=7, today=TODAY + timedelta(days=5))  # type: ignore[arg-type]
+        assert later.search(later.next_window()) == [7, 6]  # type: ignore[arg-type]
+
+    def test_checkpoint_skips_done_uids_in_window(self, store: SeenStore, imap: FakeImap) -> None:
+        checkpoint = Checkpoint(store, "1")
+        checkpoint.begin([10], above=9)
+        checkpoint.complete(10)
+        backfill = Backfill(imap, store, "1", window_days=7, today=TODAY)  # type: ignore[arg-type]
+        assert checkpoint.begin(backfill.search(backfill.next_window())) == [8, 9]  # type: ignore[arg-type]
+        assert checkpoint.highest == 10
+
+    def test_windows_are_dropped_with_uidvalidity(self, store: SeenStore) -> None:
+        store.add_backfill_window("1", "2025-10-14", "2025-10-21", 3)
+        store.forget_uidvalidity("1")
+        assert store.oldest_backfill_since("1") is None
+
+
+class TestRunBudget:
+    def test_message_budget(self) -> None:
+        budget = RunBudget(max_messages=2)
+        budget.spend()
+        assert not budget.exhausted()
+        budget.spend()
+        assert budget.exhausted()
+
+    def test_time_budget(self) -> None:
+        now = [100.0]
+        budget = RunBudget(max_seconds=30, clock=lambda: now[0])
+        now[0] += 29
+        assert not budget.exhausted()
+        now[0] += 1
+        assert budget.exhausted()
+
+    def test_zero_is_unlimited(self) -> None:
+        budget = RunBudget()
+        for _ in range(1000):
+            budget.spend()
+        assert not budget.exhausted()
+
+
+def test_cluster_order_keeps_newest_first() -> None:
+    keys = {9: ("shop.example", 0b1), 5: ("shop.example", 0b11), 3: ("other.example", 0)}
+    assert order_by_cluster(keys, max_distance=2) == [9, 3, 5]
@@ -0,0 +1,82 @@
+"""Tests for near-duplicate campaign fingerprints and the campaign index."""
+
+from pathlib import Path
+
+import pytest
+
+from inbox_cleaner.campaigns import CampaignIndex, bands, hamming, order_by_cluster, simhash
+from inbox_cleaner.db import SeenStore
+
+BLAST = (
+    "<html><style>p {{ color: red }}</style><p>Hi {name},</p>"
+    "<p>Our autumn sale starts today. Take 40% off every jacket, boot and scarf in the store "
+    "until Sunday night. Free shipping on orders over $50 and free returns for 30 days. "
+    "Use code FALL{code} at checkout. Members get early access to the clearance section "
+    "and double points on every purchase this week.</p>"
+    "<p>New this season: waterproof parkas in six colours, merino wool sweaters, leather "
+    "ankle boots with memory foam insoles, and a limited run of hand knitted scarves made "
+    "by our partner workshop. Pair any coat with a hat or gloves and save an extra ten "
+    "percent. Visit one of our stores to try the new fitting service, or book a free video "
+    "styling session from the app. Gift cards are available in any amount and never "
+    "expire.</p><p>You are receiving this email because you subscribed to our newsletter. "
+    "Unsubscribe or update your preferences at any time. View this message in your browser "
+    "if the images do not load.</p></html>"
+)
+OTHER = (
+    "Hello team, attached are the minutes from Tuesday's planning meeting. Please review "
+    "the action items assigned to you and reply with any corrections before Friday so we "
+    "can circulate the final version to the steering committee next week."
+)
+
+
+class TestSimHash:
+    def test_personalised_copies_are_close(self) -> None:
+        a = simhash(BLAST.format(name="Alice", code=1234))
+        b = simhash(BLAST.format(name="Bob", code=9876))
+        assert a is not None and b is not None
+        assert hamming(a, b) <= 5
+
+    def test_different_messages_are_far(self) -> None:
+        a = simhash(BLAST.format(name="Alice", code=1))
+        b = simhash(OTHER)
+        assert a is not None and b is not None
+        assert hamming(a, b) > 10
+
+    def test_short_text_has_no_fingerprint(self) -> None:
+        assert simhash("Thanks!") is None
+
+    def test_bands_split_fingerprint(self) -> None:
+        assert bands(0x0807_0605_0403_0201) == [
+            (i << 8) | (i + 1) for i in range(8)
+        ]
+
+
+class TestOrderByCluster:
+    def test_representatives_first(self) -> None:
+        keys = {
+            1: ("shop.example", 0b0000),
+            2: ("shop.example", 0b0111),  # near 1
+            3: ("other.example", 0b0001),  # same hash, different sender
+            4: ("shop.example", None),
+        }
+        assert order_by_cluster(keys, max_distance=3) == [1, 3, 4, 2]
+
+
+class TestCampaignIndex:
+    @pytest.fixture()
+    def index(self, tmp_path: Path) -> CampaignIndex:
+        return CampaignIndex(SeenStore(str(tmp_path / "state.sqlite")), max_distance=5)
+
+    def test_inherits_verdict_within_distance(self, index: CampaignIndex) -> None:
+        fp = (1 << 63) | 0xABCDEF  # exercises the signed 64-bit round trip
+        index.add("shop.example", fp, 7, {"score": 4.5, "action": "add header"}, "promotional")
+
+        hit = index.lookup("shop.example", fp ^ 0b101)
+        assert hit is not None
+        assert (hit["uid"], hit["llm_label"], hit["score"]) == (7, "promotional", 4.5)
+        assert index.hits == 1
+
+    def test_misses_other_domain_and_far_fingerprints(self, index: CampaignIndex) -> None:
+        index.add("shop.example", 0xFFFF, 7, {"score": 0.0}, "promotional")
+        assert index.lookup("other.example", 0xFFFF) is None
+        assert index.lookup("shop.example", 0xFFFF ^ 0b111111) is None
@@ -0,0 +1,167 @@
+"""Tests for the LLM model cascade, using fake `llm` models."""
+
+from collections.abc import Iterator
+
+import llm
+import pytest
+
+from inbox_cleaner import resilience
+from inbox_cleaner.cascade import Cascade, parse_label
+from inbox_cleaner.classify import INSTRUCTIONS, classify_message, summarize_headers
+
+
+class FakeModel(llm.Model):
+    """Answers with a fixed string and reports token usage."""
+
+    can_stream = False
+
+    class Options(llm.Options):
+        temperature: float | None = None
+
+    def __init__(self, model_id: str, answer: str | Exception) -> None:
+        self.model_id = model_id
+        self.answer = answer
+        self.prompts: list[str] = []
+
+    def execute(self, prompt, stream, response, conversation) -> Iterator[str]:  # type: ignore[no-untyped-def]
+        self.prompts.append(prompt.prompt)
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        response.set_usage(input=len(prompt.prompt) // 4, output=3)
+        yield self.answer
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers() -> Iterator[None]:
+    resilience._BREAKERS.clear()
+    yield
+    resilience._BREAKERS.clear()
+
+
+def _cascade(*models: FakeModel, **kwargs: object) -> Cascade:
+    by_id = {m.model_id: m for m in models}
+    return Cascade([m.model_id for m in models], get_model=by_id.__getitem__, **kwargs)  # type: ignore[arg-type]
+
+
+class TestParseLabel:
+    @pytest.mark.parametrize(
+        ("answer", "expected"),
+        [
+            ("promotional 0.92", ("promotional", 0.92)),
+            ("Spam 1", ("spam", 1.0)),
+            ("normal", ("normal", 0.0)),
+            ("normal (confidence .75)", ("normal", 0.75)),
+            ("normal 0.9.", ("normal", 0.9)),
+            ("promotional 95", ("promotional", 0.95)),
+            ("spam 95%", ("spam", 0.95)),
+            ("normal 250", ("normal", 0.0)),
+        ],
+    )
+    def test_parses(self, answer: str, expected: tuple[str, float]) -> None:
+        assert parse_label(answer) == expected
+
+
+class TestCascade:
+    def test_confident_small_model_answers_alone(self) -> None:
+        small, large = FakeModel("small", "promotional 0.95"), FakeModel("large", "normal 0.9")
+        cascade = _cascade(small, large)
+        assert cascade.classify("prompt", "system") == "promotional"
+        assert large.prompts == []
+        assert cascade.stats["small"].calls == 1
+        assert cascade.stats["small"].output_tokens == 3
+
+    def test_low_confidence_escalates(self) -> None:
+        small, large = FakeModel("small", "normal 0.4"), FakeModel("large", "promotional 0.9")
+        cascade = _cascade(small, large)
+        assert cascade.classify("prompt", "system") == "promotional"
+        assert cascade.stats["small"].escalations == 1
+        assert cascade.stats["large"].calls == 1
+
+    def test_spam_suspicion_escalates_even_when_confident(self) -> None:
+        small, large = FakeModel("small", "spam 0.99"), FakeModel("large", "normal 0.9")
+        assert _cascade(small, large).classify("prompt", "system") == "normal"
+
+    def test_failing_small_model_is_skipped(self) -> None:
+        small, large = FakeModel("small", RuntimeError("offline")), FakeModel("large", "spam 0.8")
+        cascade = _cascade(small, large)
+        assert cascade.classify("prompt", "system") == "spam"
+        assert cascade.stats["small"].failures == 1
+
+    def test_final_tier_failure_defaults_to_normal(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(resilience.time, "sleep", lambda s: None)
+        only = FakeModel("only", RuntimeError("down"))
+        assert _cascade(only).classify("prompt", "system") == "normal"
+
+    def test_summary_and_stats_rows(self) -> None:
+        small, large = FakeModel("small", "normal 0.1"), FakeModel("large", "normal 0.9")
+        cascade = _cascade(small, large)
+        cascade.classify("prompt", "system")
+        assert [row[:5] for row in cascade.stats_rows()] == [
+            ("small", 0, 1, 1, 0),
+            ("large", 1, 1, 0, 0),
+        ]
+        assert "100% escalated" in cascade.summary()[0]
+
+
+class TestClassifyMessage:
+    def test_routes_through_given_cascade(self) -> None:
+        small = FakeModel("small", "promotional 0.9")
+        raw = b"Subject: Sale\r\nContent-Type: text/plain\r\n\r\n50% off everything"
+        label = classify_message("Subject: Sale", raw, max_chars=1000, cascade=_cascade(small))
+        assert label == "promotional"
+        assert "50% off everything" in small.prompts[0]
+
+    def test_prompt_starts_with_fixed_instructions(self) -> None:
+        small = FakeModel("small", "normal 0.9")
+        cascade = _cascade(small)
+        for subject in (b"Lunch", b"Invoice"):
+            raw = b"Subject: " + subject + b"\r\n\r\nbody"
+            classify_message(f"Subject: {subject.decode()}", raw, max_chars=100, cascade=cascade)
+        first, second = small.prompts
+        assert first.startswith(INSTRUCTIONS) and second.startswith(INSTRUCTIONS)
+        assert "Subject: Lunch" in first.removeprefix(INSTRUCTIONS)
+
+    def test_prompt_subject_is_decoded_and_unfolded(self) -> None:
+        small = FakeModel("small", "normal 0.9")
+        headers = "From: a@shop.example\r\nSubject: =?utf-8?q?Caf=C3=A9_sale?=\r\n ends today\r\n\r\n"
+        classify_message(headers, headers.encode() + b"body", max_chars=100, cascade=_cascade(small))
+        assert "\nSubject: Café sale ends today\n" in small.prompts[0]
+
+    def test_reports_per_call_tokens(self, capsys: pytest.CaptureFixture[str]) -> None:
+        small, large = FakeModel("small", "spam 0.9"), FakeModel("large", "spam 0.9")
+        cascade = _cascade(small, large)
+        classify_message("Subject: Win", b"Subject: Win\r\n\r\nprize", max_chars=100, cascade=cascade)
+        out = capsys.readouterr().out
+        assert "LLM small:" in out and "LLM large:" in out
+        assert [c[0] for c in cascade.last_calls] == ["small", "large"]
+        assert cascade.last_calls[0][1] == len(small.prompts[0]) // 4
+
+
+class TestSummarizeHeaders:
+    HEADERS = (
+        "Received: from mx.example by mta.yahoo.com with SMTP; Mon, 1 Jan 2024\r\n"
+        "\tfor <me@yahoo.com>; (envelope-from <bounce@mail.shop.example>)\r\n"
+        "ARC-Seal: i=1; a=rsa-sha256; cv=none; d=yahoo.com; b=AAAAAAAAAAAAAAAAAAAA\r\n"
+        "DKIM-Signature: v=1; a=rsa-sha256; d=shop.example; b=BBBBBBBBBBBBBBBBBBBB\r\n"
+        "Authentication-Results: atlas.yahoo.com;\r\n"
+        " dkim=pass header.i=@shop.example header.s=s1;\r\n"
+        " spf=pass smtp.mailfrom=mail.shop.example;\r\n"
+        " dmarc=fail(p=NONE) header.from=shop.example;\r\n"
+        "From: =?utf-8?q?Caf=C3=A9_Shop?= <deals@shop.example>\r\n"
+        "Subject: Sale\r\n"
+        "List-Unsubscribe: <https://shop.example/u/1>,\r\n <mailto:u@shop.example>\r\n"
+        "X-Mailer: Bulk 3.0\r\n"
+        "Precedence: bulk\r\n\r\n"
+    )
+
+    def test_keeps_useful_headers_only(self) -> None:
+        assert summarize_headers(self.HEADERS) == (
+            "From: Café Shop <deals@shop.example>\n"
+            "List-Unsubscribe: <https://shop.example/u/1>, <mailto:u@shop.example>\n"
+            "Precedence: bulk\n"
+            "Authentication-Results: dkim=pass spf=pass dmarc=fail"
+        )
+
+    def test_long_values_are_truncated(self) -> None:
+        summary = summarize_headers("Reply-To: " + "a" * 1000 + "@x.example\r\n\r\n")
+        assert len(summary) == len("Reply-To: ") + 200
@@ -0,0 +1,140 @@
+"""Tests for the memory-mapped embedding index."""
+
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from inbox_cleaner.db import SeenStore  # noqa: E402
+from inbox_cleaner.embeddings import EmbeddingIndex  # noqa: E402
+from inbox_cleaner.parsing import parse_message  # noqa: E402
+
+DIM = 8
+
+
+def _vec(*hot: int, noise: float = 0.0, seed: int = 0) -> np.ndarray:
+    v = np.zeros(DIM, dtype=np.float32)
+    v[list(hot)] = 1.0
+    v += np.random.default_rng(seed).normal(0, noise, DIM).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _index(tmp_path: Path, store: SeenStore, **kwargs: object) -> EmbeddingIndex:
+    return EmbeddingIndex(tmp_path / "state.vectors", store, "fake-embed", **kwargs)  # type: ignore[arg-type]
+
+
+class TestSearch:
+    def test_proposes_label_of_close_neighbours(self, tmp_path: Path, store: SeenStore) -> None:
+        index = _index(tmp_path, store, k=3, min_similarity=0.9, chunk_rows=2)
+        index.add("promo-1", _vec(0), "promotional")
+        index.add("promo-2", _vec(0, noise=0.05, seed=1), "promotional")
+        index.add("kept", _vec(5), "keep")
+        index.flush()
+
+        queries = np.stack([_vec(0, noise=0.05, seed=2), _vec(3)])
+        near, far = index.search(queries)
+        assert near is not None and near[0] == "promotional" and near[1] > 0.9
+        assert far is None
+        assert index.proposed == 1
+
+    def test_empty_index_proposes_nothing(self, tmp_path: Path, store: SeenStore) -> None:
+        assert _index(tmp_path, store).search(np.stack([_vec(0)])) == [None]
+
+
+class TestPersistence:
+    def test_reopen_maps_same_rows(self, tmp_path: Path, store: SeenStore) -> None:
+        index = _index(tmp_path, store)
+        index.add("a", _vec(1), "trash")
+        index.flush()
+        reopened = _index(tmp_path, store)
+        assert len(reopened) == 1
+        assert reopened.search(np.stack([_vec(1)]))[0] == ("spam", pytest.approx(1.0))
+
+    def test_relabel_appends_and_compaction_drops_dead_rows(self, tmp_path: Path, store: SeenStore) -> None:
+        index = _index(tmp_path, store)
+        for i in range(5):
+            index.add(f"m{i}", _vec(i), "promotional")
+        index.flush()
+        index.add("m0", _vec(0), "trash")  # the user moved it to trash after all
+        index.flush()
+        assert len(index.labels) == 6 and len(index) == 5
+        assert index.search(np.stack([_vec(0)]))[0][0] == "spam"  # type: ignore[index]
+
+        assert index.compact() == 1
+        assert (tmp_path / "state.vectors").stat().st_size == 5 * DIM * 4
+        reopened = _index(tmp_path, store)
+        assert sorted(key for _, key, _, _ in store.embedding_rows()) == ["m0", "m1", "m2", "m3", "m4"]
+        assert reopened.search(np.stack([_vec(0), _vec(3)])) == [
+            ("spam", pytest.approx(1.0)), ("promotional", pytest.approx(1.0)),
+        ]
+
+    def test_model_change_resets(self, tmp_path: Path, store: SeenStore) -> None:
+        index = _index(tmp_path, store)
+        index.add("a", _vec(1), "trash")
+        index.flush()
+        other = EmbeddingIndex(tmp_path / "state.vectors", store, "other-model")
+        assert len(other) == 0 and store.embedding_rows() == []
+
+
+class TestLookup:
+    def test_embeds_batch_once(self, tmp_path: Path, store: SeenStore) -> None:
+        calls: list[list[str]] = []
+
+        def embed(texts: list[str]) -> list[list[float]]:
+            calls.append(texts)
+            return [list(_vec(0 if "Sale" in t else 4)) for t in texts]
+
+        index = _index(tmp_path, store, embed=embed, min_similarity=0.95)
+        index.add("old", _vec(0), "promotional")
+        index.flush()
+        raw = b"From: Shop <a@shop.example>\r\nSubject: %s\r\n\r\nHello there"
+        parsed = {1: parse_message(raw % b"Sale", 100), 2: parse_message(raw % b"Invoice", 100)}
+        vectors, proposals = index.lookup(parsed)
+        assert len(calls) == 1 and calls[0][0].startswith("From: Shop <a@shop.example>\nSubject: Sale")
+        assert set(vectors) == {1, 2}
+        assert proposals == {1: ("promotional", pytest.approx(1.0))}
+
+
+class TestSeededRows:
+    def test_seeded_rows_only_match_header_queries(self, tmp_path: Path, store: SeenStore) -> None:
+        index = _index(tmp_path, store)
+        index.add("seeded", _vec(0), "promotional", headers_only=True)
+        index.flush()
+        assert index.has_seeded_rows
+        # A full-text query never matches a sender/subject-only row...
+        assert index.search(np.stack([_vec(0)])) == [None]
+        # ...but the sender/subject embedding of the same query does
+        assert index.search(np.stack([_vec(3)]), np.stack([_vec(0)])) == [("promotional", pytest.approx(1.0))]
+
+        reopened = _index(tmp_path, store)
+        assert reopened.has_seeded_rows and reopened.search(np.stack([_vec(0)])) == [None]
+
+    def test_full_vector_replaces_seeded_row(self, tmp_path: Path, store: SeenStore) -> None:
+        index = _index(tmp_path, store)
+        index.add("m", _vec(0), "promotional", headers_only=True)
+        index.add("other", _vec(2), "trash")
+        index.flush()
+        index.add("m", _vec(1), "promotional")
+        index.flush()
+        assert not index.has_seeded_rows
+        index.compact()
+        assert [seeded for *_, seeded in store.embedding_rows()] == [False, False]
+        assert index.search(np.stack([_vec(1)]))[0] == ("promotional", pytest.approx(1.0))
+
+    def test_lookup_embeds_header_texts_in_same_call(self, tmp_path: Path, store: SeenStore) -> None:
+        calls: list[list[str]] = []
+
+        def embed(texts: list[str]) -> list[list[float]]:
+            calls.append(texts)
+            return [list(_vec(0 if t.endswith("\n\n") else 4)) for t in texts]
+
+        index = _index(tmp_path, store, embed=embed)
+        index.add("seeded", _vec(0), "trash", headers_only=True)
+        index.flush()
+        raw = b"From: Shop <a@shop.example>\r\nSubject: Sale\r\n\r\nHello there"
+        vectors, proposals = index.lookup({1: parse_message(raw, 100)})
+        assert len(calls) == 1 and len(calls[0]) == 2
+        assert calls[0][1] == "From: Shop <a@shop.example>\nSubject: Sale\n\n"
+        assert np.allclose(vectors[1], _vec(4))
+        assert proposals == {1: ("spam", pytest.approx(1.0))}
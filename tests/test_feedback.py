@@ -0,0 +1,101 @@
+"""Tests for feeding decisions back to Rspamd, against a fake controller."""
+
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from inbox_cleaner import resilience
+from inbox_cleaner.db import SeenStore
+from inbox_cleaner.feedback import RspamdFeedback
+
+
+class FakeController(ThreadingHTTPServer):
+    def __init__(self) -> None:
+        self.requests: list[tuple[str, dict[str, str], bytes]] = []
+        self.status = 200
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeController
+
+    def do_POST(self) -> None:  # noqa: N802
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"success": true}')
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture()
+def controller() -> Iterator[FakeController]:
+    resilience._BREAKERS.clear()
+    server = FakeController()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    resilience._BREAKERS.clear()
+
+
+class TestRspamdFeedback:
+    def test_routes_verdicts_to_endpoints(self, store: SeenStore, controller: FakeController) -> None:
+        feedback = RspamdFeedback(store, controller.url, password="q1", batch_size=2)
+        feedback.submit("<a@x>", b"spam body", "trash")
+        feedback.submit("<b@x>", b"promo body", "promotional")
+        feedback.submit("<c@x>", b"kept body", "skip")
+        feedback.close()
+
+        paths = sorted((path, body) for path, _, body in controller.requests)
+        assert paths == [
+            ("/fuzzyadd", b"spam body"),
+            ("/learnham", b"kept body"),
+            ("/learnspam", b"promo body"),
+            ("/learnspam", b"spam body"),
+        ]
+        fuzzy = next(h for path, h, _ in controller.requests if path == "/fuzzyadd")
+        assert fuzzy["Flag"] == "1" and fuzzy["Password"] == "q1"
+        assert store.learned_messages() == {"<a@x>": "spam", "<b@x>": "spam", "<c@x>": "ham"}
+        assert feedback.sent == 3
+
+    def test_already_learned_is_skipped_across_runs(self, store: SeenStore, controller: FakeController) -> None:
+        first = RspamdFeedback(store, controller.url)
+        first.submit("<a@x>", b"body", "trash")
+        first.submit("<a@x>", b"body", "trash")
+        first.close()
+        assert first.skipped == 1
+
+        second = RspamdFeedback(store, controller.url, fuzzy_flag=0)
+        second.submit("<a@x>", b"body", "promotional")  # still spam: nothing to send
+        second.submit("<b@x>", b"other", "skip")
+        second.close()
+        assert second.skipped == 1
+        assert [path for path, _, _ in controller.requests] == ["/learnspam", "/fuzzyadd", "/learnham"]
+
+    def test_relearns_when_user_changes_verdict(self, store: SeenStore, controller: FakeController) -> None:
+        store.mark_learned([("<a@x>", "spam")])
+        feedback = RspamdFeedback(store, controller.url)
+        feedback.submit("<a@x>", b"body", "skip")
+        feedback.close()
+        assert store.learned_messages() == {"<a@x>": "ham"}
+
+    def test_rejected_learn_is_not_marked(self, store: SeenStore, controller: FakeController) -> None:
+        controller.status = 403
+        feedback = RspamdFeedback(store, controller.url)
+        feedback.submit("<a@x>", b"body", "skip")
+        feedback.close()
+        assert feedback.failed == 1
+        assert store.learned_messages() == {}
+        # Configuration errors are not retried
+        assert len(controller.requests) == 1
@@ -0,0 +1,64 @@
+"""Tests for the in-memory hierarchical sender history."""
+
+from collections.abc import Callable
+
+import pytest
+
+from inbox_cleaner.db import SeenStore
+from inbox_cleaner.history import SenderHistory, registrable_depth
+from inbox_cleaner.parsing import extract_domain
+
+
+class TestRegistrableDepth:
+    @pytest.mark.parametrize(
+        ("domain", "depth"),
+        [("e.mail.brand.com", 2), ("brand.co.uk", 3), ("shop.brand.com.au", 3), ("localhost", 1)],
+    )
+    def test_depth(self, domain: str, depth: int) -> None:
+        assert registrable_depth(domain.split(".")[::-1]) == depth
+
+
+class TestSenderHistory:
+    def test_subdomains_aggregate_at_registrable_domain(self, store: SeenStore, record: Callable[..., None]) -> None:
+        record(1, "Brand <deals@e.mail.brand.com>", "promotional")
+        record(2, "Brand <news@news.brand.com>", "promotional")
+        record(3, "news@news.brand.com", "promotional")
+        history = SenderHistory.load(store)
+
+        # No single host has 3 samples, but brand.com does
+        assert history.lookup("Brand <offers@x.brand.com>", 3) == {"promotional": 3}
+        levels = dict(history.levels("news@news.brand.com"))
+        assert levels == {
+            "news@news.brand.com": {"promotional": 2},
+            "news.brand.com": {"promotional": 2},
+            "brand.com": {"promotional": 3},
+        }
+
+    def test_most_specific_sufficient_level_wins(self) -> None:
+        history = SenderHistory()
+        for _ in range(3):
+            history.record("boss@corp.example", "skip")
+        for i in range(10):
+            history.record(f"noreply{i}@corp.example", "trash")
+        assert history.lookup("Boss <boss@corp.example>", 3) == {"skip": 3}
+        assert history.lookup("noreply0@corp.example", 3) == {"trash": 10, "skip": 3}
+
+    def test_updates_in_place(self) -> None:
+        history = SenderHistory()
+        assert history.lookup("a@shop.example", 1) == {}
+        history.record("a@shop.example", "trash")
+        assert history.lookup("b@shop.example", 1) == {"trash": 1}
+
+    def test_loads_compacted_domain_stats(self, store: SeenStore, record: Callable[..., None]) -> None:
+        record(1, "old@mail.shop.example", "trash")
+        store.compact("9999", extract_domain)
+        record(2, "new@mail.shop.example", "trash")
+        history = SenderHistory.load(store)
+        assert history.lookup("x@mail.shop.example", 2) == {"trash": 2}
+        assert history.lookup("x@shop.example", 1) == {"trash": 2}
+
+    def test_matches_store_history_for_a_host(self, store: SeenStore, record: Callable[..., None]) -> None:
+        for uid, action in enumerate(["trash", "trash", "skip"], start=1):
+            record(uid, f"Shop <u{uid}@shop.example>", action)
+        history = SenderHistory.load(store)
+        assert history.lookup("x@shop.example", 3) == store.get_domain_history("shop.example")
@@ -0,0 +1,42 @@
+"""Tests for parsing IMAP FETCH responses."""
+
+import pytest
+
+from inbox_cleaner.imap_client import ImapSession
+
+
+class FakeConnection:
+    def __init__(self, data: list[object]) -> None:
+        self.data = data
+
+    def uid(self, *args: object) -> tuple[str, list[object]]:
+        return "OK", self.data
+
+
+class TestFetchHeaderFields:
+    @pytest.mark.parametrize(
+        "data",
+        [
+            # UID before the literal
+            [
+                (b"1 (UID 345 BODY[HEADER.FIELDS (MESSAGE-ID)] {20}", b"Message-ID: <a@x>\r\n"),
+                b")",
+                (b"2 (UID 346 BODY[HEADER.FIELDS (MESSAGE-ID)] {20}", b"Message-ID: <b@x>\r\n"),
+                b")",
+            ],
+            # UID after the literal
+            [
+                (b"1 (BODY[HEADER.FIELDS (MESSAGE-ID)] {20}", b"Message-ID: <a@x>\r\n"),
+                b" UID 345)",
+                (b"2 (BODY[HEADER.FIELDS (MESSAGE-ID)] {20}", b"Message-ID: <b@x>\r\n"),
+                b" UID 346)",
+            ],
+        ],
+    )
+    def test_uid_on_either_side_of_literal(self, data: list[object]) -> None:
+        session = ImapSession("imap.example", 993, "user", "pw")
+        session.conn = FakeConnection(data)  # type: ignore[assignment]
+        assert session.fetch_header_fields([345, 346], ("MESSAGE-ID",)) == {
+            345: b"Message-ID: <a@x>\r\n",
+            346: b"Message-ID: <b@x>\r\n",
+        }
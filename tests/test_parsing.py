@@ -0,0 +1,65 @@
+"""Tests for single-pass message parsing and the parser process pool."""
+
+from email.message import EmailMessage
+
+import pytest
+
+from inbox_cleaner.campaigns import simhash
+from inbox_cleaner.parsing import ParsePool, extract_text, parse_message
+from inbox_cleaner.recovery import message_identity
+
+BODY = (
+    "Our autumn collection has arrived with new jackets, boots and scarves for the "
+    "whole family. Free shipping on every order this weekend only."
+)
+
+
+def _raw(n: int) -> bytes:
+    msg = EmailMessage()
+    msg["From"] = f"=?utf-8?q?Caf=C3=A9_{n}?= <news@shop.example>"
+    msg["Subject"] = f"=?utf-8?b?U29sZGVz?= {n}"
+    msg["Message-ID"] = f"<{n}@shop.example>"
+    msg.set_content(f"{BODY} Order {n}.")
+    msg.add_attachment(b"\x00" * 2048, maintype="application", subtype="pdf", filename="invoice.pdf")
+    return msg.as_bytes()
+
+
+class TestParseMessage:
+    def test_record_fields(self) -> None:
+        raw = _raw(1)
+        parsed = parse_message(raw, max_chars=40)
+        assert parsed.subject == "Soldes 1"
+        assert parsed.from_addr == "Café 1 <news@shop.example>"
+        assert parsed.domain == "shop.example"
+        assert parsed.text == extract_text(raw, 40)
+        assert parsed.body_chars > len(parsed.text) == 40
+        assert parsed.raw_size == len(raw)
+        assert (parsed.message_id, parsed.fingerprint) == message_identity(raw)
+
+    def test_simhash_ignores_llm_truncation(self) -> None:
+        raw = _raw(1)
+        assert parse_message(raw, max_chars=10).simhash == simhash(extract_text(raw, 20000))
+
+
+class TestParsePool:
+    def test_pool_matches_in_process(self) -> None:
+        raws = {uid: _raw(uid) for uid in range(1, 7)}
+        with ParsePool(0, 1000) as serial, ParsePool(2, 1000) as pool:
+            failed: list[int] = []
+            assert pool.parse(raws, failed) == serial.parse(raws, failed)
+            assert failed == []
+
+    def test_parse_errors_fail_only_that_uid(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        import inbox_cleaner.parsing as parsing
+
+        real = parsing.parse_message
+
+        def flaky(raw: bytes, max_chars: int):  # type: ignore[no-untyped-def]
+            if b"<2@shop.example>" in raw:
+                raise ValueError("bad MIME")
+            return real(raw, max_chars)
+
+        monkeypatch.setattr(parsing, "parse_message", flaky)
+        failed: list[int] = []
+        parsed = ParsePool(0, 1000).parse({1: _raw(1), 2: _raw(2)}, failed)
+        assert list(parsed) == [1] and failed == [2]
@@ -0,0 +1,61 @@
+"""Tests for the --profile run profiler."""
+
+import pstats
+import time
+import tracemalloc
+from pathlib import Path
+
+from inbox_cleaner import profiling
+from inbox_cleaner.parsing import parse_message
+from inbox_cleaner.profiling import Profiler
+
+
+def _busy(seconds: float) -> list[bytes]:
+    kept = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        kept.append(bytes(1024))
+    return kept
+
+
+class TestProfiler:
+    def test_writes_profiles_snapshots_and_report(self, tmp_path: Path) -> None:
+        raw = b"From: a@shop.example\r\nSubject: Hi\r\nContent-Type: text/plain\r\n\r\nHello"
+        with Profiler(tmp_path, snapshot_every=2):
+            for _ in range(5):
+                with profiling.stage("parse"):
+                    parse_message(raw, 100)
+                with profiling.stage("db"):
+                    _busy(0.02)
+                profiling.tick()
+
+        assert pstats.Stats(str(tmp_path / "profile.pstats")).total_calls > 0
+        collapsed = (tmp_path / "profile.collapsed").read_text().splitlines()
+        assert collapsed and all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed)
+        assert any("_busy (test_profiling.py" in line for line in collapsed)
+        assert sorted(p.name for p in tmp_path.glob("snapshot-*")) == [
+            "snapshot-000002.tracemalloc", "snapshot-000004.tracemalloc", "snapshot-000005.tracemalloc",
+        ]
+        tracemalloc.Snapshot.load(str(tmp_path / "snapshot-000005.tracemalloc"))
+
+        report = (tmp_path / "report.txt").read_text()
+        assert report.startswith("Profiled 5 message(s)")
+        for name in ("parse", "extract", "db"):
+            assert f"\n{name} " in report
+        assert "Largest growth from message 2 to 5" in report
+
+    def test_nested_stage_peak_counts_towards_outer(self, tmp_path: Path) -> None:
+        with Profiler(tmp_path, snapshot_every=0) as profiler:
+            with profiling.stage("outer"):
+                with profiling.stage("inner"):
+                    blob = bytes(4 * 1024 * 1024)
+                    del blob
+        assert profiler.stages["inner"].traced_peak >= 4 * 1024 * 1024
+        assert profiler.stages["outer"].traced_peak >= profiler.stages["inner"].traced_peak
+        assert not tracemalloc.is_tracing()
+
+    def test_hooks_are_no_ops_without_profiler(self) -> None:
+        assert profiling._active is None
+        with profiling.stage("parse"):
+            profiling.tick()
+        assert not tracemalloc.is_tracing()
@@ -0,0 +1,83 @@
+"""Tests for UID-range checkpointing."""
+
+from inbox_cleaner.db import SeenStore
+from inbox_cleaner.progress import Checkpoint, UidRangeSet
+
+
+class TestUidRangeSet:
+    def test_merges_adjacent_and_overlapping(self) -> None:
+        ranges = UidRangeSet([(1, 3), (7, 9)])
+        ranges.add(4)
+        ranges.add(5, 8)
+        assert ranges.ranges() == [(1, 9)]
+
+    def test_out_of_order_completion(self) -> None:
+        ranges = UidRangeSet()
+        for uid in (3, 1, 5, 2):
+            ranges.add(uid)
+        assert ranges.ranges() == [(1, 3), (5, 5)]
+        assert ranges.watermark() == 3
+
+    def test_watermark_zero_until_uid_one_done(self) -> None:
+        assert UidRangeSet([(2, 10)]).watermark() == 0
+
+    def test_missing_returns_gaps(self) -> None:
+        ranges = UidRangeSet([(1, 4), (6, 8)])
+        assert 5 not in ranges and 6 in ranges
+        assert ranges.missing([3, 5, 7, 9]) == [5, 9]
+
+
+class TestCheckpoint:
+    def test_failed_uid_is_retried_alone(self, store: SeenStore) -> None:
+        cp = Checkpoint(store, "1")
+        assert cp.begin([2, 5, 6, 9], above=0) == [2, 5, 6, 9]
+        for uid in (9, 2, 6):  # 5 fails
+            cp.complete(uid)
+        cp.flush()
+        # Gaps between search results are covered; only UID 5 stays open
+        assert store.get_uid_ranges("1") == [(1, 2), (6, 9)]
+        assert store.get_last_uid("1") == 2
+
+        cp = Checkpoint(store, "1")
+        assert cp.begin([5, 6, 9, 10], above=cp.watermark) == [5, 10]
+
+    def test_vanished_gap_is_closed(self, store: SeenStore) -> None:
+        store.set_uid_ranges("1", [(1, 4), (6, 9)])
+        cp = Checkpoint(store, "1")
+        # UID 5 was moved away by hand; the next search no longer returns it
+        assert cp.begin([7, 9, 12], above=cp.watermark) == [12]
+        cp.complete(12)
+        cp.flush()
+        assert store.get_uid_ranges("1") == [(1, 12)]
+
+    def test_batches_writes(self, store: SeenStore) -> None:
+        cp = Checkpoint(store, "1", batch_size=2)
+        cp.begin([1, 2, 3], above=0)
+        cp.complete(1)
+        assert store.get_uid_ranges("1") == []
+        cp.complete(2)
+        assert store.get_uid_ranges("1") == [(1, 2)]
+
+    def test_date_window_keeps_range_floor(self, store: SeenStore) -> None:
+        cp = Checkpoint(store, "1")
+        cp.begin([10, 20, 30], above=0)
+        # A backfill window returns the same UIDs without the range context
+        assert cp.begin([20, 30]) == [20, 30]
+        for uid in (30, 20, 10):
+            cp.complete(uid)
+        cp.flush()
+        assert store.get_uid_ranges("1") == [(1, 30)]
+
+    def test_flush_writes_only_changed_ranges(self, store: SeenStore) -> None:
+        cp = Checkpoint(store, "1", batch_size=1)
+        cp.begin([2, 4, 6, 8, 9])
+        for uid in (2, 4, 6, 8):
+            cp.complete(uid)
+        # Mark a row so a rewrite would show
+        store.conn.execute("UPDATE uid_ranges SET end_uid = 3 WHERE start_uid = 2")
+        cp.complete(9)
+        assert store.get_uid_ranges("1") == [(2, 3), (4, 4), (6, 6), (8, 9)]
+
+    def test_legacy_last_uid_seeds_ranges(self, store: SeenStore) -> None:
+        store.set_last_uid("1", 40)
+        assert Checkpoint(store, "1").watermark == 40
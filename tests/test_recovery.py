@@ -0,0 +1,127 @@
+"""Tests for UIDVALIDITY-change recovery."""
+
+import sqlite3
+from collections.abc import Callable
+from pathlib import Path
+
+from inbox_cleaner.db import SeenStore
+from inbox_cleaner.progress import Checkpoint
+from inbox_cleaner.recovery import message_identity, recover_uidvalidity_change
+
+
+def _headers(message_id: str | None, subject: str) -> bytes:
+    lines = [
+        "From: Shop <news@shop.example>",
+        "Date: Mon, 06 Oct 2025 10:00:00 +0000",
+        f"Subject: {subject}",
+    ]
+    if message_id:
+        lines.insert(0, f"Message-ID: {message_id}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+class FakeImap:
+    def __init__(self, messages: dict[int, bytes]) -> None:
+        self.messages = messages
+
+    def search_since_uid(self, last_uid: int) -> list[int]:
+        return sorted(u for u in self.messages if u > last_uid)
+
+    def fetch_header_fields(self, uids: list[int], fields: tuple[str, ...]) -> dict[int, bytes]:
+        return {u: self.messages[u] for u in uids}
+
+
+class TestMessageIdentity:
+    def test_folding_does_not_change_fingerprint(self) -> None:
+        folded = _headers(None, "Big\r\n sale")
+        assert message_identity(folded)[1] == message_identity(_headers(None, "Big sale"))[1]
+
+    def test_message_id_extracted(self) -> None:
+        assert message_identity(_headers("<a@b>", "x"))[0] == "<a@b>"
+
+
+class TestRecovery:
+    def test_only_new_mail_is_left(self, store: SeenStore, record: Callable[..., None]) -> None:
+        old_a, old_b = _headers("<a@shop>", "A"), _headers(None, "No id")
+        record(10, "news@shop.example", "promotional", uidvalidity="100", raw=old_a)
+        record(11, "news@shop.example", "skip", uidvalidity="100", raw=old_b)
+        store.set_uid_ranges("100", [(1, 11)])
+
+        imap = FakeImap({1: old_a, 2: old_b, 3: _headers("<new@shop>", "New")})
+        assert store.stale_uidvalidities("200", "INBOX") == ["100"]
+        checkpoint = Checkpoint(store, "200")
+        assert recover_uidvalidity_change(imap, store, checkpoint, ["100"]) == 2
+
+        watermark = checkpoint.watermark
+        assert checkpoint.begin(imap.search_since_uid(watermark), above=watermark) == [3]
+        rows = store.conn.execute(
+            "SELECT uidvalidity, uid, final_action FROM email_actions ORDER BY uid"
+        ).fetchall()
+        assert rows == [("200", 1, "promotional"), ("200", 2, "skip")]
+        assert store.stale_uidvalidities("200", "INBOX") == []
+
+    def test_other_mailbox_progress_is_kept(self, store: SeenStore) -> None:
+        store.set_uid_ranges("100", [(1, 50)])
+        store.set_mailbox("100", "Archive")
+        store.set_uid_ranges("300", [(1, 5)])
+        store.set_mailbox("300", "INBOX")
+        assert store.stale_uidvalidities("200", "INBOX") == ["300"]
+
+    def test_legacy_progress_kept_unless_its_mail_matched(self, store: SeenStore, record: Callable[..., None]) -> None:
+        raw = _headers("<a@shop>", "A")
+        record(10, "news@shop.example", "skip", uidvalidity="100", raw=raw)
+        store.set_uid_ranges("100", [(1, 10)])
+        store.set_uid_ranges("700", [(1, 40)])  # another mailbox, from before mailboxes were recorded
+        stale = store.stale_uidvalidities("200", "INBOX")
+        assert stale == ["100", "700"]
+
+        recover_uidvalidity_change(FakeImap({1: raw}), store, Checkpoint(store, "200"), stale)
+        assert store.get_uid_ranges("100") == []
+        assert store.get_uid_ranges("700") == [(1, 40)]
+
+    def test_compacted_kept_mail_is_still_recognised(self, store: SeenStore, record: Callable[..., None]) -> None:
+        kept, moved = _headers("<kept@shop>", "Kept"), _headers("<moved@shop>", "Moved")
+        record(10, "news@shop.example", "skip", uidvalidity="100", raw=kept)
+        record(11, "news@shop.example", "promotional", uidvalidity="100", raw=moved)
+        store.set_uid_ranges("100", [(1, 11)])
+        store.compact("9999", lambda addr: "shop.example")
+        assert store.conn.execute("SELECT COUNT(*) FROM email_actions").fetchone()[0] == 0
+        assert store.conn.execute("SELECT message_id FROM seen_identities").fetchall() == [("<kept@shop>",)]
+
+        checkpoint = Checkpoint(store, "200")
+        imap = FakeImap({1: kept, 2: _headers("<new@shop>", "New")})
+        assert recover_uidvalidity_change(imap, store, checkpoint, ["100"]) == 1
+        assert checkpoint.begin(imap.search_since_uid(0), above=0) == [2]
+        # Carried over, ready for the next reset
+        assert store.conn.execute("SELECT uidvalidity FROM seen_identities").fetchall() == [("200",)]
+
+    def test_archive_rows_are_not_claimed(self, store: SeenStore, record: Callable[..., None]) -> None:
+        raw = _headers("<a@shop>", "A")
+        record(10, "news@shop.example", "skip", uidvalidity="100", raw=raw)
+        store.set_uid_ranges("100", [(1, 10)])
+        # The same message ingested later from an export
+        record(4096, "news@shop.example", "promotional", uidvalidity="archive:/exports/Inbox.mbox", raw=raw)
+
+        checkpoint = Checkpoint(store, "200")
+        assert recover_uidvalidity_change(FakeImap({1: raw}), store, checkpoint, ["100"]) == 1
+        rows = store.conn.execute("SELECT uidvalidity, uid, final_action FROM email_actions ORDER BY id").fetchall()
+        assert rows == [("200", 1, "skip"), ("archive:/exports/Inbox.mbox", 4096, "promotional")]
+
+
+class TestMigration:
+    def test_adds_identity_columns_to_old_db(self, tmp_path: Path) -> None:
+        path = str(tmp_path / "old.sqlite")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE email_actions (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "uidvalidity TEXT NOT NULL, uid INTEGER NOT NULL, processed_at TEXT NOT NULL, "
+            "from_addr TEXT, subject TEXT, rspamd_score REAL, llm_label TEXT, "
+            "recommended_action TEXT NOT NULL, final_action TEXT NOT NULL, "
+            "mode TEXT NOT NULL, UNIQUE(uidvalidity, uid))"
+        )
+        conn.commit()
+        conn.close()
+
+        store = SeenStore(path)
+        columns = {row[1] for row in store.conn.execute("PRAGMA table_info(email_actions)")}
+        assert {"message_id", "fingerprint"} <= columns
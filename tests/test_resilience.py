@@ -0,0 +1,197 @@
+"""Tests for backoff, circuit breakers and the shared call wrapper."""
+
+import imaplib
+
+import pytest
+
+from inbox_cleaner import resilience
+from inbox_cleaner.imap_client import ImapSession
+from inbox_cleaner.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    Backoff,
+    CircuitBreaker,
+    CircuitOpenError,
+    call,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _failing() -> str:
+    raise ConnectionError("down")
+
+
+@pytest.fixture()
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture()
+def breaker(clock: FakeClock) -> CircuitBreaker:
+    return CircuitBreaker("dep", failure_threshold=2, reset_timeout=10.0, clock=clock)
+
+
+class TestBackoff:
+    def test_delay_is_capped_and_jittered(self) -> None:
+        backoff = Backoff(base=1.0, cap=3.0)
+        delays = [backoff.delay(5) for _ in range(50)]
+        assert all(0.0 <= d <= 3.0 for d in delays)
+        assert len(set(delays)) > 1
+
+
+class TestCircuitBreaker:
+    def test_opens_then_fast_fails(self, breaker: CircuitBreaker) -> None:
+        sleeps: list[float] = []
+        with pytest.raises(CircuitOpenError):
+            call(breaker, _failing, retry_on=(ConnectionError,), backoff=Backoff(attempts=3), sleep=sleeps.append)
+        assert breaker.state == OPEN
+        assert len(sleeps) == 1  # no sleeping once the circuit has opened
+
+        calls: list[int] = []
+        fallback = call(
+            breaker, lambda: calls.append(1) or "ok", retry_on=(ConnectionError,),
+            fallback=lambda exc: "default", sleep=sleeps.append,
+        )
+        assert fallback == "default"
+        assert calls == []
+        assert breaker.fast_fails == 2 and breaker.fallbacks == 1
+
+    def test_half_open_probe_closes_on_success(self, breaker: CircuitBreaker, clock: FakeClock) -> None:
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now = 11.0
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()  # only one probe at a time
+        breaker.record_success()
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens(self, breaker: CircuitBreaker, clock: FakeClock) -> None:
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now = 11.0
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+
+class TestCall:
+    def test_retries_then_succeeds(self, breaker: CircuitBreaker) -> None:
+        attempts: list[int] = []
+
+        def flaky() -> str:
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ConnectionError("blip")
+            return "ok"
+
+        retried: list[int] = []
+        result = call(
+            breaker, flaky, retry_on=(ConnectionError,),
+            before_retry=lambda attempt, exc: retried.append(attempt), sleep=lambda s: None,
+        )
+        assert result == "ok"
+        assert retried == [0]
+        assert breaker.state == CLOSED
+
+    def test_fatal_errors_are_not_retried(self, breaker: CircuitBreaker) -> None:
+        attempts: list[int] = []
+
+        def broken() -> str:
+            attempts.append(1)
+            raise PermissionError("no key")
+
+        with pytest.raises(PermissionError):
+            call(breaker, broken, retry_on=(Exception,), fatal=(PermissionError,), sleep=lambda s: None)
+        assert attempts == [1]
+
+
+class FakeConnection:
+    """Stands in for imaplib.IMAP4_SSL; `down` makes every command abort."""
+
+    def __init__(self, server: "FakeServer") -> None:
+        self.server = server
+        self.dead = server.down
+
+    def uid(self, *args: object) -> tuple[str, list[bytes]]:
+        if self.dead or self.server.down:
+            self.dead = True
+            raise imaplib.IMAP4.abort("socket error: EOF")
+        return "OK", [b"1 2 3"]
+
+    def select(self, name: str, readonly: bool = False) -> tuple[str, list[bytes]]:
+        return "OK", [b"3"]
+
+    def logout(self) -> None:
+        pass
+
+
+class FakeServer:
+    def __init__(self) -> None:
+        self.down = False
+        self.connects = 0
+
+
+class FakeSession(ImapSession):
+    def __init__(self, server: FakeServer) -> None:
+        super().__init__("imap.example", 993, "user", "pw")
+        self.server = server
+
+    def _connect(self) -> None:
+        if self.server.down:
+            raise OSError("connection refused")
+        self.server.connects += 1
+        self.conn = FakeConnection(self.server)  # type: ignore[assignment]
+
+
+class TestImapRecovery:
+    def test_session_reconnects_for_half_open_probe(
+        self, clock: FakeClock, monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(resilience.time, "sleep", lambda s: None)
+        monkeypatch.setitem(
+            resilience._BREAKERS, "imap",
+            CircuitBreaker("imap", failure_threshold=2, reset_timeout=10.0, clock=clock),
+        )
+        server = FakeServer()
+        with FakeSession(server) as session:
+            server.down = True
+            with pytest.raises(CircuitOpenError):
+                session.search_since_uid(0)
+            assert resilience._BREAKERS["imap"].state == OPEN
+
+            server.down = False
+            clock.now = 11.0
+            assert session.search_since_uid(1) == [2, 3]
+            assert resilience._BREAKERS["imap"].state == CLOSED
+            assert server.connects == 2
+
+
+class TestProbeRelease:
+    @pytest.mark.parametrize(
+        ("error", "fatal"), [(PermissionError("no key"), (PermissionError,)), (KeyError("uid"), ())],
+    )
+    def test_unretried_error_during_probe_releases_it(
+        self, breaker: CircuitBreaker, clock: FakeClock, error: Exception, fatal: tuple[type[Exception], ...],
+    ) -> None:
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now = 11.0
+
+        def raises() -> str:
+            raise error
+
+        with pytest.raises(type(error)):
+            call(breaker, raises, retry_on=(ConnectionError,), fatal=fatal)
+        assert breaker.state == HALF_OPEN
+        assert call(breaker, lambda: "ok", retry_on=(ConnectionError,)) == "ok"
+        assert breaker.state == CLOSED
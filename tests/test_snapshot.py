@@ -0,0 +1,95 @@
+"""Tests for state DB compaction, snapshots and delta restore."""
+
+import argparse
+import gzip
+import sqlite3
+from collections.abc import Callable
+from pathlib import Path
+
+from inbox_cleaner import cli
+from inbox_cleaner.cli import extract_domain
+from inbox_cleaner.config import Settings
+from inbox_cleaner.db import SeenStore
+from inbox_cleaner.snapshot import restore, write_delta, write_snapshot
+
+
+class TestCompact:
+    def test_rolls_old_rows_into_domain_stats(self, store: SeenStore, record: Callable[..., None]) -> None:
+        record(1, "a@example.com", "trash")
+        record(2, "b@example.com", "trash")
+        record(3, "c@example.com", "skip")
+        before = store.get_domain_history("example.com")
+
+        removed = store.compact("9999", extract_domain)
+
+        assert removed == 3
+        assert store.conn.execute("SELECT COUNT(*) FROM email_actions").fetchone()[0] == 0
+        assert store.get_domain_history("example.com") == before
+
+    def test_history_merges_live_and_rolled_up(self, store: SeenStore, record: Callable[..., None]) -> None:
+        record(1, "a@example.com", "trash")
+        store.compact("9999", extract_domain)
+        record(2, "b@example.com", "trash")
+        assert store.get_domain_history("example.com") == {"trash": 2}
+
+    def test_keeps_rows_inside_retention(self, store: SeenStore, record: Callable[..., None]) -> None:
+        record(1, "a@example.com", "trash")
+        assert store.compact("0000", extract_domain) == 0
+        assert store.get_domain_history("example.com") == {"trash": 1}
+
+    def test_prunes_learn_records_with_their_rows(self, store: SeenStore) -> None:
+        store.mark_learned([("<old@example.com>", "spam")])
+        assert store.compact("0000", extract_domain) == 0
+        assert store.learned_messages() == {"<old@example.com>": "spam"}
+        store.compact("9999", extract_domain)
+        assert store.learned_messages() == {}
+
+
+class TestRunCompact:
+    def test_zero_retention_days_is_honoured(self, tmp_path: Path, record: Callable[..., None]) -> None:
+        settings = Settings(sqlite_path=str(tmp_path / "state.sqlite"))
+        record(1, "a@example.com", "trash")
+        args = argparse.Namespace(delta=False, output=None, retention_days=0)
+        cli.run_compact(settings, args)
+        store = SeenStore(settings.sqlite_path)
+        assert store.conn.execute("SELECT COUNT(*) FROM email_actions").fetchone()[0] == 0
+        assert store.get_domain_history("example.com") == {"trash": 1}
+
+
+class TestSnapshotRestore:
+    def test_snapshot_round_trip(self, store: SeenStore, tmp_path: Path, record: Callable[..., None]) -> None:
+        record(1, "a@example.com", "promotional")
+        store.set_last_uid("1", 1)
+        snap = str(tmp_path / "out" / "state.sqlite.gz")
+        write_snapshot(store, snap)
+
+        # The snapshot is a gzip of a valid SQLite database
+        with gzip.open(snap, "rb") as f:
+            assert f.read(16) == b"SQLite format 3\x00"
+
+        dest = str(tmp_path / "restored.sqlite")
+        restore(snap, dest)
+        restored = SeenStore(dest)
+        assert restored.get_last_uid("1") == 1
+        assert restored.get_domain_history("example.com") == {"promotional": 1}
+
+    def test_delta_only_contains_new_rows(self, store: SeenStore, tmp_path: Path, record: Callable[..., None]) -> None:
+        record(1, "a@example.com", "skip")
+        snap = str(tmp_path / "state.sqlite.gz")
+        write_snapshot(store, snap)
+
+        record(2, "b@example.com", "trash")
+        store.mark_learned([("<b@example.com>", "spam")])
+        store.set_last_uid("1", 2)
+        delta = str(tmp_path / "state.delta.json.gz")
+        assert write_delta(store, delta) == 1
+
+        dest = str(tmp_path / "restored.sqlite")
+        restore(snap, dest, [delta])
+        conn = sqlite3.connect(dest)
+        uids = [r[0] for r in conn.execute("SELECT uid FROM email_actions ORDER BY uid")]
+        assert uids == [1, 2]
+        assert conn.execute("SELECT last_uid FROM progress").fetchone()[0] == 2
+        assert conn.execute("SELECT message_key, verdict FROM rspamd_learned").fetchall() == [
+            ("<b@example.com>", "spam"),
+        ]
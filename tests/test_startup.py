@@ -0,0 +1,65 @@
+"""Import-time benchmark: importing the CLI must not pull in heavy dependencies."""
+
+import subprocess
+import sys
+
+import pytest
+
+from inbox_cleaner.config import Settings
+
+# Top-level packages that must only be imported once a message needs them
+HEAVY_MODULES = ("llm", "requests", "dotenv", "openai", "pydantic")
+
+# Generous ceiling for `import inbox_cleaner.cli` (microseconds); the real
+# figure is a few milliseconds; the heavy stack costs several hundred.
+IMPORT_BUDGET_US = 150_000
+
+
+def _importtime(module: str) -> dict[str, int]:
+    """Run `python -X importtime` and return cumulative µs per top-level import."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = (part.strip() for part in line.split(":", 1)[1].split("|"))
+        if cum.isdigit():
+            cumulative[name] = int(cum)
+    return cumulative
+
+
+@pytest.fixture(scope="module")
+def timings() -> dict[str, int]:
+    return _importtime("inbox_cleaner.cli")
+
+
+class TestImportTime:
+    def test_heavy_modules_not_imported(self, timings: dict[str, int]) -> None:
+        loaded = sorted(name for name in timings if name.split(".")[0] in HEAVY_MODULES)
+        assert loaded == []
+
+    def test_cli_import_within_budget(self, timings: dict[str, int]) -> None:
+        assert timings["inbox_cleaner.cli"] < IMPORT_BUDGET_US
+
+
+class TestSettings:
+    def test_defaults(self) -> None:
+        settings = Settings.from_env({})
+        assert settings.mailbox == "INBOX"
+        assert settings.interactive is True
+        assert settings.rspamd_trash_score == pytest.approx(7.0)
+
+    def test_parses_types(self) -> None:
+        settings = Settings.from_env({
+            "IMAP_PORT": "143",
+            "INTERACTIVE": "false",
+            "HISTORY_WEIGHT": "0.5",
+        })
+        assert settings.imap_port == 143
+        assert settings.interactive is False
+        assert settings.history_weight == pytest.approx(0.5)